@@ -0,0 +1,83 @@
+import asyncio
+from typing import AsyncIterator, Dict, Set
+
+from app.serialization import encode_json
+
+# Bericht voor clients die te ver achter liepen: haal de volledige state opnieuw op
+RESYNC_MESSAGE = b"event: resync\ndata: {}\n\n"
+KEEPALIVE_MESSAGE = b": keepalive\n\n"
+
+def encode_event(event: str, data: Dict) -> bytes:
+    """Codeer een server-sent event (text/event-stream formaat)"""
+    return b"event: " + event.encode() + b"\ndata: " + encode_json(data) + b"\n\n"
+
+class EventBroadcaster:
+    """
+    Verdeel server-sent events over alle verbonden dashboards
+
+    Een event wordt één keer geserialiseerd en als dezelfde bytes in de
+    wachtrij van elke client gezet. Elke client heeft een begrensde wachtrij;
+    loopt een client zo ver achter dat de wachtrij vol is, dan wordt de
+    achterstand weggegooid en krijgt de client een resync bericht, zodat een
+    trage client nooit geheugen of de andere clients ophoudt.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        """
+        Args:
+            queue_size: Maximaal aantal berichten in de wachtrij per client
+        """
+        self.queue_size = queue_size
+        self._clients: Set[asyncio.Queue] = set()
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def subscribe(self) -> asyncio.Queue:
+        """Registreer een nieuwe client en geef de wachtrij terug"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """Verwijder een client"""
+        self._clients.discard(queue)
+
+    def publish(self, event: str, data: Dict) -> int:
+        """
+        Stuur een event naar alle clients
+
+        Returns:
+            Aantal clients dat het event ontvangen heeft
+        """
+        if not self._clients:
+            return 0
+
+        message = encode_event(event, data)
+        for queue in self._clients:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Trage client: gooi de achterstand weg en laat de client opnieuw synchroniseren
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_MESSAGE)
+        return len(self._clients)
+
+    async def stream(self, queue: asyncio.Queue, keepalive: float = 15) -> AsyncIterator[bytes]:
+        """
+        Lees berichten uit de wachtrij van een client
+
+        Als er een tijd geen berichten zijn wordt een commentaar regel
+        gestuurd, zodat proxies de verbinding niet sluiten.
+
+        Args:
+            queue: Wachtrij van subscribe()
+            keepalive: Seconden zonder bericht waarna een keepalive volgt
+        """
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield KEEPALIVE_MESSAGE
@@ -1,7 +1,15 @@
+import logging
+import os
+import re
 import yaml
 from pathlib import Path
 from typing import Optional, List, Dict
 
+logger = logging.getLogger(__name__)
+
+# Rollen van een proces: alles in één proces, alleen verzamelen, of alleen de web API uit de opslag
+ROLES = ('all', 'collector', 'web')
+
 class Config:
     def __init__(self, config_path: str = "config/config.yaml"):
         self.config_path = config_path
@@ -28,6 +36,7 @@ class Config:
             'homewizard_kwh_meters': [],
             'pvoutput': {'api_key': '', 'system_id': ''},
             'update_interval': 300,
+            'sample_interval': 10,
             'weather': {
                 'enabled': False,
                 'latitude': None,
@@ -52,7 +61,7 @@ class Config:
                 }]
                 # Verwijder oude config
                 del self.data['homewizard_kwh']
-                print("Config gemigreerd: oude 'homewizard_kwh' naar nieuwe 'homewizard_kwh_meters' formaat")
+                logger.warning("Config gemigreerd: oude 'homewizard_kwh' naar nieuwe 'homewizard_kwh_meters' formaat")
 
         # Zorg dat homewizard_kwh_meters altijd bestaat
         if 'homewizard_kwh_meters' not in self.data:
@@ -93,6 +102,43 @@ class Config:
         """Deprecated: gebruik homewizard_kwh_meters_enabled"""
         return len(self.homewizard_kwh_meters_enabled) > 0
 
+    @property
+    def homewizard_keepalive_per_host(self) -> int:
+        """Aantal keep-alive verbindingen per HomeWizard apparaat in de gedeelde pool"""
+        return self.data.get('homewizard_http', {}).get('keepalive_per_host', 1)
+
+    @property
+    def homewizard_keepalive_expiry(self) -> float:
+        """Seconden dat een ongebruikte verbinding naar een apparaat open blijft"""
+        return self.data.get('homewizard_http', {}).get('keepalive_expiry_seconds', 60.0)
+
+    @property
+    def homewizard_breaker_settings(self) -> Dict:
+        """Instellingen van de circuit breaker per apparaat (argumenten van DeviceCircuitBreaker)"""
+        http = self.data.get('homewizard_http', {})
+        return {
+            'failure_threshold': http.get('failure_threshold', 3),
+            'base_backoff': http.get('backoff_seconds', 30),
+            'max_backoff': http.get('max_backoff_seconds', 600),
+            'probe_timeout': http.get('probe_timeout_seconds', 2.0)
+        }
+
+    @property
+    def homewizard_stream_enabled(self) -> bool:
+        """Gebruik WebSocket push (API v2) voor apparaten met een token"""
+        return self.data.get('homewizard_stream', {}).get('enabled', True)
+
+    @property
+    def homewizard_stream_settings(self) -> Dict:
+        """Instellingen van de WebSocket streams (argumenten van HomeWizardStream)"""
+        stream = self.data.get('homewizard_stream', {})
+        return {
+            'backoff': stream.get('backoff_seconds', 1),
+            'max_backoff': stream.get('max_backoff_seconds', 60),
+            'stale_after': stream.get('stale_seconds', 30),
+            'verify_tls': stream.get('verify_tls', False)
+        }
+
     @property
     def pvoutput_api_key(self) -> Optional[str]:
         return self.data.get('pvoutput', {}).get('api_key')
@@ -101,10 +147,151 @@ class Config:
     def pvoutput_system_id(self) -> Optional[str]:
         return self.data.get('pvoutput', {}).get('system_id')
 
+    @property
+    def pvoutput_outbox_path(self) -> str:
+        return self.data.get('pvoutput', {}).get('outbox_path', 'data/pvoutput_outbox.db')
+
+    @property
+    def pvoutput_batch_size(self) -> int:
+        """Maximaal aantal statussen per batch request (30, of 100 met donation)"""
+        return self.data.get('pvoutput', {}).get('batch_size', 30)
+
+    @property
+    def pvoutput_requests_per_hour(self) -> int:
+        """Request budget per uur (60, of 300 met donation); PVOutput headers zijn leidend"""
+        return self.data.get('pvoutput', {}).get('requests_per_hour', 60)
+
     @property
     def update_interval(self) -> int:
         return self.data.get('update_interval', 300)
 
+    @property
+    def sample_interval(self) -> float:
+        """Interval in seconden waarmee apparaten worden uitgelezen voor dashboard en historie"""
+        return self.data.get('sample_interval', 10)
+
+    @property
+    def sampling_enabled(self) -> bool:
+        """Sampling loop draait alleen als deze vaker uitleest dan er wordt geüpload"""
+        return 0 < self.sample_interval < self.update_interval
+
+    @property
+    def cycle_deadline(self) -> float:
+        """Maximale duur van een verzamelcyclus in seconden, trage apparaten worden overgeslagen"""
+        return self.data.get('cycle_deadline', 15)
+
+    @property
+    def schedule_align(self) -> bool:
+        """Uploads en samples op vaste klokmomenten (:00, :05, ...) in plaats van vanaf de start"""
+        return self.data.get('schedule', {}).get('align', True)
+
+    @property
+    def schedule_upload_offset(self) -> float:
+        """Seconden na de klokgrens waarop de upload plaatsvindt"""
+        return self.data.get('schedule', {}).get('upload_offset_seconds', 0)
+
+    @property
+    def schedule_misfire_policy(self) -> str:
+        """Wat te doen met gemiste uploads: 'skip' of 'catch_up'"""
+        return self.data.get('schedule', {}).get('misfire_policy', 'skip')
+
+    @property
+    def schedule_misfire_grace(self) -> Optional[float]:
+        """Seconden dat een upload te laat mag zijn en toch nog uitgevoerd wordt (skip policy)"""
+        return self.data.get('schedule', {}).get('misfire_grace_seconds')
+
+    @property
+    def update_now_min_interval(self) -> float:
+        """Seconden na een cyclus waarin 'Nu updaten' het vorige resultaat teruggeeft, 0 = altijd uitvoeren"""
+        return self.data.get('update_now_min_interval', 0)
+
+    @property
+    def storage_enabled(self) -> bool:
+        return self.data.get('storage', {}).get('enabled', True)
+
+    @property
+    def storage_path(self) -> str:
+        return self.data.get('storage', {}).get('path', 'data/history.db')
+
+    @property
+    def storage_retention_days(self) -> int:
+        return self.data.get('storage', {}).get('retention_days', 90)
+
+    @property
+    def storage_flush_interval(self) -> float:
+        """Interval in seconden waarmee gebufferde samples naar disk worden geschreven"""
+        return self.data.get('storage', {}).get('flush_interval_seconds', 60)
+
+    @property
+    def storage_sync_interval(self) -> float:
+        """Seconden tussen het publiceren (collector) en inlezen (web workers) van de actuele state"""
+        return self.data.get('storage', {}).get('sync_interval_seconds', 1)
+
+    @property
+    def snapshot_enabled(self) -> bool:
+        return self.data.get('snapshot', {}).get('enabled', True)
+
+    @property
+    def snapshot_path(self) -> str:
+        return self.data.get('snapshot', {}).get('path', 'data/snapshot.bin')
+
+    @property
+    def snapshot_interval(self) -> float:
+        """Interval in seconden waarmee de DataManager state naar disk wordt geschreven"""
+        return self.data.get('snapshot', {}).get('interval_seconds', 60)
+
+    @property
+    def diagnostics_trace_count(self) -> int:
+        """Aantal cycli waarvan de timing bewaard wordt voor /api/diagnostics"""
+        return self.data.get('diagnostics', {}).get('trace_count', 50)
+
+    @property
+    def diagnostics_profiling_enabled(self) -> bool:
+        """Sta het profilen van een cyclus via /api/diagnostics/profile toe"""
+        return self.data.get('diagnostics', {}).get('profiling_enabled', False)
+
+    @property
+    def diagnostics_profile_interval(self) -> float:
+        """Interval in milliseconden tussen samples van de profiler"""
+        return self.data.get('diagnostics', {}).get('profile_interval_ms', 5)
+
+    @property
+    def logging_level(self) -> str:
+        return self.data.get('logging', {}).get('level', 'INFO')
+
+    @property
+    def logging_json(self) -> bool:
+        """Log als JSON regels (voor log shippers) in plaats van tekst"""
+        return self.data.get('logging', {}).get('json', False)
+
+    @property
+    def logging_dedupe_window(self) -> float:
+        """Seconden waarbinnen herhaalde identieke fouten per apparaat maar één keer gelogd worden"""
+        return self.data.get('logging', {}).get('dedupe_window_seconds', 300)
+
+    @property
+    def logging_levels(self) -> Dict[str, str]:
+        """Levels per module, bijvoorbeeld {'app.homewizard': 'DEBUG'}"""
+        return self.data.get('logging', {}).get('levels', {})
+
+    @property
+    def app_role(self) -> str:
+        """
+        Rol van dit proces: 'all', 'collector' of 'web'
+
+        De environment variabele APP_ROLE gaat voor de 'role' uit de config,
+        zodat collector en web workers dezelfde config kunnen gebruiken.
+        """
+        role = (os.environ.get('APP_ROLE') or self.data.get('role') or 'all').lower()
+        if role not in ROLES:
+            raise ValueError(f"Onbekende rol '{role}', kies uit {ROLES}")
+        return role
+
+    @property
+    def webserver_workers(self) -> int:
+        """Aantal web worker processen, alleen met APP_ROLE=web"""
+        return self.data.get('webserver', {}).get('workers', 1)
+
     @property
     def webserver_port(self) -> int:
         return self.data.get('webserver', {}).get('port', 8080)
@@ -132,3 +319,119 @@ class Config:
     @property
     def weather_cache_duration_minutes(self) -> int:
         return self.data.get('weather', {}).get('cache_duration_minutes', 15)
+
+    @property
+    def schedule_stagger_seconds(self) -> Optional[float]:
+        """Venster waarover de uploads van meerdere sites gespreid worden (default het interval, max 60)"""
+        return self.data.get('schedule', {}).get('stagger_seconds')
+
+    @property
+    def sites(self) -> List['SiteConfig']:
+        """
+        Configuratie per site (installatie)
+
+        Zonder 'sites' sectie is de hele configuratie één site 'default'.
+        """
+        entries = self.data.get('sites') or []
+        if not entries:
+            return [SiteConfig(self)]
+
+        sites = [SiteConfig(self, entry) for entry in entries]
+        ids = [site.id for site in sites]
+        duplicates = sorted({site_id for site_id in ids if ids.count(site_id) > 1})
+        if duplicates:
+            raise ValueError(f"Site id's moeten uniek zijn, dubbel: {', '.join(duplicates)}")
+
+        # Sites met hetzelfde PVOutput systeem zouden elkaars statussen overschrijven
+        system_ids = [str(site.pvoutput_system_id) for site in sites if site.pvoutput_system_id]
+        duplicates = sorted({system_id for system_id in system_ids if system_ids.count(system_id) > 1})
+        if duplicates:
+            raise ValueError(f"PVOutput system_id moet per site uniek zijn, dubbel: {', '.join(duplicates)}")
+        return sites
+
+class SiteConfig(Config):
+    """
+    Configuratie van één site binnen een (multi-site) configuratie
+
+    Een site erft de instellingen van het hoofdniveau (pvoutput, weather,
+    schedule, storage enz.) en overschrijft die per sectie met de eigen
+    waarden. Apparaten worden niet geërfd: elke site heeft een eigen P1
+    meter en kWh meters. Van pvoutput wordt alleen de API key geërfd, het
+    system_id moet elke site zelf opgeven. Opslag, snapshot en outbox krijgen per site een
+    eigen pad onder data/sites/<id>/, tenzij expliciet ingesteld.
+    """
+
+    # Secties die per site zijn en nooit van het hoofdniveau overgenomen worden
+    SITE_ONLY = ('sites', 'homewizard_p1', 'homewizard_kwh_meters', 'homewizard_kwh')
+    # Instellingen binnen een geërfde sectie die ook per site zijn
+    SITE_ONLY_KEYS = {'pvoutput': ('system_id',)}
+
+    def __init__(self, root: Config, entry: Optional[Dict] = None):
+        self.root = root
+        self.entry = entry  # None: de hele configuratie is één site
+        self.config_path = root.config_path
+        self._merged: Optional[dict] = None
+        if entry is None:
+            self.id = 'default'
+            self.name = ''
+        else:
+            self.name = str(entry.get('name') or entry.get('id') or '')
+            self.id = _slug(str(entry.get('id') or self.name))
+            if not self.id:
+                raise ValueError("Elke site heeft een id of name nodig")
+            if 'homewizard_kwh_meters' not in entry:
+                entry['homewizard_kwh_meters'] = []
+            if self.pvoutput_api_key and not self.pvoutput_system_id:
+                raise ValueError(f"Site '{self.id}' heeft een eigen pvoutput.system_id nodig")
+
+    @property
+    def data(self) -> dict:
+        if self.entry is None:
+            return self.root.data
+        if self._merged is not None:
+            return self._merged
+        merged = {key: value for key, value in self.root.data.items() if key not in self.SITE_ONLY}
+        for section, keys in self.SITE_ONLY_KEYS.items():
+            if isinstance(merged.get(section), dict):
+                merged[section] = {key: value for key, value in merged[section].items() if key not in keys}
+        for key, value in self.entry.items():
+            if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = {**merged[key], **value}
+            else:
+                merged[key] = value
+        self._merged = merged
+        return merged
+
+    @property
+    def is_default(self) -> bool:
+        return self.entry is None
+
+    def set(self, key: str, value):
+        """Wijzig een instelling van deze site (opslaan met save())"""
+        target = self.root.data if self.entry is None else self.entry
+        target[key] = value
+        self._merged = None
+
+    def save(self):
+        self.root.save()
+
+    def _site_path(self, section: str, key: str, filename: str, default: str) -> str:
+        if self.entry is None:
+            return default
+        return self.entry.get(section, {}).get(key, f"data/sites/{self.id}/{filename}")
+
+    @property
+    def storage_path(self) -> str:
+        return self._site_path('storage', 'path', 'history.db', super().storage_path)
+
+    @property
+    def snapshot_path(self) -> str:
+        return self._site_path('snapshot', 'path', 'snapshot.bin', super().snapshot_path)
+
+    @property
+    def pvoutput_outbox_path(self) -> str:
+        return self._site_path('pvoutput', 'outbox_path', 'pvoutput_outbox.db', super().pvoutput_outbox_path)
+
+def _slug(value: str) -> str:
+    """Maak een id geschikt voor URL's en paden: kleine letters, cijfers en streepjes"""
+    return re.sub(r'[^a-z0-9]+', '-', value.lower()).strip('-')
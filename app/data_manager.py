@@ -1,20 +1,95 @@
-from typing import Dict, List
-from datetime import datetime, timedelta, date
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, date, timedelta
 from collections import deque
 
+from app.downsample import MinMaxDownsampler, choose_resolution, snap_resolution
+from app.ring_buffer import ColumnarRingBuffer
+from app.serialization import encode_json
+from app.storage import SQLiteHistoryStore
+
+logger = logging.getLogger(__name__)
+
+# Kolommen van de historie buffers: vermogens/voltages als float32, meterstanden als float64
+P1_COLUMNS = {
+    'active_power_w': 'f',
+    'active_power_l1_w': 'f',
+    'active_power_l2_w': 'f',
+    'active_power_l3_w': 'f',
+    'total_power_import_kwh': 'd',
+    'total_power_export_kwh': 'd',
+    'voltage_l1_v': 'f',
+    'voltage_l2_v': 'f',
+    'voltage_l3_v': 'f',
+    'voltage_avg_v': 'f',
+}
+
+KWH_COLUMNS = {
+    'active_power_w': 'f',
+    'total_power_export_kwh': 'd',
+    'meter_count': 'f',
+}
+
+class ReadOnlyDict(dict):
+    """
+    Dict die niet gewijzigd kan worden
+
+    Gebruikt voor gecachte resultaten die door meerdere lezers gedeeld
+    worden. Het blijft een dict, zodat JSON encoding gewoon werkt; wie de
+    data wil aanpassen maakt eerst een kopie met dict(...).
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Gecacht resultaat is read-only, maak eerst een kopie met dict()")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+def _freeze(value: Any) -> Any:
+    """Maak een (geneste) dict read-only"""
+    if isinstance(value, dict):
+        return ReadOnlyDict((key, _freeze(item)) for key, item in value.items())
+    return value
+
 class DataManager:
     """Beheer en opslag van historische data"""
 
-    def __init__(self, max_history_hours: int = 24):
+    def __init__(
+        self,
+        max_history_hours: int = 24,
+        sample_interval: float = 60,
+        store: Optional[SQLiteHistoryStore] = None
+    ):
         self.max_history_hours = max_history_hours
-        self.p1_history = deque(maxlen=max_history_hours * 60)  # Per minuut
-        self.kwh_history = deque(maxlen=max_history_hours * 60)
+        self.sample_interval = sample_interval
+        max_samples = max(1, int(max_history_hours * 3600 / sample_interval))  # Per sample interval
+        self.p1_history = ColumnarRingBuffer(max_samples, P1_COLUMNS)
+        self.kwh_history = ColumnarRingBuffer(max_samples, KWH_COLUMNS)
+        self._downsamplers = {
+            'p1': MinMaxDownsampler(self.p1_history),
+            'kwh': MinMaxDownsampler(self.kwh_history)
+        }
         self.weather_history = deque(maxlen=max_history_hours * 4)  # Elke 15 min
+
+        # Persistente opslag (optioneel), samples worden gebufferd en in batches weggeschreven
+        self.store = store
+        self._pending = {'p1': [], 'kwh': []}
+        self._pending_lock = threading.Lock()
         self.latest_p1_data = {}
         self.latest_kwh_data = {}
         self.latest_weather_data = {}
         self.last_update = None
 
+        # Versie teller die bij elke nieuwe meting ophoogt, en listeners die dan aangeroepen worden
+        self.version = 0
+        self._listeners: List[Callable[[str], None]] = []
+
+        # Gecachte afgeleide resultaten, per naam (versie, resultaat)
+        self._memo: Dict[str, Tuple[int, Any]] = {}
+        self._day_end = 0.0  # Epoch van de volgende middernacht
+
         # Voor dagelijkse cumulatieve berekeningen (PVOutput)
         self.daily_start_values = {}
         self.current_date = None
@@ -25,15 +100,17 @@ class DataManager:
         today = date.today()
 
         if self.current_date != today:
-            print(f"Nieuwe dag gedetecteerd, reset dagelijkse waarden. Oude datum: {self.current_date}, Nieuwe: {today}")
+            logger.info("Nieuwe dag gedetecteerd, reset dagelijkse waarden. Oude datum: %s, Nieuwe: %s", self.current_date, today)
             self.current_date = today
             self.daily_start_values = {}
+            self._day_end = datetime.combine(today + timedelta(days=1), datetime.min.time()).timestamp()
+            self.version += 1
 
     def _set_daily_start_value(self, key: str, value: float):
         """Sla dagelijkse start waarde op als deze nog niet bestaat"""
         if key not in self.daily_start_values:
             self.daily_start_values[key] = value
-            print(f"Dagelijkse start waarde ingesteld: {key} = {value}")
+            logger.info("Dagelijkse start waarde ingesteld: %s = %s", key, value)
 
     def add_p1_data(self, data: Dict):
         """Voeg P1 meter data toe aan geschiedenis"""
@@ -46,10 +123,13 @@ class DataManager:
             if 'total_power_export_kwh' in data:
                 self._set_daily_start_value('p1_export_kwh', data['total_power_export_kwh'])
 
-            data['_timestamp'] = datetime.now()
-            self.p1_history.append(data)
+            now = datetime.now()
+            data['_timestamp'] = now
+            self.p1_history.append(now.timestamp(), data)
+            self._queue_for_store('p1', now.timestamp(), data)
             self.latest_p1_data = data
-            self.last_update = datetime.now()
+            self.last_update = now
+            self._notify('p1')
 
     def add_kwh_data(self, data: Dict):
         """Voeg kWh meter data toe aan geschiedenis"""
@@ -60,18 +140,172 @@ class DataManager:
             if 'total_power_export_kwh' in data:
                 self._set_daily_start_value('kwh_export_kwh', data['total_power_export_kwh'])
 
-            data['_timestamp'] = datetime.now()
-            self.kwh_history.append(data)
+            now = datetime.now()
+            data['_timestamp'] = now
+            self.kwh_history.append(now.timestamp(), data)
+            self._queue_for_store('kwh', now.timestamp(), data)
             self.latest_kwh_data = data
-            self.last_update = datetime.now()
+            self.last_update = now
+            self._notify('kwh')
+
+    def _queue_for_store(self, series: str, timestamp: float, data: Dict):
+        """Zet een sample klaar voor de volgende batch write naar de persistente opslag"""
+        if self.store is None:
+            return
+        columns = P1_COLUMNS if series == 'p1' else KWH_COLUMNS
+        values = {column: data[column] for column in columns if data.get(column) is not None}
+        with self._pending_lock:
+            self._pending[series].append((timestamp, values))
+
+    def flush(self) -> int:
+        """
+        Schrijf gebufferde samples in één batch per reeks naar de persistente opslag
+
+        Mag vanuit een worker thread aangeroepen worden.
+
+        Returns:
+            Aantal weggeschreven samples
+        """
+        if self.store is None:
+            return 0
+
+        with self._pending_lock:
+            pending = self._pending
+            self._pending = {'p1': [], 'kwh': []}
+
+        for series, samples in pending.items():
+            self.store.write_batch(series, samples)
+        return sum(len(samples) for samples in pending.values())
 
     def add_weather_data(self, data: Dict):
         """Voeg weather data toe aan geschiedenis"""
         if data:
+            # Weather data komt vaak uit de cache, sla dezelfde meting niet dubbel op
+            if data.get('timestamp') == self.latest_weather_data.get('timestamp'):
+                return
+
             data['_timestamp'] = datetime.now()
             self.weather_history.append(data)
             self.latest_weather_data = data
             self.last_update = datetime.now()
+            self._notify('weather')
+
+    def add_listener(self, callback: Callable[[str], None]):
+        """
+        Registreer een callback die na elke nieuwe meting aangeroepen wordt
+
+        De callback krijgt de naam van de reeks ('p1', 'kwh' of 'weather')
+        en wordt synchroon aangeroepen, dus moet snel zijn.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, series: str):
+        """Hoog de versie op en informeer de listeners"""
+        self.version += 1
+        for callback in self._listeners:
+            try:
+                callback(series)
+            except Exception as e:
+                logger.exception("Fout in data listener: %s", e)
+
+    def to_snapshot(self) -> Dict:
+        """
+        Maak een kopie van de state voor een snapshot op disk
+
+        De kopie deelt geen muteerbare data met de DataManager, zodat deze in
+        een worker thread weggeschreven kan worden.
+        """
+        return {
+            'saved_at': time.time(),
+            'current_date': self.current_date,
+            'daily_start_values': dict(self.daily_start_values),
+            'latest_p1_data': dict(self.latest_p1_data),
+            'latest_kwh_data': dict(self.latest_kwh_data),
+            'latest_weather_data': dict(self.latest_weather_data),
+            'last_update': self.last_update,
+            'p1_history': self.p1_history.to_state(),
+            'kwh_history': self.kwh_history.to_state(),
+            'weather_history': list(self.weather_history)
+        }
+
+    def restore_snapshot(self, state: Dict, max_latest_age: float = 900):
+        """
+        Herstel state uit een snapshot (bij opstarten)
+
+        De historie wordt altijd hersteld. De dagelijkse start waarden alleen
+        als de snapshot van vandaag is; een snapshot van een eerdere dag is
+        verouderd en dan begint de dag bij de eerste nieuwe meting. De laatste
+        meetwaarden worden alleen hersteld als de snapshot recent genoeg is,
+        anders toont het dashboard oude waarden als actueel.
+
+        Args:
+            state: State van to_snapshot()
+            max_latest_age: Maximale leeftijd in seconden voor het herstellen
+                van de laatste meetwaarden
+        """
+        self.p1_history.load_state(state['p1_history'])
+        self.kwh_history.load_state(state['kwh_history'])
+        for downsampler in self._downsamplers.values():
+            downsampler.clear()
+        self.weather_history.clear()
+        self.weather_history.extend(state.get('weather_history', []))
+
+        age = time.time() - state.get('saved_at', 0)
+        if state.get('current_date') == date.today():
+            self.current_date = state['current_date']
+            self.daily_start_values = dict(state.get('daily_start_values', {}))
+            logger.info("Dagelijkse start waarden hersteld uit snapshot: %s", self.daily_start_values)
+        else:
+            logger.info("Snapshot is van %s, dagelijkse waarden starten opnieuw", state.get('current_date'))
+
+        if age <= max_latest_age:
+            self.latest_p1_data = state.get('latest_p1_data', {})
+            self.latest_kwh_data = state.get('latest_kwh_data', {})
+            self.latest_weather_data = state.get('latest_weather_data', {})
+            self.last_update = state.get('last_update')
+
+        self.version += 1
+
+    def to_live_state(self) -> Dict:
+        """
+        Compacte state zonder de ring buffers, voor web workers (APP_ROLE=web)
+
+        De samples zelf lezen de workers uit de persistente opslag.
+        """
+        return {
+            'current_date': self.current_date,
+            'daily_start_values': dict(self.daily_start_values),
+            'latest_p1_data': dict(self.latest_p1_data),
+            'latest_kwh_data': dict(self.latest_kwh_data),
+            'latest_weather_data': dict(self.latest_weather_data),
+            'last_update': self.last_update,
+            'weather_history': list(self.weather_history)
+        }
+
+    def apply_live_state(self, state: Dict):
+        """Neem de state van de collector over (web worker), zie to_live_state()"""
+        self.current_date = state['current_date']
+        self.daily_start_values = state['daily_start_values']
+        self.latest_p1_data = state['latest_p1_data']
+        self.latest_kwh_data = state['latest_kwh_data']
+        self.latest_weather_data = state['latest_weather_data']
+        self.last_update = state['last_update']
+        self.weather_history.clear()
+        self.weather_history.extend(state['weather_history'])
+        self._notify('state')
+
+    def append_samples(self, series: str, samples: List[Tuple[float, Dict]]):
+        """
+        Voeg samples uit de persistente opslag toe aan de ring buffer (web worker)
+
+        Samples die niet nieuwer zijn dan de buffer worden overgeslagen.
+        """
+        history = self.p1_history if series == 'p1' else self.kwh_history
+        latest = history.latest_timestamp()
+        for timestamp, values in samples:
+            if latest is None or timestamp > latest:
+                history.append(timestamp, values)
+                latest = timestamp
 
     def get_latest_data(self) -> Dict:
         """Haal nieuwste data op"""
@@ -82,46 +316,241 @@ class DataManager:
             'last_update': self.last_update.isoformat() if self.last_update else None
         }
 
-    def get_history(self, hours: int = 1) -> Dict:
+    def get_history(
+        self,
+        hours: int = 1,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        max_points: Optional[int] = None,
+        resolution: Optional[int] = None
+    ) -> Dict:
         """
-        Haal historische data op voor de laatste X uren
+        Haal historische data op voor de laatste X uren of een expliciet tijdvenster
+
+        Samples van voor het oudste sample in geheugen komen uit de persistente
+        opslag (als die er is).
 
         Args:
-            hours: Aantal uren geschiedenis
+            hours: Aantal uren geschiedenis (genegeerd als start is opgegeven)
+            start: Begin van het venster (inclusief)
+            end: Einde van het venster (inclusief), default nu
+            max_points: Maximaal aantal punten per reeks, meer samples worden
+                gedownsampled met min/max bucketing
+            resolution: Minimale bucket breedte in seconden bij downsampling
 
         Returns:
             Dict met p1 en kwh geschiedenis
         """
-        cutoff_time = datetime.now() - timedelta(hours=hours)
+        plan = self.plan_history(hours, start, end, max_points, resolution)
+        self.load_stored_history(plan)
+        return self.finish_history(plan)
+
+    def plan_history(
+        self,
+        hours: int = 1,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        max_points: Optional[int] = None,
+        resolution: Optional[int] = None
+    ) -> Dict[str, Dict]:
+        """
+        Eerste stap van get_history: venster en aantal samples in geheugen per reeks
 
-        p1_filtered = [
-            item for item in self.p1_history
-            if item.get('_timestamp', datetime.min) > cutoff_time
-        ]
+        De drie stappen zijn los aan te roepen zodat alleen load_stored_history
+        (de queries op de opslag) in een worker thread hoeft te draaien. De
+        ring buffers en de downsample cache worden alleen vanuit de event
+        loop gelezen, in plan_history en finish_history.
+        """
+        now = time.time()
+        start_ts = start.timestamp() if start is not None else now - hours * 3600
+        end_ts = end.timestamp() if end is not None else now
+
+        plan = {}
+        for key, history in (('p1', self.p1_history), ('kwh', self.kwh_history)):
+            first, last = self._history_bounds(history, start_ts, end_ts, start is not None, end is not None)
+
+            # Het deel van het venster van voor het oudste sample in geheugen komt uit de opslag
+            oldest = history.oldest_timestamp()
+            store_window = None
+            if self.store is not None and (oldest is None or start_ts < oldest):
+                store_window = (start_ts, min(oldest, end_ts) if oldest is not None else end_ts)
+
+            plan[key] = {
+                'start': start_ts, 'end': end_ts, 'explicit_start': start is not None,
+                'explicit_end': end is not None, 'max_points': max_points, 'resolution': resolution,
+                'count': last - first, 'store_window': store_window, 'bucket_seconds': None, 'rows': []
+            }
+            self._choose_bucket(plan[key])
+        return plan
 
-        kwh_filtered = [
-            item for item in self.kwh_history
-            if item.get('_timestamp', datetime.min) > cutoff_time
-        ]
+    def needs_store(self, plan: Dict[str, Dict]) -> bool:
+        """Of een plan van plan_history (deels) uit de persistente opslag gelezen moet worden"""
+        return any(entry['store_window'] is not None for entry in plan.values())
 
-        return {
-            'p1': p1_filtered,
-            'kwh': kwh_filtered
-        }
+    def load_stored_history(self, plan: Dict[str, Dict]):
+        """
+        Tweede stap van get_history: lees het deel van het venster uit de opslag
+
+        Gebruikt alleen de opslag (met een eigen lock), niet de buffers in
+        geheugen, en mag daarom in een worker thread draaien.
+        """
+        for key, entry in plan.items():
+            if entry['store_window'] is None:
+                continue
+            store_start, store_end = entry['store_window']
+            entry['count'] += self.store.count(key, store_start, store_end)
+            self._choose_bucket(entry)
+            if entry['bucket_seconds'] is None:
+                entry['rows'] = self.store.query_range(key, store_start, store_end)
+            else:
+                entry['rows'] = self.store.query_downsampled(key, store_start, store_end, entry['bucket_seconds'])
+
+    def finish_history(self, plan: Dict[str, Dict]) -> Dict:
+        """Laatste stap van get_history: vul aan met de samples in geheugen"""
+        result = {}
+        for key, history in (('p1', self.p1_history), ('kwh', self.kwh_history)):
+            entry = plan[key]
+            start_ts, end_ts = entry['start'], entry['end']
+            # De buffer kan sinds plan_history veranderd zijn, zoek de grenzen opnieuw
+            first, last = self._history_bounds(history, start_ts, end_ts, entry['explicit_start'], entry['explicit_end'])
+            bucket_seconds = entry['bucket_seconds']
+
+            rows = entry['rows']
+            if bucket_seconds is None:
+                rows += history.rows(first, last)
+            elif entry['count']:
+                rows += self._downsamplers[key].downsample(
+                    history[first] if not entry['explicit_start'] and first < last else start_ts,
+                    end_ts if entry['explicit_end'] else float('inf'),
+                    bucket_seconds
+                )
+            result[key] = rows
+
+        return result
+
+    @staticmethod
+    def _history_bounds(
+        history: ColumnarRingBuffer, start_ts: float, end_ts: float, explicit_start: bool, explicit_end: bool
+    ) -> Tuple[int, int]:
+        # Samples staan op tijd gesorteerd, zoek de grenzen met binary search
+        if explicit_start:
+            first = history.index_at_or_after(start_ts)
+        else:
+            first = history.index_after(start_ts)
+        last = history.index_after(end_ts) if explicit_end else len(history)
+        return first, last
+
+    def _choose_bucket(self, entry: Dict):
+        """
+        Downsample als dat gevraagd is, de bucket breedte volgt uit het venster en max_points
+
+        Een gevraagde resolutie wordt naar boven afgerond op de vaste
+        RESOLUTIONS (zodat de downsample cache beperkt blijft tot een paar
+        resoluties) en is minimaal het sample interval. Buckets van één
+        sample interval bevatten hooguit één sample: dan zijn de samples
+        zelf het resultaat en wordt er niet gedownsampled.
+        """
+        max_points, resolution, count = entry['max_points'], entry['resolution'], entry['count']
+        bucket_seconds = None
+        if resolution is not None or (max_points is not None and count > max_points):
+            bucket_seconds = snap_resolution(max(resolution or 1, self.sample_interval))
+            if max_points is not None and count > max_points:
+                bucket_seconds = choose_resolution(entry['end'] - entry['start'], max_points, bucket_seconds)
+            if bucket_seconds <= self.sample_interval:
+                bucket_seconds = None
+        entry['bucket_seconds'] = bucket_seconds
+
+    def get_interval_summary(self, since: Optional[datetime] = None) -> Dict:
+        """
+        Bereken gemiddelden en pieken over de samples sinds een tijdstip (voor PVOutput)
+
+        Args:
+            since: Begin van het interval, None voor alle beschikbare samples
+
+        Returns:
+            Dict met:
+            - sample_count: Aantal P1/kWh samples in het interval
+            - avg_generation_w / peak_generation_w: Opwekking (kWh meters)
+            - avg_grid_power_w: Grid vermogen (P1 meter)
+            - avg_consumption_w / peak_consumption_w: Verbruik (opwekking + grid)
+        """
+        cutoff = since.timestamp() if since else float('-inf')
+
+        p1_start = self.p1_history.index_after(cutoff)
+        kwh_start = self.kwh_history.index_after(cutoff)
+        p1_times = self.p1_history.timestamp_slice(p1_start)
+        p1_power = self.p1_history.column('active_power_w', p1_start)
+        kwh_times = self.kwh_history.timestamp_slice(kwh_start)
+        generation = self.kwh_history.column('active_power_w', kwh_start)
+
+        summary = {'sample_count': max(len(p1_times), len(kwh_times))}
+
+        if generation:
+            summary['avg_generation_w'] = sum(generation) / len(generation)
+            summary['peak_generation_w'] = max(generation)
+
+        if p1_power:
+            # Verbruik per sample: P1 sample met het kWh sample uit dezelfde cyclus
+            tolerance = self.sample_interval / 2
+            consumption = []
+            j = 0
+            for timestamp, grid_power in zip(p1_times, p1_power):
+                while j + 1 < len(kwh_times) and kwh_times[j + 1] <= timestamp + tolerance:
+                    j += 1
+                generation_w = generation[j] if generation else 0
+                consumption.append(generation_w + grid_power)
+
+            summary['avg_grid_power_w'] = sum(p1_power) / len(p1_power)
+            summary['avg_consumption_w'] = sum(consumption) / len(consumption)
+            summary['peak_consumption_w'] = max(consumption)
+
+        return summary
+
+    def _memoized(self, name: str, compute: Callable[[], Any], freeze: bool = True) -> Any:
+        """
+        Geef een gecacht resultaat terug zolang de versie niet veranderd is
+
+        De cache vervalt bij elke nieuwe meting (versie ophoging) en bij de
+        dagwissel. Een dict resultaat wordt read-only gemaakt, zodat alle
+        lezers hetzelfde object kunnen delen.
+        """
+        if time.time() >= self._day_end:
+            self._check_and_reset_daily_values()
+
+        entry = self._memo.get(name)
+        if entry is not None and entry[0] == self.version:
+            return entry[1]
+
+        result = compute()
+        if freeze:
+            result = _freeze(result)
+        self._memo[name] = (self.version, result)
+        return result
+
+    def get_encoded(self, name: str, build: Callable[[], Any]) -> bytes:
+        """
+        JSON bytes van build(), één keer geëncodeerd per data versie
+
+        Args:
+            name: Cache sleutel voor dit resultaat
+            build: Functie die de te encoderen data oplevert
+        """
+        return self._memoized(f'{name}:json', lambda: encode_json(build()), freeze=False)
 
     def get_daily_totals(self) -> Dict:
         """
         Bereken totalen voor vandaag (voor PVOutput)
 
         Returns:
-            Dict met:
+            Read-only dict met:
             - energy_generation_wh: Totaal opgewekt vandaag in Wh
             - energy_consumption_wh: Totaal verbruikt vandaag in Wh
             - energy_import_wh: Totaal geïmporteerd vandaag in Wh
             - energy_export_wh: Totaal geëxporteerd vandaag in Wh
         """
-        self._check_and_reset_daily_values()
+        return self._memoized('daily_totals', self._compute_daily_totals)
 
+    def _compute_daily_totals(self) -> Dict:
         totals = {
             'energy_generation_wh': 0,
             'energy_consumption_wh': 0,
@@ -158,7 +587,10 @@ class DataManager:
         return totals
 
     def get_statistics(self) -> Dict:
-        """Bereken statistieken over de data"""
+        """Bereken statistieken over de data (read-only dict)"""
+        return self._memoized('statistics', self._compute_statistics)
+
+    def _compute_statistics(self) -> Dict:
         stats = {
             'p1': {},
             'kwh': {},
@@ -0,0 +1,125 @@
+import itertools
+import math
+from typing import Dict, List, Tuple
+
+from app.ring_buffer import ColumnarRingBuffer
+
+# Bucket breedtes in seconden; vaste waarden zodat buckets op vaste grenzen
+# liggen en tussen requests hergebruikt kunnen worden
+RESOLUTIONS = (1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 21600, 43200, 86400)
+
+def choose_resolution(span_seconds: float, max_points: int, minimum: int = 1) -> int:
+    """
+    Kies de kleinste bucket breedte waarbij het venster in max_points punten past
+
+    Min/max bucketing levert maximaal 2 punten per bucket op.
+
+    Args:
+        span_seconds: Lengte van het venster in seconden
+        max_points: Maximaal aantal punten in het resultaat
+        minimum: Minimale bucket breedte in seconden
+    """
+    return snap_resolution(max(minimum, span_seconds / max(1, max_points // 2)))
+
+def snap_resolution(seconds: float) -> int:
+    """Rond een bucket breedte naar boven af op RESOLUTIONS (of een veelvoud van een dag)"""
+    for resolution in RESOLUTIONS:
+        if resolution >= seconds:
+            return resolution
+    return int(math.ceil(seconds / RESOLUTIONS[-1])) * RESOLUTIONS[-1]
+
+class MinMaxDownsampler:
+    """
+    Min/max bucketing van een ring buffer, met cache van afgesloten buckets
+
+    Per bucket worden de samples met het laagste en hoogste vermogen
+    bewaard (in tijdsvolgorde), zodat pieken en dalen zichtbaar blijven.
+    Een bucket is afgesloten zodra er een nieuwer sample na het einde van
+    de bucket is; het resultaat daarvan verandert niet meer en wordt
+    bewaard per (resolutie, bucket). Buckets met één sample worden niet
+    bewaard (opnieuw selecteren is even duur), en de cache heeft een
+    maximum aantal buckets; daarboven gaan de oudst toegevoegde eruit.
+    """
+
+    def __init__(self, history: ColumnarRingBuffer, value_column: str = 'active_power_w', max_entries: int = 10000):
+        self.history = history
+        self.value_column = value_column
+        self.max_entries = max_entries
+        self._cache: Dict[Tuple[int, int], List[Dict]] = {}
+
+    def downsample(self, start: float, end: float, resolution: int) -> List[Dict]:
+        """
+        Geef min/max gebucket rows voor samples met start <= timestamp <= end
+
+        Args:
+            start: Begin van het venster (epoch seconden)
+            end: Einde van het venster (epoch seconden)
+            resolution: Bucket breedte in seconden
+        """
+        history = self.history
+        first = history.index_at_or_after(start)
+        last = history.index_after(end)
+        if first >= last:
+            return []
+
+        latest = history.latest_timestamp()
+        first_bucket = int(history[first] // resolution)
+        last_bucket = int(history[last - 1] // resolution)
+
+        rows = []
+        for bucket in range(first_bucket, last_bucket + 1):
+            bucket_start = bucket * resolution
+            bucket_end = bucket_start + resolution
+
+            # Alleen buckets die volledig in het venster liggen en afgesloten zijn mogen uit de cache
+            cacheable = bucket_start >= start and bucket_end <= end and bucket_end <= latest
+            key = (resolution, bucket)
+            if cacheable and key in self._cache:
+                rows.extend(self._cache[key])
+                continue
+
+            i = max(first, history.index_at_or_after(bucket_start))
+            j = min(last, history.index_at_or_after(bucket_end))
+            bucket_rows = self._select(i, j)
+            if cacheable and j - i > 1:
+                self._cache[key] = bucket_rows
+            rows.extend(bucket_rows)
+
+        self._evict(history.oldest_timestamp())
+        return rows
+
+    def clear(self):
+        """Leeg de cache (bijvoorbeeld nadat de historie is vervangen)"""
+        self._cache.clear()
+
+    def _select(self, i: int, j: int) -> List[Dict]:
+        """Kies de samples met minimale en maximale waarde uit [i, j)"""
+        if i >= j:
+            return []
+
+        values = self.history.column(self.value_column, i, j)
+        # NaN waarden tellen niet mee, val terug op het eerste sample
+        valid = [(value, index) for index, value in enumerate(values) if value == value]
+        if not valid:
+            return self.history.rows(i, i + 1)
+
+        low = min(valid)[1]
+        high = max(valid)[1]
+        indices = sorted({low, high})
+        return [self.history.rows(i + index, i + index + 1)[0] for index in indices]
+
+    def _evict(self, oldest: float):
+        """Verwijder gecachte buckets die volledig voor het oudste sample liggen"""
+        if oldest is None:
+            self._cache.clear()
+            return
+
+        stale = [key for key in self._cache if (key[1] + 1) * key[0] < oldest]
+        for key in stale:
+            del self._cache[key]
+
+        # Dicts behouden de volgorde van toevoegen, de eerste keys zijn de oudste
+        excess = len(self._cache) - self.max_entries
+        if excess > 0:
+            for key in list(itertools.islice(self._cache, excess)):
+                del self._cache[key]
@@ -1,34 +1,206 @@
+import asyncio
+import logging
+import time
 import httpx
 from typing import Optional, Dict, List
 from datetime import datetime
 
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+def create_http_client(
+    device_count: int = 1,
+    keepalive_per_host: int = 1,
+    keepalive_expiry: float = 60.0,
+    timeout: float = 10.0
+) -> httpx.AsyncClient:
+    """
+    Maak een gedeelde HTTP client met connection pool voor alle HomeWizard apparaten
+
+    httpx kent geen keep-alive limiet per host, dus het aantal keep-alive
+    verbindingen wordt gedimensioneerd op het aantal apparaten maal het aantal
+    verbindingen per host. HomeWizard apparaten ondersteunen maar een paar
+    gelijktijdige verbindingen, één open verbinding per apparaat is de default.
+    Het totaal aantal verbindingen is niet begrensd zodat later toegevoegde
+    meters nooit op een vrije verbinding hoeven te wachten.
+
+    Args:
+        device_count: Aantal apparaten dat de client deelt
+        keepalive_per_host: Aantal keep-alive verbindingen per apparaat
+        keepalive_expiry: Seconden dat een ongebruikte verbinding open blijft
+        timeout: Request timeout in seconden
+    """
+    limits = httpx.Limits(
+        max_connections=None,
+        max_keepalive_connections=max(1, device_count) * max(1, keepalive_per_host),
+        keepalive_expiry=keepalive_expiry
+    )
+    return httpx.AsyncClient(timeout=timeout, limits=limits)
+
+class DeviceCircuitBreaker:
+    """
+    Gezondheid van één apparaat, met een circuit breaker
+
+    Na `failure_threshold` mislukte uitlezingen op rij gaat het circuit
+    open: het apparaat wordt dan niet meer uitgelezen (geen timeout per
+    cyclus, geen open socket) tot de backoff verstreken is. Daarna volgt
+    één probe met een korte timeout (half open). Lukt die, dan is het
+    circuit weer dicht; mislukt die, dan gaat het opnieuw open met een
+    verdubbelde backoff, tot maximaal `max_backoff` seconden.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        base_backoff: float = 30,
+        max_backoff: float = 600,
+        probe_timeout: float = 2.0
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.backoff = base_backoff
+        self.open_until = 0.0  # time.monotonic()
+        self.last_error: Optional[str] = None
+        self.last_success: Optional[datetime] = None
+        self.last_failure: Optional[datetime] = None
+
+    def allow_request(self) -> bool:
+        """Mag het apparaat nu uitgelezen worden; na de backoff wordt het circuit half open"""
+        if self.state == self.OPEN:
+            if time.monotonic() < self.open_until:
+                return False
+            self.state = self.HALF_OPEN
+        return True
+
+    @property
+    def request_timeout(self) -> Optional[float]:
+        """Korte timeout voor een probe, None voor de standaard timeout van de client"""
+        return self.probe_timeout if self.state == self.HALF_OPEN else None
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.backoff = self.base_backoff
+        self.last_success = datetime.now()
+
+    def record_failure(self, error: str) -> bool:
+        """
+        Registreer een mislukte uitlezing
+
+        Returns:
+            True als het circuit hierdoor (opnieuw) open gaat
+        """
+        self.consecutive_failures += 1
+        self.last_error = error
+        self.last_failure = datetime.now()
+
+        if self.state == self.HALF_OPEN:
+            self.backoff = min(self.max_backoff, self.backoff * 2)
+        elif self.consecutive_failures < self.failure_threshold:
+            return False
+
+        self.state = self.OPEN
+        self.open_until = time.monotonic() + self.backoff
+        return True
+
+    def status(self) -> Dict:
+        """Huidige status van het apparaat (voor /api/status)"""
+        retry_in = max(0.0, self.open_until - time.monotonic()) if self.state == self.OPEN else None
+        return {
+            'state': self.state,
+            'consecutive_failures': self.consecutive_failures,
+            'retry_in_seconds': round(retry_in, 1) if retry_in is not None else None,
+            'last_error': self.last_error,
+            'last_success': self.last_success.isoformat() if self.last_success else None,
+            'last_failure': self.last_failure.isoformat() if self.last_failure else None
+        }
+
 class HomeWizardClient:
     """Client voor HomeWizard API communicatie"""
 
-    def __init__(self, host: str):
+    def __init__(
+        self,
+        host: str,
+        http_client: Optional[httpx.AsyncClient] = None,
+        breaker: Optional[DeviceCircuitBreaker] = None
+    ):
         self.host = host
         self.base_url = f"http://{host}/api/v1"
+        self.http_client = http_client  # Gedeelde client, None = per request een eigen client
+        self.breaker = breaker or DeviceCircuitBreaker()
+
+    async def _get(self, url: str, timeout: Optional[float] = None) -> httpx.Response:
+        """Voer GET request uit via de gedeelde client (of een tijdelijke als die er niet is)"""
+        if self.http_client is not None and not self.http_client.is_closed:
+            if timeout is not None:
+                return await self.http_client.get(url, timeout=timeout)
+            return await self.http_client.get(url)
+
+        async with httpx.AsyncClient(timeout=timeout or 10.0) as client:
+            return await client.get(url)
+
+    def _record_failure(self, error: str):
+        if self.breaker.record_failure(error):
+            logger.warning(
+                "Circuit open voor %s na %d mislukte uitlezing(en), volgende poging over %.0fs",
+                self.host, self.breaker.consecutive_failures, self.breaker.backoff, extra={'device': self.host}
+            )
 
     async def get_data(self) -> Optional[Dict]:
-        """Haal actuele data op van HomeWizard apparaat"""
+        """
+        Haal actuele data op van HomeWizard apparaat
+
+        Bij een open circuit wordt het apparaat overgeslagen (direct None).
+        """
+        if not self.breaker.allow_request():
+            metrics.DEVICE_POLLS.inc(device=self.host, result='skipped')
+            return None
+
+        was_open = self.breaker.state != DeviceCircuitBreaker.CLOSED
+        started = time.perf_counter()
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}/data")
-                response.raise_for_status()
-                return response.json()
+            response = await self._get(f"{self.base_url}/data", timeout=self.breaker.request_timeout)
+            response.raise_for_status()
+            data = response.json()
+            metrics.DEVICE_POLLS.inc(device=self.host, result='success')
+            self.breaker.record_success()
+            if was_open:
+                logger.info("%s is weer bereikbaar, circuit gesloten", self.host, extra={'device': self.host})
+            return data
+        except asyncio.CancelledError:
+            # Afgebroken door de deadline van de cyclus, telt als mislukte uitlezing
+            self._record_failure('deadline verstreken')
+            raise
+        except httpx.TimeoutException as e:
+            metrics.DEVICE_POLLS.inc(device=self.host, result='timeout')
+            logger.warning("Timeout bij ophalen HomeWizard data van %s: %s", self.host, e, extra={'device': self.host})
+            self._record_failure(f"timeout: {e}" if str(e) else 'timeout')
+            return None
         except Exception as e:
-            print(f"Fout bij ophalen HomeWizard data van {self.host}: {e}")
+            metrics.DEVICE_POLLS.inc(device=self.host, result='error')
+            logger.warning("Fout bij ophalen HomeWizard data van %s: %s", self.host, e, extra={'device': self.host})
+            self._record_failure(str(e) or type(e).__name__)
             return None
+        finally:
+            metrics.DEVICE_POLL_DURATION.observe(time.perf_counter() - started, device=self.host)
 
     async def get_info(self) -> Optional[Dict]:
         """Haal apparaat informatie op"""
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(f"{self.base_url}")
-                response.raise_for_status()
-                return response.json()
+            response = await self._get(f"{self.base_url}")
+            response.raise_for_status()
+            return response.json()
         except Exception as e:
-            print(f"Fout bij ophalen HomeWizard info van {self.host}: {e}")
+            logger.warning("Fout bij ophalen HomeWizard info van %s: %s", self.host, e, extra={'device': self.host})
             return None
 
 class HomeWizardDataProcessor:
@@ -108,12 +280,14 @@ class HomeWizardDataProcessor:
         }
 
     @staticmethod
-    def combine_kwh_data(kwh_data_list: List[Dict]) -> Dict:
+    def combine_kwh_data(kwh_data_list: List[Dict], missed_meters: Optional[List[Dict]] = None) -> Dict:
         """
         Combineer data van meerdere kWh meters
 
         Args:
             kwh_data_list: Lijst van verwerkte kWh meter data
+            missed_meters: Meters die deze cyclus geen data leverden (deadline of fout),
+                met hun laatst bekende data als die er is
 
         Returns:
             Dict met gecombineerde data:
@@ -121,6 +295,7 @@ class HomeWizardDataProcessor:
             - active_power_w: som van alle meters
             - meters: lijst met individuele meter data
             - timestamp: tijd van meting
+            - missed_meters: namen van meters zonder actuele data
         """
         if not kwh_data_list:
             return {}
@@ -131,13 +306,18 @@ class HomeWizardDataProcessor:
         if not valid_data:
             return {}
 
+        missed_meters = missed_meters or []
+
         # Combineer de data
+        # Meters zonder actuele data tellen mee met hun laatst bekende meterstand,
+        # anders zakt het totaal (en daarmee de dagopwekking) tijdelijk in
         combined = {
-            'total_power_export_kwh': sum(d.get('total_power_export_kwh', 0) for d in valid_data),
+            'total_power_export_kwh': sum(d.get('total_power_export_kwh', 0) for d in valid_data + missed_meters),
             'active_power_w': sum(d.get('active_power_w', 0) for d in valid_data),
             'timestamp': datetime.now().isoformat(),
             'meters': valid_data,  # Bewaar individuele meter data
-            'meter_count': len(valid_data)
+            'meter_count': len(valid_data),
+            'missed_meters': [d.get('meter_name', d.get('meter_host')) for d in missed_meters]
         }
 
         return combined
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import ssl
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+try:
+    import websockets
+except ImportError:  # websockets is optioneel, zonder wordt elk apparaat via API v1 uitgelezen
+    websockets = None
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+# Velden van een API v2 meting met hun naam in API v1, zodat HomeWizardDataProcessor beide kan verwerken
+V2_FIELDS = {
+    'power_w': 'active_power_w',
+    'power_l1_w': 'active_power_l1_w',
+    'power_l2_w': 'active_power_l2_w',
+    'power_l3_w': 'active_power_l3_w',
+    'energy_import_kwh': 'total_power_import_kwh',
+    'energy_export_kwh': 'total_power_export_kwh',
+    'voltage_l1_v': 'voltage_sag_l1_v',
+    'voltage_l2_v': 'voltage_sag_l2_v',
+    'voltage_l3_v': 'voltage_sag_l3_v',
+    'voltage_v': 'voltage_sag_l1_v'
+}
+
+def convert_v2_measurement(data: Dict) -> Dict:
+    """Zet een API v2 meting om naar de veldnamen van /api/v1/data"""
+    converted = {V2_FIELDS.get(key, key): value for key, value in data.items() if key != 'voltage_v'}
+    if 'voltage_v' in data:
+        converted.setdefault(V2_FIELDS['voltage_v'], data['voltage_v'])  # voltage_l1_v gaat voor voltage_v
+    return converted
+
+def streaming_available() -> bool:
+    return websockets is not None
+
+class HomeWizardStream:
+    """
+    Langlopende WebSocket subscriptie op de metingen van een HomeWizard apparaat (API v2)
+
+    Het apparaat pusht elke nieuwe meting, zodat er geen request per sample
+    nodig is. Na het verbinden volgt de autorisatie met de token van het
+    apparaat en een subscriptie op 'measurement'. Valt de verbinding weg,
+    dan wordt opnieuw verbonden met een backoff die verdubbelt tot
+    max_backoff. Zolang er geen verse meting is (fresh is False) leest de
+    site het apparaat uit via API v1.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        token: str,
+        on_message: Optional[Callable[[str], None]] = None,
+        url: Optional[str] = None,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        stale_after: float = 30.0,
+        verify_tls: bool = False
+    ):
+        """
+        Args:
+            host: Adres van het apparaat
+            token: Token van de lokale API v2 gebruiker
+            on_message: Callback met de host na elke meting (synchroon, moet snel zijn)
+            url: WebSocket URL, default wss://<host>/api/ws
+            backoff: Eerste wachttijd in seconden voor opnieuw verbinden
+            max_backoff: Maximale wachttijd voor opnieuw verbinden
+            stale_after: Seconden na de laatste meting waarna de stream niet meer als actueel geldt
+            verify_tls: Controleer het certificaat (HomeWizard apparaten gebruiken een eigen CA)
+        """
+        self.host = host
+        self.token = token
+        self.on_message = on_message
+        self.url = url or f"wss://{host}/api/ws"
+        self.base_backoff = backoff
+        self.max_backoff = max_backoff
+        self.stale_after = stale_after
+        self.verify_tls = verify_tls
+        self.latest: Optional[Dict] = None  # Laatste meting, in het formaat van API v1
+        self.received_at = 0.0  # time.monotonic() van de laatste meting
+        self.connected = False
+        self.messages = 0
+        self.reconnects = 0
+        self.last_error: Optional[str] = None
+        self.last_message: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def fresh(self) -> bool:
+        """True als er verbinding is en de laatste meting recent genoeg is"""
+        return self.connected and self.latest is not None and time.monotonic() - self.received_at < self.stale_after
+
+    def _ssl_context(self) -> Optional[ssl.SSLContext]:
+        if not self.url.startswith('wss://'):
+            return None
+        context = ssl.create_default_context()
+        if not self.verify_tls:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    def close(self):
+        """Stop de stream (zonder te wachten)"""
+        if self._task:
+            self._task.cancel()
+
+    async def stop(self):
+        """Stop de stream en wacht tot de verbinding gesloten is"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        """Verbind en blijf verbonden tot de taak gestopt wordt"""
+        backoff = self.base_backoff
+        while True:
+            received = self.messages
+            try:
+                await self._connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                logger.warning("WebSocket van %s verbroken: %s, opnieuw verbinden over %gs",
+                               self.host, self.last_error, backoff, extra={'device': self.host})
+            finally:
+                if self.connected:
+                    self.connected = False
+                    metrics.DEVICE_STREAM_CONNECTED.set(0, device=self.host)
+
+            # Na een verbinding die metingen opleverde begint de backoff opnieuw
+            if self.messages > received:
+                backoff = self.base_backoff
+            await asyncio.sleep(backoff)
+            backoff = min(self.max_backoff, backoff * 2)
+            self.reconnects += 1
+
+    async def _connect(self):
+        async with websockets.connect(self.url, ssl=self._ssl_context(), open_timeout=10) as connection:
+            async for raw in connection:
+                message = json.loads(raw)
+                kind = message.get('type')
+                if kind == 'authorization_requested':
+                    await connection.send(json.dumps({'type': 'authorization', 'data': self.token}))
+                elif kind == 'authorized':
+                    await connection.send(json.dumps({'type': 'subscribe', 'data': 'measurement'}))
+                    self.connected = True
+                    self.last_error = None
+                    metrics.DEVICE_STREAM_CONNECTED.set(1, device=self.host)
+                    logger.info("WebSocket van %s verbonden, metingen via push", self.host, extra={'device': self.host})
+                elif kind == 'measurement':
+                    self._handle_measurement(message.get('data') or {})
+                elif kind == 'error':
+                    error = message.get('data') or {}
+                    raise ConnectionError(error.get('message', error) if isinstance(error, dict) else error)
+
+    def _handle_measurement(self, data: Dict):
+        self.latest = convert_v2_measurement(data)
+        self.received_at = time.monotonic()
+        self.last_message = datetime.now()
+        self.messages += 1
+        metrics.DEVICE_STREAM_MESSAGES.inc(device=self.host)
+        if self.on_message:
+            try:
+                self.on_message(self.host)
+            except Exception as e:
+                logger.exception("Fout in stream callback: %s", e)
+
+    def status(self) -> Dict:
+        """Status van de stream (voor /api/status)"""
+        return {
+            'connected': self.connected,
+            'fresh': self.fresh,
+            'messages': self.messages,
+            'reconnects': self.reconnects,
+            'last_message': self.last_message.isoformat() if self.last_message else None,
+            'last_error': self.last_error
+        }
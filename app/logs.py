@@ -0,0 +1,161 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+# Attributen die elk LogRecord heeft; de rest komt uit extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+TEXT_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+class DedupeFilter(logging.Filter):
+    """
+    Onderdruk herhaalde identieke waarschuwingen en fouten
+
+    Twee records zijn identiek als logger, level, message template en
+    device (uit extra) overeenkomen; de argumenten tellen niet mee, zodat
+    een foutmelding met steeds een andere exception tekst ook samengevoegd
+    wordt. Per sleutel komen maximaal `burst` records per `window`
+    seconden door. Het eerste record na het venster krijgt het aantal
+    onderdrukte herhalingen mee (attribuut `repeated`).
+    """
+
+    def __init__(self, window: float = 300, burst: int = 1, min_level: int = logging.WARNING):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        self.min_level = min_level
+        self._lock = threading.Lock()
+        self._seen: Dict[Tuple, list] = {}  # key -> [venster start, aantal in venster, onderdrukt]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.min_level or self.window <= 0:
+            return True
+
+        key = (record.name, record.levelno, record.msg, getattr(record, 'device', None))
+        now = time.monotonic()
+        with self._lock:
+            state = self._seen.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._seen[key] = [now, 1, 0]
+                if suppressed:
+                    record.repeated = suppressed
+                if len(self._seen) > 1000:
+                    self._expire(now)
+                return True
+
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+    def _expire(self, now: float):
+        for key in [key for key, state in self._seen.items() if now - state[0] >= self.window and not state[2]]:
+            del self._seen[key]
+
+class TextFormatter(logging.Formatter):
+    """Leesbaar formaat, met extra velden (device, repeated) achter het bericht"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        repeated = getattr(record, 'repeated', None)
+        if repeated:
+            line += f" ({repeated}x herhaald)"
+        return line
+
+class JsonFormatter(logging.Formatter):
+    """Eén JSON object per regel, met de velden uit extra als losse keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler die het formatteren aan de listener thread overlaat
+
+    De standaard QueueHandler formatteert het bericht al in de aanroepende
+    thread; hier worden alleen de argumenten samengevoegd en exception
+    tekst vastgelegd, zodat de event loop zo min mogelijk werk doet.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging(
+    level: str = 'INFO',
+    json_output: bool = False,
+    dedupe_window: float = 300,
+    levels: Optional[Dict[str, str]] = None
+) -> logging.handlers.QueueListener:
+    """
+    Configureer logging voor de applicatie (logger 'app')
+
+    Records gaan via een queue naar een achtergrond thread die naar stdout
+    schrijft, zodat trage I/O (bijvoorbeeld een volle Docker log pipe) de
+    event loop niet blokkeert.
+
+    Args:
+        level: Standaard level voor de applicatie
+        json_output: Schrijf JSON regels in plaats van tekst
+        dedupe_window: Seconden waarbinnen identieke waarschuwingen en fouten
+            (per apparaat) maar één keer gelogd worden, 0 om uit te zetten
+        levels: Levels per logger, bijvoorbeeld {'app.homewizard': 'DEBUG'}
+    """
+    global _listener
+    stop_logging()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if json_output else TextFormatter(TEXT_FORMAT))
+
+    queue_handler = _QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(DedupeFilter(window=dedupe_window))
+
+    logger = logging.getLogger('app')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(str(logger_level).upper())
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging():
+    """Schrijf de resterende records weg en stop de listener thread"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
@@ -1,153 +1,125 @@
 import asyncio
-from fastapi import FastAPI, HTTPException, Request
+import logging
+import time
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
-from typing import Dict
+from datetime import datetime, timedelta
+from typing import Dict, Optional
 import uvicorn
 
+from app import metrics, tracing
+from app.broadcast import encode_event
 from app.config import Config
-from app.homewizard import HomeWizardClient, HomeWizardDataProcessor
-from app.pvoutput import PVOutputClient, PVOutputDataConverter
-from app.data_manager import DataManager
-from app.weather import OpenMeteoClient
+from app.logs import setup_logging
+from app.homewizard import create_http_client
+from app.serialization import encode_json
+from app.pvoutput import PVOutputRateLimiter
+from app.site import Site
 
 # Globale instances
 config = Config()
-data_manager = DataManager()
-p1_client = None
-kwh_clients = {}  # Dictionary om meerdere kWh meter clients op te slaan (key: host)
-pvoutput_client = None
-weather_client = None
-update_task = None
-
-async def collect_and_send_data():
-    """Verzamel data van HomeWizard en stuur naar PVOutput"""
-    global p1_client, kwh_clients, pvoutput_client, weather_client
-
-    # Haal P1 data op
-    p1_data = {}
-    if config.homewizard_p1_enabled and config.homewizard_p1_host:
-        if not p1_client:
-            p1_client = HomeWizardClient(config.homewizard_p1_host)
-
-        raw_p1_data = await p1_client.get_data()
-        p1_data = HomeWizardDataProcessor.process_p1_data(raw_p1_data)
-        data_manager.add_p1_data(p1_data)
-        print(f"P1 data verzameld: {p1_data.get('active_power_w', 0)}W")
-
-    # Haal data op van alle kWh meters
-    kwh_data_list = []
-    kwh_meters = config.homewizard_kwh_meters_enabled
-
-    if kwh_meters:
-        for meter in kwh_meters:
-            meter_host = meter.get('host')
-            meter_name = meter.get('name', meter_host)
-
-            # Maak client aan als deze nog niet bestaat
-            if meter_host not in kwh_clients:
-                kwh_clients[meter_host] = HomeWizardClient(meter_host)
-
-            try:
-                # Haal data op van deze meter
-                raw_kwh_data = await kwh_clients[meter_host].get_data()
-                processed_data = HomeWizardDataProcessor.process_kwh_data(raw_kwh_data)
-
-                # Voeg meter naam toe aan data
-                processed_data['meter_name'] = meter_name
-                processed_data['meter_host'] = meter_host
-
-                kwh_data_list.append(processed_data)
-                print(f"kWh data verzameld van '{meter_name}': {processed_data.get('active_power_w', 0)}W")
-
-            except Exception as e:
-                print(f"Fout bij ophalen data van '{meter_name}' ({meter_host}): {e}")
-
-    # Combineer data van alle kWh meters
-    kwh_data = {}
-    if kwh_data_list:
-        kwh_data = HomeWizardDataProcessor.combine_kwh_data(kwh_data_list)
-        data_manager.add_kwh_data(kwh_data)
-        print(f"Totaal kWh data (alle meters): {kwh_data.get('active_power_w', 0)}W van {kwh_data.get('meter_count', 0)} meter(s)")
-
-    # Haal weather data op
-    weather_data = {}
-    if config.weather_enabled and config.weather_latitude and config.weather_longitude:
-        if not weather_client:
-            try:
-                weather_client = OpenMeteoClient(
-                    config.weather_latitude,
-                    config.weather_longitude,
-                    cache_duration=config.weather_cache_duration_minutes
-                )
-            except ValueError as e:
-                print(f"Fout bij initialiseren weather client: {e}")
-                config.data['weather']['enabled'] = False  # Disable weather on invalid config
-
-        if weather_client:
-            try:
-                weather_data = await weather_client.get_weather()
-                data_manager.add_weather_data(weather_data)
-                print(f"Weather data verzameld: {weather_data.get('temperature_c')}°C, {weather_data.get('weather_condition')}")
-            except Exception as e:
-                print(f"Fout bij ophalen weather data: {e} (niet-fataal, doorgaan zonder weather)")
-
-    # Stuur naar PVOutput
-    if config.pvoutput_api_key and config.pvoutput_system_id:
-        if not pvoutput_client:
-            pvoutput_client = PVOutputClient(config.pvoutput_api_key, config.pvoutput_system_id)
-
-        # Haal dagelijkse totalen op
-        daily_totals = data_manager.get_daily_totals()
-
-        # Converteer naar PVOutput formaat (met dagelijkse totalen en weather data)
-        pvoutput_data = PVOutputDataConverter.convert_to_pvoutput(
-            p1_data, kwh_data, daily_totals, weather_data
+setup_logging(
+    config.logging_level,
+    json_output=config.logging_json,
+    dedupe_window=config.logging_dedupe_window,
+    levels=config.logging_levels
+)
+logger = logging.getLogger(__name__)
+role = config.app_role  # 'all', 'collector' (alleen verzamelen) of 'web' (alleen API uit de opslag)
+http_client = None  # Gedeelde HTTP pool voor alle HomeWizard apparaten van alle sites
+tracer = tracing.Tracer(config.diagnostics_trace_count)  # Timing van de laatste cycli
+rate_limiters: Dict[str, PVOutputRateLimiter] = {}  # Budget per PVOutput account (API key), gedeeld tussen sites
+sites: Dict[str, Site] = {
+    site_config.id: Site(site_config, tracer, rate_limiters, role=role) for site_config in config.sites
+}
+default_site = next(iter(sites.values()))  # Site achter /api/... en / (de eerste in de configuratie)
+
+def get_site(site_id: Optional[str] = None) -> Site:
+    """Dependency voor de routes per site: /api/sites/{site_id}/... of de standaard site onder /api/..."""
+    if site_id is None:
+        return default_site
+    site = sites.get(site_id)
+    if site is None:
+        raise HTTPException(status_code=404, detail=f"Onbekende site '{site_id}'")
+    return site
+
+def require_collector(site: Site):
+    """Acties die een cyclus uitvoeren of de configuratie wijzigen horen bij de collector"""
+    if not site.collects:
+        raise HTTPException(
+            status_code=409,
+            detail="Niet beschikbaar in een web worker (APP_ROLE=web), gebruik de collector"
         )
 
-        if pvoutput_data:
-            await pvoutput_client.add_status(
-                energy_generation=pvoutput_data.get('energy_generation'),
-                power_generation=pvoutput_data.get('power_generation'),
-                energy_consumption=pvoutput_data.get('energy_consumption'),
-                power_consumption=pvoutput_data.get('power_consumption'),
-                temperature=pvoutput_data.get('temperature'),
-                voltage=pvoutput_data.get('voltage'),
-                condition=pvoutput_data.get('condition')
-            )
-            print(f"Data naar PVOutput gestuurd: {pvoutput_data}")
-
-async def scheduled_update_loop():
-    """Achtergrond taak die periodiek data verzamelt en verstuurt"""
-    while True:
+def public_device(device: Dict) -> Dict:
+    """Apparaat configuratie zonder de API v2 token"""
+    public = {key: value for key, value in device.items() if key != 'token'}
+    public['token_configured'] = bool(device.get('token'))
+    return public
+
+def keep_device_tokens(device: Dict, previous: list) -> Dict:
+    """Behoud de token (en stream_url) van een apparaat als het formulier die niet meestuurt"""
+    for old in previous:
+        if old.get('host') == device.get('host'):
+            for key in ('token', 'stream_url'):
+                if key in old and key not in device:
+                    device[key] = old[key]
+    return device
+
+def json_response(body: bytes, headers: Optional[Dict] = None) -> Response:
+    """Stuur al geëncodeerde JSON bytes direct terug, zonder jsonable_encoder"""
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def parse_time(value: Optional[str], name: str) -> Optional[datetime]:
+    """
+    Lees een tijdstip uit een query parameter (ISO 8601 of epoch seconden) als lokale naive tijd
+
+    Tijdstippen met een tijdzone worden naar lokale tijd omgezet, zodat ze
+    vergeleken kunnen worden met tijdstippen zonder tijdzone.
+    """
+    if value is None or value == '':
+        return None
+    try:
         try:
-            await collect_and_send_data()
-        except Exception as e:
-            print(f"Fout in scheduled update: {e}")
-
-        # Wacht tot de volgende update
-        await asyncio.sleep(config.update_interval)
+            parsed = datetime.fromtimestamp(float(value))
+        except ValueError:
+            parsed = datetime.fromisoformat(value)
+    except (ValueError, OverflowError, OSError):
+        raise HTTPException(status_code=400, detail=f"Ongeldig tijdstip voor {name}: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Beheer de levenscyclus van de applicatie"""
-    global update_task
+    global http_client
+
+    # Maak gedeelde HTTP pool aan voor alle HomeWizard apparaten (web workers lezen geen apparaten uit)
+    if role != 'web':
+        http_client = create_http_client(
+            device_count=sum(site.device_count for site in sites.values()),
+            keepalive_per_host=config.homewizard_keepalive_per_host,
+            keepalive_expiry=config.homewizard_keepalive_expiry
+        )
 
-    # Start achtergrond taak
-    update_task = asyncio.create_task(scheduled_update_loop())
-    print(f"Scheduled updates gestart (interval: {config.update_interval}s)")
+    # Start de sites, gespreid over het interval
+    for index, site in enumerate(sites.values()):
+        await site.start(http_client, index=index, count=len(sites))
+    if len(sites) > 1:
+        logger.info("%s sites gestart: %s", len(sites), ', '.join(sites))
 
     yield
 
-    # Stop achtergrond taak
-    if update_task:
-        update_task.cancel()
-        try:
-            await update_task
-        except asyncio.CancelledError:
-            pass
+    # Stop de sites en sluit de gedeelde HTTP pool
+    for site in sites.values():
+        await site.stop()
+    if http_client:
+        await http_client.aclose()
 
 # FastAPI app
 app = FastAPI(
@@ -156,130 +128,373 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+class StreamAwareGZipMiddleware(GZipMiddleware):
+    """GZip compressie, behalve voor de event stream die per bericht doorgestuurd moet worden"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+class MetricsMiddleware:
+    """Meet de duur en status van elk API request, per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Route template (bijvoorbeeld /api/sites/{site_id}/data/history) in plaats van het pad, zodat het aantal labels begrensd blijft
+            route = getattr(scope.get("route"), "path", "other")
+            method = scope["method"]
+            metrics.HTTP_RESPONSES.inc(method=method, route=route, status=str(status))
+            # De event stream blijft open zolang het dashboard open is, die duur zegt niets
+            if not route.endswith("/stream"):
+                metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method=method, route=route)
+
+app.add_middleware(StreamAwareGZipMiddleware, minimum_size=1000)
+app.add_middleware(MetricsMiddleware)
+
 # Mount static files en templates
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
 # Web routes
+def render_dashboard(request: Request, site: Site, api_base: str) -> HTMLResponse:
+    return templates.TemplateResponse("index.html", {
+        "request": request,
+        "site": site,
+        "sites": list(sites.values()),
+        "api_base": api_base
+    })
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
-    """Hoofd dashboard pagina"""
-    return templates.TemplateResponse("index.html", {"request": request})
+    """Hoofd dashboard pagina (standaard site)"""
+    return render_dashboard(request, default_site, "/api")
 
-# API routes
-@app.get("/api/status")
-async def get_status():
+@app.get("/sites/{site_id}", response_class=HTMLResponse)
+async def site_home(request: Request, site: Site = Depends(get_site)):
+    """Dashboard van een specifieke site"""
+    return render_dashboard(request, site, f"/api/sites/{site.id}")
+
+# API routes per site, onder /api/... (standaard site) en /api/sites/{site_id}/...
+site_api = APIRouter()
+
+@site_api.get("/status")
+async def get_status(site: Site = Depends(get_site)):
     """Haal actuele status op"""
-    kwh_meters = config.homewizard_kwh_meters_enabled
-    return {
-        "status": "running",
-        "config": {
-            "p1_enabled": config.homewizard_p1_enabled,
-            "kwh_enabled": len(kwh_meters) > 0,
-            "kwh_meter_count": len(kwh_meters),
-            "pvoutput_configured": bool(config.pvoutput_api_key and config.pvoutput_system_id),
-            "update_interval": config.update_interval
-        }
-    }
+    return site.build_status()
+
+@site_api.get("/dashboard")
+async def get_dashboard(request: Request, site: Site = Depends(get_site)):
+    """
+    Alle data voor het dashboard in één antwoord
+
+    Het antwoord heeft een ETag op basis van de data versie. Stuurt de
+    client die mee in If-None-Match en is er niets veranderd, dan volgt
+    een 304 zonder body.
+    """
+    data_manager = site.data_manager
+    if site.collects:
+        etag = f'"{data_manager.version}-{site.state_generation}"'
+    else:
+        # data_manager.version telt per web worker; de versie van de collector is voor alle workers gelijk
+        etag = f'"r{site.replica_version or 0}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return json_response(
+        encode_json({
+            "latest": data_manager.get_latest_data(),
+            "statistics": site.build_statistics(),
+            "daily": data_manager.get_daily_totals(),
+            "status": site.build_status()
+        }),
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
 
-@app.get("/api/data/latest")
-async def get_latest_data():
+@site_api.get("/data/latest")
+async def get_latest_data(site: Site = Depends(get_site)):
     """Haal nieuwste data op"""
-    return data_manager.get_latest_data()
+    return json_response(site.encoded('latest'))
 
-@app.get("/api/data/daily")
-async def get_daily_totals():
+@site_api.get("/data/daily")
+async def get_daily_totals(site: Site = Depends(get_site)):
     """Haal dagelijkse totalen op (voor PVOutput)"""
-    return data_manager.get_daily_totals()
-
-@app.get("/api/data/history")
-async def get_history_data(hours: int = 1):
-    """Haal historische data op"""
-    if hours < 1 or hours > 24:
-        raise HTTPException(status_code=400, detail="Hours moet tussen 1 en 24 zijn")
-    return data_manager.get_history(hours)
-
-@app.get("/api/data/statistics")
-async def get_statistics():
+    return json_response(site.encoded('daily'))
+
+@site_api.get("/data/history")
+async def get_history_data(
+    hours: int = 1,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    max_points: Optional[int] = None,
+    resolution: Optional[int] = None,
+    site: Site = Depends(get_site)
+):
+    """
+    Haal historische data op (laatste X uren, of tijdvenster van start tot end)
+
+    Met max_points en/of resolution (seconden) wordt de data op de server
+    gedownsampled zodat de grootte van het antwoord begrensd blijft.
+    """
+    start = parse_time(start, 'start')
+    end = parse_time(end, 'end')
+    data_manager = site.data_manager
+    max_hours = site.config.storage_retention_days * 24 if data_manager.store else 24
+    if hours < 1 or hours > max_hours:
+        raise HTTPException(status_code=400, detail=f"Hours moet tussen 1 en {max_hours} zijn")
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="Start moet voor end liggen")
+    if max_points is not None and not 10 <= max_points <= 10000:
+        raise HTTPException(status_code=400, detail="max_points moet tussen 10 en 10000 zijn")
+    if resolution is not None and resolution < 1:
+        raise HTTPException(status_code=400, detail="Resolution moet minimaal 1 seconde zijn")
+
+    # Vensters langer dan een dag worden altijd gedownsampled
+    window_start = start or datetime.now() - timedelta(hours=hours)
+    window_seconds = (end.timestamp() if end else time.time()) - window_start.timestamp()
+    if max_points is None and resolution is None and window_seconds > 24 * 3600:
+        max_points = 5000
+    # Resolution is een minimum: ook dan niet meer dan het maximale aantal punten
+    if max_points is None and resolution is not None:
+        max_points = 10000
+
+    plan = data_manager.plan_history(hours, start=start, end=end, max_points=max_points, resolution=resolution)
+    # Alleen de queries op de opslag draaien in een thread, zodat ze de event loop niet blokkeren;
+    # de buffers in geheugen en de downsample cache worden alleen vanuit de event loop gebruikt
+    if data_manager.needs_store(plan):
+        await asyncio.to_thread(data_manager.load_stored_history, plan)
+    # Rows uit de historie bevatten geen interne keys
+    return json_response(encode_json(data_manager.finish_history(plan), strip=False))
+
+@site_api.get("/data/interval")
+async def get_interval_summary(site: Site = Depends(get_site)):
+    """Haal gemiddelden en pieken op van het lopende PVOutput upload interval"""
+    return site.data_manager.get_interval_summary(site.interval_start())
+
+@site_api.get("/data/statistics")
+async def get_statistics(site: Site = Depends(get_site)):
     """Haal statistieken op"""
-    stats = data_manager.get_statistics()
+    return json_response(site.encoded('statistics'))
 
-    # Voeg individuele kWh meter data toe als beschikbaar
-    if data_manager.latest_kwh_data and 'meters' in data_manager.latest_kwh_data:
-        stats['individual_kwh_meters'] = data_manager.latest_kwh_data['meters']
+@site_api.get("/stream")
+async def stream_updates(request: Request, site: Site = Depends(get_site)):
+    """
+    Server-sent events stream met een update na elke nieuwe meting
 
-    return stats
+    Na het verbinden volgt direct de huidige state, daarna alleen nog
+    updates als er nieuwe data is (plus af en toe een keepalive).
+    """
+    broadcaster = site.broadcaster
+    queue = broadcaster.subscribe()
 
-@app.get("/api/config")
-async def get_config():
+    async def events():
+        try:
+            yield b"retry: 5000\n\n"
+            yield encode_event('update', site.build_dashboard_update())
+            async for message in broadcaster.stream(queue):
+                if await request.is_disconnected():
+                    break
+                yield message
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@site_api.get("/config")
+async def get_config(site: Site = Depends(get_site)):
     """Haal configuratie op (zonder gevoelige data)"""
+    site_config = site.config
     return {
         "homewizard_p1": {
-            "host": config.homewizard_p1_host,
-            "enabled": config.homewizard_p1_enabled
+            "host": site_config.homewizard_p1_host,
+            "enabled": site_config.homewizard_p1_enabled,
+            "token_configured": bool(site_config.data.get("homewizard_p1", {}).get("token"))
         },
-        "homewizard_kwh_meters": config.homewizard_kwh_meters,
+        "homewizard_kwh_meters": [public_device(meter) for meter in site_config.homewizard_kwh_meters],
         "pvoutput": {
-            "system_id": config.pvoutput_system_id,
-            "api_key_configured": bool(config.pvoutput_api_key)
+            "system_id": site_config.pvoutput_system_id,
+            "api_key_configured": bool(site_config.pvoutput_api_key)
         },
-        "update_interval": config.update_interval
+        "update_interval": site_config.update_interval
     }
 
-@app.post("/api/config")
-async def update_config(new_config: Dict):
+@site_api.post("/config")
+async def update_config(new_config: Dict, site: Site = Depends(get_site)):
     """Update configuratie"""
-    global p1_client, kwh_clients, pvoutput_client
+    require_collector(site)
+    site_config = site.config
 
     # Update config data
     if "homewizard_p1" in new_config:
-        config.data["homewizard_p1"] = new_config["homewizard_p1"]
-        p1_client = None  # Reset client
+        previous = [site_config.data.get("homewizard_p1", {})]
+        site_config.set("homewizard_p1", keep_device_tokens(new_config["homewizard_p1"], previous))
+        site.reset_clients(devices=True)
 
     if "homewizard_kwh_meters" in new_config:
-        config.data["homewizard_kwh_meters"] = new_config["homewizard_kwh_meters"]
-        kwh_clients = {}  # Reset alle kWh clients
+        previous = site_config.homewizard_kwh_meters
+        site_config.set("homewizard_kwh_meters", [
+            keep_device_tokens(meter, previous) for meter in new_config["homewizard_kwh_meters"]
+        ])
+        site.reset_clients(devices=True)
 
     if "pvoutput" in new_config:
-        config.data["pvoutput"] = new_config["pvoutput"]
-        pvoutput_client = None  # Reset client
+        site_config.set("pvoutput", new_config["pvoutput"])
+        site.reset_clients(pvoutput=True)
 
     if "update_interval" in new_config:
-        config.data["update_interval"] = new_config["update_interval"]
+        site_config.set("update_interval", new_config["update_interval"])
+        if site.upload_schedule:
+            site.upload_schedule.set_interval(site_config.update_interval)
 
     # Sla config op
-    config.save()
+    site_config.save()
+    site.state_generation += 1
 
     return {"status": "success", "message": "Configuratie opgeslagen"}
 
-@app.post("/api/update-now")
-async def trigger_update():
-    """Forceer een onmiddellijke data update"""
+@site_api.post("/update-now")
+async def trigger_update(site: Site = Depends(get_site)):
+    """
+    Forceer een onmiddellijke data update
+
+    Loopt er al een cyclus (gepland of van een andere gebruiker), of is de
+    vorige korter dan update_now_min_interval seconden geleden, dan wordt
+    daarop gewacht in plaats van een nieuwe cyclus te starten.
+    """
+    require_collector(site)
+    min_interval = site.config.update_now_min_interval
+    shared = site.cycle_flight.would_join(min_interval)
     try:
-        await collect_and_send_data()
-        return {"status": "success", "message": "Data update uitgevoerd"}
+        await site.cycle_flight.run(site.collect_and_send_data, min_interval=min_interval)
+        message = "Aangesloten bij lopende of recente update" if shared else "Data update uitgevoerd"
+        return {"status": "success", "message": message, "shared": shared}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/weather/current")
-async def get_current_weather():
+@site_api.get("/weather/current")
+async def get_current_weather(site: Site = Depends(get_site)):
     """Haal actuele weather data op"""
-    if not config.weather_enabled:
+    if not site.config.weather_enabled:
         raise HTTPException(status_code=400, detail="Weather integratie niet ingeschakeld")
 
-    if not weather_client:
+    if not site.collects:
+        # Web worker: de laatste weather data van de collector
+        return site.data_manager.latest_weather_data
+
+    if not site.weather_client:
         raise HTTPException(status_code=400, detail="Weather client niet geïnitialiseerd")
 
     try:
-        weather_data = await weather_client.get_weather()
+        weather_data = await site.weather_client.get_weather()
         return weather_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Routes over alle sites
+@app.get("/api/sites")
+async def get_sites():
+    """Overzicht van alle sites met hun dashboard en API pad"""
+    return [
+        {
+            "id": site.id,
+            "name": site.name,
+            "default": site is default_site,
+            "dashboard": f"/sites/{site.id}",
+            "api": f"/api/sites/{site.id}",
+            "pvoutput_system_id": site.config.pvoutput_system_id,
+            "devices": site.build_device_status()
+        }
+        for site in sites.values()
+    ]
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics in het Prometheus text formaat"""
+    for site in sites.values():
+        site.update_metrics()
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/api/diagnostics")
+async def get_diagnostics(limit: int = 10, name: Optional[str] = None, site: Optional[str] = None):
+    """
+    Timing per fase van de laatste cycli
+
+    Elke trace bevat spans voor het uitlezen per apparaat, het wachten op
+    de deadline, het verwerken van samples en de upload naar PVOutput. De
+    summary geeft per fase (en per apparaat) het gemiddelde, p95 en maximum
+    over alle bewaarde cycli. Met site worden alleen de traces van die site
+    getoond.
+    """
+    return {
+        "traces": tracer.recent(max(1, limit), name, site),
+        "summary": tracer.summary()
+    }
+
+@app.post("/api/diagnostics/profile")
+async def profile_cycle(format: str = "json", limit: int = 25, site: Site = Depends(get_site)):
+    """
+    Voer een cyclus uit onder de sampling profiler
+
+    Alleen beschikbaar met diagnostics.profiling_enabled. Met format=collapsed
+    worden de stacks als tekst teruggegeven (invoer voor flamegraph tools).
+    Zonder site_id wordt de standaard site geprofiled.
+    """
+    if not config.diagnostics_profiling_enabled:
+        raise HTTPException(status_code=403, detail="Profiling niet ingeschakeld (diagnostics.profiling_enabled)")
+    require_collector(site)
+
+    profiler = tracing.SamplingProfiler(interval=config.diagnostics_profile_interval / 1000)
+    profiler.start()
+    try:
+        await site.cycle_flight.run(site.collect_and_send_data)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        profiler.stop()
+
+    if format == "collapsed":
+        return Response(content=profiler.collapsed(), media_type="text/plain")
+    result = profiler.to_dict(limit)
+    traces = tracer.recent(1, site=site.id)
+    result["trace"] = traces[0] if traces else None
+    return result
+
+app.include_router(site_api, prefix="/api")
+app.include_router(site_api, prefix="/api/sites/{site_id}")
+
 if __name__ == "__main__":
+    # Meerdere workers zouden elk alle apparaten uitlezen en dubbel uploaden, dat kan alleen zonder collectie
+    workers = config.webserver_workers
+    if workers > 1 and role != 'web':
+        logger.warning("webserver.workers (%s) genegeerd: meerdere workers alleen met APP_ROLE=web", workers)
+        workers = 1
     uvicorn.run(
         "app.main:app",
         host=config.webserver_host,
         port=config.webserver_port,
+        workers=workers,
         reload=False
     )
@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Standaard histogram buckets in seconden, van een snelle lokale request tot een trage upload
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    """Basis van een metric met labels, in het Prometheus text formaat"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} verwacht labels {self.labelnames}, kreeg {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = '') -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def clear(self):
+        """Verwijder alle label combinaties (bijvoorbeeld na een config wijziging)"""
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}"
+        ]
+        return lines + self.samples()
+
+class Counter(_Metric):
+    """Oplopende teller"""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in items]
+
+class Gauge(_Metric):
+    """Waarde die op en neer kan gaan"""
+
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in items]
+
+class Histogram(_Metric):
+    """Verdeling van waarnemingen (meestal duur in seconden) over vaste buckets"""
+
+    type_name = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = state[0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Meet de duur van een blok code"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {count}")
+        return lines
+
+class Registry:
+    """Verzameling metrics die samen geëxporteerd worden"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} bestaat al")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Alle metrics in het Prometheus text formaat (versie 0.0.4)"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4'  # Starlette voegt de charset toe
+
+# HomeWizard apparaten
+DEVICE_POLL_DURATION = REGISTRY.register(Histogram(
+    'homewizard_poll_duration_seconds', 'Duur van het uitlezen van een HomeWizard apparaat', ['device']
+))
+DEVICE_POLLS = REGISTRY.register(Counter(
+    'homewizard_polls_total',
+    'Uitlezingen per HomeWizard apparaat, per resultaat (success, error, timeout, skipped bij open circuit)',
+    ['device', 'result']
+))
+
+DEVICE_CIRCUIT_OPEN = REGISTRY.register(Gauge(
+    'homewizard_circuit_open', 'Circuit breaker per HomeWizard apparaat (0 = dicht, 1 = open of half open)', ['device']
+))
+
+DEVICE_STREAM_CONNECTED = REGISTRY.register(Gauge(
+    'homewizard_stream_connected', 'WebSocket verbinding (API v2) per HomeWizard apparaat (1 = verbonden)', ['device']
+))
+DEVICE_STREAM_MESSAGES = REGISTRY.register(Counter(
+    'homewizard_stream_messages_total', 'Via WebSocket ontvangen metingen per HomeWizard apparaat', ['device']
+))
+
+# Collectie cyclus
+CYCLE_DURATION = REGISTRY.register(Histogram(
+    'collection_cycle_duration_seconds', 'Duur van een volledige collectie cyclus (alle apparaten van een site)', ['site']
+))
+
+# PVOutput
+PVOUTPUT_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'pvoutput_request_duration_seconds', 'Duur van requests naar PVOutput', ['endpoint']
+))
+PVOUTPUT_RESPONSES = REGISTRY.register(Counter(
+    'pvoutput_responses_total', 'Antwoorden van PVOutput per HTTP status (error = geen antwoord)',
+    ['endpoint', 'status']
+))
+PVOUTPUT_OUTBOX_PENDING = REGISTRY.register(Gauge(
+    'pvoutput_outbox_pending', 'Aantal statussen in de PVOutput wachtrij', ['site']
+))
+
+# Weather
+WEATHER_CACHE = REGISTRY.register(Counter(
+    'weather_cache_requests_total', 'Weather opvragingen per cache resultaat (hit, miss, stale)', ['result']
+))
+
+# DataManager
+BUFFER_SAMPLES = REGISTRY.register(Gauge(
+    'datamanager_buffer_samples', 'Aantal samples in de ring buffer', ['site', 'series']
+))
+BUFFER_CAPACITY = REGISTRY.register(Gauge(
+    'datamanager_buffer_capacity', 'Capaciteit van de ring buffer in samples', ['site', 'series']
+))
+BUFFER_MEMORY = REGISTRY.register(Gauge(
+    'datamanager_buffer_memory_bytes', 'Geschat geheugengebruik van de ring buffer', ['site', 'series']
+))
+
+# Web API
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Duur van API requests per route', ['method', 'route']
+))
+HTTP_RESPONSES = REGISTRY.register(Counter(
+    'http_responses_total', 'API antwoorden per route en HTTP status', ['method', 'route', 'status']
+))
@@ -0,0 +1,100 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+class PVOutputOutbox:
+    """
+    Persistente wachtrij van nog niet verstuurde PVOutput statussen (SQLite)
+
+    Elke status hoort bij een datum/tijd slot (d, t). Een nieuwe status voor
+    een slot dat al in de wachtrij staat vervangt de oude, zodat een slot
+    nooit dubbel wordt verstuurd. Mislukte statussen krijgen een volgende
+    poging met exponentiële backoff.
+    """
+
+    def __init__(self, path: str, base_delay: float = 60, max_delay: float = 3600):
+        """
+        Args:
+            path: Pad naar het database bestand (de map wordt aangemaakt)
+            base_delay: Wachttijd in seconden na de eerste mislukte poging
+            max_delay: Maximale wachttijd in seconden tussen pogingen
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " d TEXT NOT NULL,"
+            " t TEXT NOT NULL,"
+            " params TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt REAL NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (d, t))"
+        )
+
+    def put(self, status: Dict):
+        """Zet een status in de wachtrij, een bestaande status voor hetzelfde slot wordt vervangen"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (d, t, params) VALUES (?, ?, ?)"
+                " ON CONFLICT (d, t) DO UPDATE SET params = excluded.params, attempts = 0, next_attempt = 0",
+                (status['d'], status['t'], json.dumps(status))
+            )
+
+    def due(self, limit: int = 30) -> List[Dict]:
+        """Haal de oudste statussen op waarvan de volgende poging nu mag, in tijdsvolgorde"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT params FROM outbox WHERE next_attempt <= ? ORDER BY d, t LIMIT ?",
+                (time.time(), limit)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def remove(self, slots: List[Tuple[str, str]]):
+        """Verwijder verstuurde statussen"""
+        with self._lock:
+            self._conn.executemany("DELETE FROM outbox WHERE d = ? AND t = ?", slots)
+
+    def mark_failed(self, slots: List[Tuple[str, str]]):
+        """Plan een nieuwe poging in met exponentiële backoff"""
+        now = time.time()
+        with self._lock:
+            for d, t in slots:
+                row = self._conn.execute(
+                    "SELECT attempts FROM outbox WHERE d = ? AND t = ?", (d, t)
+                ).fetchone()
+                if row is None:
+                    continue
+                attempts = row[0] + 1
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+                self._conn.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt = ? WHERE d = ? AND t = ?",
+                    (attempts, now + delay, d, t)
+                )
+
+    def prune(self, max_age_days: int = 14) -> int:
+        """
+        Verwijder statussen die PVOutput niet meer accepteert
+
+        PVOutput neemt statussen tot 14 dagen terug aan (90 dagen met donation).
+        """
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime('%Y%m%d')
+        with self._lock:
+            return self._conn.execute("DELETE FROM outbox WHERE d < ?", (cutoff,)).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        """Sluit de database connectie"""
+        with self._lock:
+            self._conn.close()
@@ -1,34 +1,163 @@
 import httpx
-from typing import Optional
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
+from app import metrics, tracing
+from app.outbox import PVOutputOutbox
+
+logger = logging.getLogger(__name__)
+
+# Volgorde van de velden per status in addbatchstatus.jsp
+BATCH_FIELDS = ('d', 't', 'v1', 'v2', 'v3', 'v4', 'v5', 'v6')
+
+class PVOutputRateLimiter:
+    """
+    Token bucket voor PVOutput requests
+
+    PVOutput staat per uur een vast aantal requests toe (60, of 300 met
+    donation). Zonder informatie van de server vult de bucket zich
+    geleidelijk aan (limiet / 3600 per seconde). Zodra PVOutput de
+    X-Rate-Limit-* headers meestuurt is dat leidend: het budget is dan
+    het aantal resterende requests tot het reset moment, waarna het
+    budget weer vol is.
+    """
+
+    def __init__(self, requests_per_hour: int = 60):
+        self.limit = requests_per_hour
+        self.tokens = float(requests_per_hour)
+        self.reset_at: Optional[float] = None  # Epoch seconden, bekend uit de headers
+        self._updated = time.time()
+
+    def _refill(self):
+        now = time.time()
+        if self.reset_at is not None:
+            # Server telt per uur, na het reset moment is het volledige budget weer beschikbaar
+            if now >= self.reset_at:
+                self.tokens = float(self.limit)
+                self.reset_at = None
+        else:
+            self.tokens = min(self.limit, self.tokens + (now - self._updated) * self.limit / 3600)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """Neem een request uit het budget, False als er geen budget is"""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def seconds_until_available(self) -> float:
+        """Seconden tot er weer een request beschikbaar is"""
+        self._refill()
+        if self.tokens >= 1:
+            return 0.0
+        if self.reset_at is not None:
+            return max(0.0, self.reset_at - time.time())
+        return (1 - self.tokens) * 3600 / self.limit
+
+    def update_from_headers(self, headers: httpx.Headers):
+        """Neem de rate limit status van PVOutput over uit de response headers"""
+        try:
+            if 'X-Rate-Limit-Limit' in headers:
+                self.limit = int(headers['X-Rate-Limit-Limit'])
+            if 'X-Rate-Limit-Remaining' in headers:
+                self.tokens = float(headers['X-Rate-Limit-Remaining'])
+            if 'X-Rate-Limit-Reset' in headers:
+                self.reset_at = float(headers['X-Rate-Limit-Reset'])
+            self._updated = time.time()
+        except ValueError:
+            pass
+
+    def mark_exhausted(self):
+        """Budget is op volgens PVOutput (403), wacht tot het reset moment"""
+        self.tokens = 0.0
+        if self.reset_at is None:
+            # Geen reset moment bekend, ga uit van het begin van het volgende uur
+            self.reset_at = (int(time.time()) // 3600 + 1) * 3600
+        self._updated = time.time()
+
+    def status(self) -> Dict:
+        """Huidige status van het budget (voor /api/status)"""
+        self._refill()
+        return {
+            'limit_per_hour': self.limit,
+            'remaining': int(self.tokens),
+            'reset_at': datetime.fromtimestamp(self.reset_at).isoformat() if self.reset_at else None,
+            'available_in_seconds': round(self.seconds_until_available(), 1)
+        }
+
 class PVOutputClient:
     """Client voor PVOutput API communicatie"""
 
-    def __init__(self, api_key: str, system_id: str):
+    def __init__(
+        self,
+        api_key: str,
+        system_id: str,
+        base_url: str = "https://pvoutput.org/service/r2",
+        rate_limiter: Optional[PVOutputRateLimiter] = None
+    ):
         self.api_key = api_key
         self.system_id = system_id
-        self.base_url = "https://pvoutput.org/service/r2"
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
 
     def _get_headers(self) -> dict:
         """Genereer headers voor API requests"""
         return {
             'X-Pvoutput-Apikey': self.api_key,
-            'X-Pvoutput-SystemId': self.system_id
+            'X-Pvoutput-SystemId': self.system_id,
+            'X-Rate-Limit': '1'  # Vraag PVOutput om de rate limit headers mee te sturen
         }
 
-    async def add_status(
-        self,
+    async def _post(self, endpoint: str, data: Dict) -> httpx.Response:
+        """
+        POST naar de PVOutput API en verwerk de rate limit headers
+
+        Raises:
+            httpx.HTTPError bij een netwerkfout of foutstatus van PVOutput
+        """
+        started = time.perf_counter()
+        try:
+            with tracing.span('pvoutput_post', endpoint=endpoint) as record:
+                async with httpx.AsyncClient(timeout=30.0) as client:
+                    response = await client.post(
+                        f"{self.base_url}/{endpoint}",
+                        headers=self._get_headers(),
+                        data=data
+                    )
+                if record is not None:
+                    record['http_status'] = response.status_code
+        except httpx.HTTPError:
+            metrics.PVOUTPUT_RESPONSES.inc(endpoint=endpoint, status='error')
+            raise
+        finally:
+            metrics.PVOUTPUT_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint)
+        metrics.PVOUTPUT_RESPONSES.inc(endpoint=endpoint, status=str(response.status_code))
+
+        if self.rate_limiter:
+            self.rate_limiter.update_from_headers(response.headers)
+            if response.status_code == 403 and 'Exceeded' in response.text:
+                self.rate_limiter.mark_exhausted()
+
+        response.raise_for_status()
+        return response
+
+    @staticmethod
+    def build_status(
         energy_generation: Optional[int] = None,
         power_generation: Optional[int] = None,
         energy_consumption: Optional[int] = None,
         power_consumption: Optional[int] = None,
         temperature: Optional[float] = None,
         voltage: Optional[float] = None,
-        condition: Optional[str] = None
-    ) -> bool:
+        condition: Optional[str] = None,
+        timestamp: Optional[datetime] = None
+    ) -> Dict:
         """
-        Voeg status toe aan PVOutput
+        Bouw de parameters van een PVOutput status
 
         Args:
             energy_generation: Totaal opgewekte energie in Wh (cumulatief voor de dag)
@@ -38,17 +167,15 @@ class PVOutputClient:
             temperature: Temperatuur in C
             voltage: Voltage in V
             condition: Weather condition (Fine, Cloudy, Showers, etc.)
+            timestamp: Tijdstip van de status, default nu
 
         Returns:
-            True als succesvol, False bij fout
+            Dict met d, t en de v1-v6/cd parameters die een waarde hebben
         """
-        now = datetime.now()
-        date_str = now.strftime('%Y%m%d')
-        time_str = now.strftime('%H:%M')
-
+        now = timestamp or datetime.now()
         params = {
-            'd': date_str,
-            't': time_str
+            'd': now.strftime('%Y%m%d'),
+            't': now.strftime('%H:%M')
         }
 
         if energy_generation is not None:
@@ -66,20 +193,83 @@ class PVOutputClient:
         if condition is not None:
             params['cd'] = condition
 
+        return params
+
+    async def add_status(
+        self,
+        energy_generation: Optional[int] = None,
+        power_generation: Optional[int] = None,
+        energy_consumption: Optional[int] = None,
+        power_consumption: Optional[int] = None,
+        temperature: Optional[float] = None,
+        voltage: Optional[float] = None,
+        condition: Optional[str] = None
+    ) -> bool:
+        """
+        Voeg status toe aan PVOutput
+
+        Args:
+            energy_generation: Totaal opgewekte energie in Wh (cumulatief voor de dag)
+            power_generation: Actueel opgewekt vermogen in W
+            energy_consumption: Totaal verbruikte energie in Wh (cumulatief voor de dag)
+            power_consumption: Actueel verbruikt vermogen in W
+            temperature: Temperatuur in C
+            voltage: Voltage in V
+            condition: Weather condition (Fine, Cloudy, Showers, etc.)
+
+        Returns:
+            True als succesvol, False bij fout
+        """
+        params = self.build_status(
+            energy_generation, power_generation, energy_consumption,
+            power_consumption, temperature, voltage, condition
+        )
+
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/addstatus.jsp",
-                    headers=self._get_headers(),
-                    data=params
-                )
-                response.raise_for_status()
-                print(f"PVOutput status toegevoegd: {params}")
-                return True
+            await self.post_status(params)
+            logger.info("PVOutput status toegevoegd: %s", params)
+            return True
         except Exception as e:
-            print(f"Fout bij toevoegen PVOutput status: {e}")
+            logger.error("Fout bij toevoegen PVOutput status: %s", e)
             return False
 
+    async def post_status(self, params: Dict):
+        """
+        Verstuur één status via addstatus.jsp
+
+        Raises:
+            httpx.HTTPError bij een netwerkfout of foutstatus van PVOutput
+        """
+        await self._post("addstatus.jsp", params)
+
+    async def post_batch_status(self, statuses: List[Dict]) -> Dict[Tuple[str, str], bool]:
+        """
+        Verstuur meerdere statussen in één request via addbatchstatus.jsp
+
+        De batch API kent geen weather condition (cd), die wordt weggelaten.
+        Maximaal 30 statussen per request (100 met PVOutput donation).
+
+        Returns:
+            Dict van (datum, tijd) naar True als PVOutput de status heeft toegevoegd
+
+        Raises:
+            httpx.HTTPError bij een netwerkfout of foutstatus van PVOutput
+        """
+        data = ';'.join(
+            ','.join(str(status.get(field, '')) for field in BATCH_FIELDS).rstrip(',')
+            for status in statuses
+        )
+
+        response = await self._post("addbatchstatus.jsp", {'data': data})
+
+        # Antwoord: datum,tijd,1 (toegevoegd) of 0 (niet toegevoegd) per status
+        results = {}
+        for entry in response.text.strip().split(';'):
+            parts = entry.split(',')
+            if len(parts) >= 3:
+                results[(parts[0], parts[1])] = parts[2].strip() == '1'
+        return results
+
     async def get_status(self) -> Optional[dict]:
         """Haal laatste status op van PVOutput"""
         try:
@@ -91,9 +281,99 @@ class PVOutputClient:
                 response.raise_for_status()
                 return response.json()
         except Exception as e:
-            print(f"Fout bij ophalen PVOutput status: {e}")
+            logger.error("Fout bij ophalen PVOutput status: %s", e)
             return None
 
+class PVOutputUploader:
+    """
+    Verstuur statussen via een persistente outbox naar PVOutput
+
+    Statussen worden eerst in de outbox gezet en daarna in batches verstuurd.
+    Mislukt een request, dan blijven de statussen staan en worden ze later
+    (met backoff) opnieuw verstuurd, zodat een storing geen gaten geeft.
+
+    Met een rate limiter op de client wordt alleen verstuurd als er budget
+    is. Is het budget op, dan blijven de statussen in de outbox staan en
+    gaan ze later samen in één batch (coalescing), zonder ooit tegen een
+    403 van PVOutput aan te lopen.
+    """
+
+    def __init__(self, client: PVOutputClient, outbox: PVOutputOutbox, batch_size: int = 30):
+        self.client = client
+        self.outbox = outbox
+        self.batch_size = batch_size
+
+    def enqueue(self, status: Dict):
+        """Zet een status (van PVOutputClient.build_status) in de outbox"""
+        self.outbox.put(status)
+
+    async def flush(self) -> int:
+        """
+        Verstuur alle statussen uit de outbox waarvan de volgende poging nu mag
+
+        Een enkele status gaat via addstatus.jsp (inclusief weather condition),
+        meerdere via addbatchstatus.jsp. Weigert PVOutput een batch (400),
+        dan wordt die gehalveerd tot de ongeldige status alleen verstuurd
+        wordt; alleen die wordt uit de outbox verwijderd.
+
+        Returns:
+            Aantal door PVOutput toegevoegde statussen
+        """
+        added = 0
+        limit = self.batch_size
+        while True:
+            statuses = self.outbox.due(limit)
+            if not statuses:
+                break
+
+            slots = [(status['d'], status['t']) for status in statuses]
+            limiter = self.client.rate_limiter
+            if limiter and not limiter.try_acquire():
+                logger.warning("PVOutput rate limit bereikt, %d status(sen) wachten %.0fs in outbox",
+                               len(self.outbox), limiter.seconds_until_available())
+                break
+
+            try:
+                if len(statuses) == 1:
+                    await self.client.post_status(statuses[0])
+                    results = {slots[0]: True}
+                else:
+                    results = await self.client.post_batch_status(statuses)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 403 and limiter and limiter.tokens < 1:
+                    # Rate limit van PVOutput, geen backoff nodig: de limiter houdt ze vast
+                    logger.warning("PVOutput rate limit bereikt (%d), %d status(sen) in outbox", e.response.status_code, len(self.outbox))
+                    break
+                if e.response.status_code == 400 and len(statuses) > 1:
+                    # Eén ongeldige status laat de hele batch weigeren, halveer tot die geïsoleerd is
+                    limit = len(statuses) // 2
+                    logger.warning("PVOutput weigert batch van %d statussen (%s), opnieuw in batches van %d",
+                                   len(statuses), e.response.text, limit)
+                    continue
+                if e.response.status_code == 400:
+                    # Ongeldige data (bijv. te oud), opnieuw versturen helpt niet
+                    logger.error("PVOutput weigert status %s %s: %s", slots[0][0], slots[0][1], e.response.text)
+                    self.outbox.remove(slots)
+                    limit = self.batch_size
+                    continue
+                logger.error("Fout bij versturen naar PVOutput (%d), %d status(sen) in outbox", e.response.status_code, len(self.outbox))
+                self.outbox.mark_failed(slots)
+                break
+            except Exception as e:
+                logger.error("Fout bij versturen naar PVOutput: %s, %d status(sen) in outbox", e, len(self.outbox))
+                self.outbox.mark_failed(slots)
+                break
+
+            # Status 0 betekent dat PVOutput het slot niet heeft toegevoegd (bijv. al aanwezig)
+            self.outbox.remove(slots)
+            added += sum(results.values())
+            if len(statuses) > 1:
+                logger.info("PVOutput batch verstuurd: %d/%d statussen toegevoegd", sum(results.values()), len(statuses))
+            else:
+                logger.info("PVOutput status toegevoegd: %s", statuses[0])
+
+        return added
+
 class PVOutputDataConverter:
     """Converteer HomeWizard data naar PVOutput formaat"""
 
@@ -102,7 +382,8 @@ class PVOutputDataConverter:
         p1_data: dict,
         kwh_data: dict,
         daily_totals: dict = None,
-        weather_data: dict = None
+        weather_data: dict = None,
+        interval_summary: dict = None
     ) -> dict:
         """
         Converteer HomeWizard data naar PVOutput formaat
@@ -112,6 +393,8 @@ class PVOutputDataConverter:
             kwh_data: Data van kWh meter(s) (zonnepanelen) - kan gecombineerde data zijn
             daily_totals: Dagelijkse totalen (optioneel, voor cumulatieve data)
             weather_data: Weather data (optioneel, voor temperatuur)
+            interval_summary: Gemiddelden over het upload interval (optioneel); als die
+                is opgegeven komen v2 en v4 alleen hieruit en niet uit de momentopname
 
         Returns:
             Dict met PVOutput parameters:
@@ -134,18 +417,26 @@ class PVOutputDataConverter:
         """
         result = {}
 
-        # v2: Actuele opwekking (van kWh meter(s) als beschikbaar)
-        if kwh_data and kwh_data.get('active_power_w') is not None:
-            result['power_generation'] = abs(int(kwh_data.get('active_power_w', 0)))
-
-        # v4: Actueel verbruik berekenen
-        # Verbruik = Opwekking + Grid power
-        # Als grid power negatief is (export), dan is verbruik lager
-        # Als grid power positief is (import), dan is verbruik hoger
-        if p1_data and p1_data.get('active_power_w') is not None:
-            generation = result.get('power_generation', 0)
-            grid_power = p1_data.get('active_power_w', 0)
-            result['power_consumption'] = abs(int(generation + grid_power))
+        if interval_summary is not None:
+            # v2 & v4: Gemiddelde over de samples van het interval. Zonder kWh samples (omvormer
+            # offline of circuit breaker open) geen v2: de laatste meting kan uren oud zijn
+            if interval_summary.get('avg_generation_w') is not None:
+                result['power_generation'] = abs(int(round(interval_summary['avg_generation_w'])))
+            if interval_summary.get('avg_consumption_w') is not None:
+                result['power_consumption'] = abs(int(round(interval_summary['avg_consumption_w'])))
+        else:
+            # v2: Actuele opwekking (van kWh meter(s) als beschikbaar)
+            if kwh_data and kwh_data.get('active_power_w') is not None:
+                result['power_generation'] = abs(int(kwh_data.get('active_power_w', 0)))
+
+            # v4: Actueel verbruik berekenen
+            # Verbruik = Opwekking + Grid power
+            # Als grid power negatief is (export), dan is verbruik lager
+            # Als grid power positief is (import), dan is verbruik hoger
+            if p1_data and p1_data.get('active_power_w') is not None:
+                generation = result.get('power_generation', 0)
+                grid_power = p1_data.get('active_power_w', 0)
+                result['power_consumption'] = abs(int(generation + grid_power))
 
         # v5: Temperature (van weather data)
         if weather_data and weather_data.get('temperature_c') is not None:
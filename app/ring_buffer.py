@@ -0,0 +1,174 @@
+import bisect
+import math
+from array import array
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+class ColumnarRingBuffer:
+    """
+    Ring buffer met vaste capaciteit en één voorgealloceerde array per metriek
+
+    Elke kolom is een typed array ('f' = float32, 'd' = float64) van
+    `capacity` elementen, timestamps worden als epoch seconden (float64)
+    opgeslagen. Ontbrekende waarden zijn NaN. Een sample kost daardoor
+    enkele tientallen bytes in plaats van een volledige dict.
+
+    Logische index 0 is het oudste sample, len(buffer) - 1 het nieuwste.
+    Timestamps zijn altijd oplopend, zodat een tijdvenster met binary search
+    gevonden kan worden.
+    """
+
+    def __init__(self, capacity: int, columns: Dict[str, str]):
+        """
+        Args:
+            capacity: Maximaal aantal samples, daarna wordt het oudste overschreven
+            columns: Dict van kolomnaam naar array typecode ('f' of 'd')
+        """
+        if capacity < 1:
+            raise ValueError(f"Capacity moet minimaal 1 zijn, got {capacity}")
+
+        self.capacity = capacity
+        self.timestamps = array('d', [math.nan]) * capacity
+        self.columns = {name: array(typecode, [math.nan]) * capacity for name, typecode in columns.items()}
+        self._write_index = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> float:
+        """Timestamp op logische index (maakt de buffer bruikbaar voor bisect)"""
+        if not 0 <= index < self._size:
+            raise IndexError(index)
+        return self.timestamps[(self._write_index - self._size + index) % self.capacity]
+
+    def append(self, timestamp: float, values: Dict):
+        """Voeg een sample toe, kolommen die ontbreken in values worden NaN"""
+        # Houd timestamps oplopend, ook als de klok terugspringt (NTP correctie)
+        latest = self.latest_timestamp()
+        if latest is not None and timestamp < latest:
+            timestamp = latest
+
+        i = self._write_index
+        self.timestamps[i] = timestamp
+        for name, column in self.columns.items():
+            value = values.get(name)
+            column[i] = math.nan if value is None else value
+
+        self._write_index = (i + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def clear(self):
+        """Verwijder alle samples (de arrays blijven gealloceerd)"""
+        self._write_index = 0
+        self._size = 0
+
+    def _slice(self, data: array, start: int, stop: int) -> array:
+        """Geef logische slice [start, stop) van een kolom als aaneengesloten array"""
+        begin = (self._write_index - self._size) % self.capacity
+        a = begin + start
+        b = begin + stop
+        if b <= self.capacity:
+            return data[a:b]
+        if a >= self.capacity:
+            return data[a - self.capacity:b - self.capacity]
+        # Slice loopt over het einde van de buffer heen
+        return data[a:] + data[:b - self.capacity]
+
+    def _bounds(self, start: int, stop: Optional[int]) -> Tuple[int, int]:
+        stop = self._size if stop is None else min(stop, self._size)
+        start = max(0, min(start, stop))
+        return start, stop
+
+    def timestamp_slice(self, start: int = 0, stop: Optional[int] = None) -> array:
+        """Timestamps (epoch seconden) van de samples in [start, stop)"""
+        start, stop = self._bounds(start, stop)
+        return self._slice(self.timestamps, start, stop)
+
+    def column(self, name: str, start: int = 0, stop: Optional[int] = None) -> array:
+        """Waarden van een kolom voor de samples in [start, stop)"""
+        start, stop = self._bounds(start, stop)
+        return self._slice(self.columns[name], start, stop)
+
+    def index_at_or_after(self, timestamp: float) -> int:
+        """Logische index van het eerste sample met timestamp >= timestamp (O(log n))"""
+        return bisect.bisect_left(self, timestamp)
+
+    def index_after(self, timestamp: float) -> int:
+        """Logische index van het eerste sample met timestamp > timestamp (O(log n))"""
+        return bisect.bisect_right(self, timestamp)
+
+    def latest_timestamp(self) -> Optional[float]:
+        """Timestamp van het nieuwste sample, None als de buffer leeg is"""
+        if not self._size:
+            return None
+        return self.timestamps[(self._write_index - 1) % self.capacity]
+
+    def oldest_timestamp(self) -> Optional[float]:
+        """Timestamp van het oudste sample, None als de buffer leeg is"""
+        if not self._size:
+            return None
+        return self.timestamps[(self._write_index - self._size) % self.capacity]
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+        """
+        Zet samples in [start, stop) om naar dicts (voor de API)
+
+        Elke dict bevat 'timestamp' (ISO string) en alle kolommen met een
+        waarde. float32 kolommen worden afgerond om representatieruis weg te
+        halen.
+        """
+        start, stop = self._bounds(start, stop)
+        timestamps = self._slice(self.timestamps, start, stop)
+        columns = [
+            (name, self._slice(column, start, stop), column.typecode == 'f')
+            for name, column in self.columns.items()
+        ]
+
+        rows = []
+        for i, timestamp in enumerate(timestamps):
+            row = {'timestamp': datetime.fromtimestamp(timestamp).isoformat()}
+            for name, values, is_float32 in columns:
+                value = values[i]
+                if value == value:  # NaN check
+                    row[name] = round(value, 3) if is_float32 else value
+            rows.append(row)
+        return rows
+
+    def to_state(self) -> Dict:
+        """Kopie van de inhoud in logische volgorde (voor snapshots)"""
+        return {
+            'timestamps': self.timestamp_slice(),
+            'columns': {name: self.column(name) for name in self.columns}
+        }
+
+    def load_state(self, state: Dict):
+        """
+        Vervang de inhoud door een eerder gemaakte state
+
+        Kolommen die niet (meer) bestaan worden genegeerd; past de state niet
+        in de capaciteit, dan worden alleen de nieuwste samples bewaard.
+        """
+        timestamps = state['timestamps']
+        offset = max(0, len(timestamps) - self.capacity)
+        size = len(timestamps) - offset
+
+        # Kopieer hele kolommen in één keer naar het begin van de buffer
+        self.timestamps[0:size] = array('d', timestamps[offset:])
+        for name, column in self.columns.items():
+            values = state['columns'].get(name)
+            if values is None:
+                column[0:size] = array(column.typecode, [math.nan]) * size
+            else:
+                column[0:size] = array(column.typecode, values[offset:])
+
+        self._write_index = size % self.capacity
+        self._size = size
+
+    def memory_bytes(self) -> int:
+        """Geheugengebruik van de voorgealloceerde arrays in bytes"""
+        return sum(
+            column.itemsize * len(column)
+            for column in [self.timestamps, *self.columns.values()]
+        )
@@ -0,0 +1,216 @@
+import asyncio
+import math
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional
+
+class SingleFlight:
+    """
+    Voer een async operatie maximaal één keer tegelijk uit
+
+    Wie run() aanroept terwijl de operatie al loopt, wacht op dezelfde run
+    en krijgt hetzelfde resultaat (of dezelfde exception). Met min_interval
+    wordt binnen zoveel seconden na de vorige run geen nieuwe gestart maar
+    het vorige resultaat teruggegeven.
+    """
+
+    def __init__(self, name: str = ''):
+        self.name = name
+        self._task: Optional[asyncio.Task] = None
+        self._finished_at: Optional[float] = None  # time.monotonic()
+        self._last_result: Any = None
+        self.runs = 0
+        self.joined = 0  # Aanroepen die meeliftten op een lopende of recente run
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def would_join(self, min_interval: float = 0) -> bool:
+        """True als run() nu geen nieuwe operatie zou starten"""
+        return self.running or self._recent(min_interval)
+
+    def _recent(self, min_interval: float) -> bool:
+        return (
+            min_interval > 0
+            and self._finished_at is not None
+            and time.monotonic() - self._finished_at < min_interval
+        )
+
+    async def run(self, func: Callable[[], Awaitable[Any]], min_interval: float = 0) -> Any:
+        """
+        Voer func uit, of sluit aan bij de lopende run
+
+        Een afgebroken aanroeper (bijvoorbeeld een verbroken HTTP request)
+        breekt de gedeelde run niet af.
+        """
+        if self.running:
+            self.joined += 1
+            return await asyncio.shield(self._task)
+
+        if self._recent(min_interval):
+            self.joined += 1
+            return self._last_result
+
+        self.runs += 1
+        self._task = asyncio.create_task(self._execute(func))
+        return await asyncio.shield(self._task)
+
+    async def _execute(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            self._last_result = await func()
+            return self._last_result
+        finally:
+            self._finished_at = time.monotonic()
+
+    async def cancel(self):
+        """Breek een lopende run af en wacht tot die gestopt is (bij het stoppen van de applicatie)"""
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    def status(self) -> dict:
+        return {
+            'running': self.running,
+            'runs': self.runs,
+            'joined': self.joined,
+            'seconds_since_last_run': (
+                round(time.monotonic() - self._finished_at, 1) if self._finished_at is not None else None
+            )
+        }
+
+class AlignedSchedule:
+    """
+    Vast schema op wall-clock grenzen, zonder drift
+
+    Met align=True vallen de runs op veelvouden van het interval vanaf
+    middernacht (lokale tijd), bij 300 seconden dus op :00, :05, :10 enz.
+    (plus een optionele offset). Zonder align is de start van het schema
+    het ankerpunt. De volgende run wordt berekend vanaf het geplande
+    tijdstip en niet vanaf het einde van de vorige run, zodat de duur van
+    een run het schema niet verschuift. Er wordt gewacht met asyncio.sleep
+    (monotone klok) in stappen van maximaal een minuut, zodat een
+    verzette systeemklok snel gecorrigeerd wordt.
+
+    Valt een run uit (omdat de vorige te lang duurde of het systeem sliep),
+    dan bepaalt misfire_policy wat er gebeurt:
+    - 'skip': sla gemiste runs over en wacht op de volgende grens, tenzij
+      de run minder dan misfire_grace seconden te laat is
+    - 'catch_up': voer direct één run uit voor alle gemiste runs samen en
+      ga daarna verder op het schema
+    """
+
+    POLICIES = ('skip', 'catch_up')
+
+    def __init__(
+        self,
+        interval: float,
+        offset: float = 0,
+        align: bool = True,
+        misfire_policy: str = 'skip',
+        misfire_grace: Optional[float] = None
+    ):
+        if misfire_policy not in self.POLICIES:
+            raise ValueError(f"Onbekende misfire_policy '{misfire_policy}', kies uit {self.POLICIES}")
+        self.interval = float(interval)
+        self.offset = offset
+        self.align = align
+        self.misfire_policy = misfire_policy
+        self.misfire_grace = misfire_grace if misfire_grace is not None else min(self.interval / 2, 30)
+        self.missed = 0  # Overgeslagen runs
+        self.last_run: Optional[float] = None  # Gepland tijdstip (epoch) van de laatste run
+        self._anchor = time.time()
+        self._changed: Optional[asyncio.Event] = None
+        self.next_run = self._boundary_after(time.time())
+
+    def _origin(self, timestamp: float) -> float:
+        """Ankerpunt van het schema: lokale middernacht van die dag, of de start van het schema"""
+        if not self.align:
+            return self._anchor
+        return datetime.fromtimestamp(timestamp).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+    def _boundary_after(self, timestamp: float) -> float:
+        """Eerste grens van het schema na timestamp"""
+        origin = self._origin(timestamp) + self.offset
+        steps = math.floor((timestamp - origin) / self.interval) + 1
+        boundary = origin + steps * self.interval
+        # Na middernacht begint een aligned schema opnieuw vanaf de nieuwe dag
+        if self.align:
+            next_origin = self._origin(boundary) + self.offset
+            if next_origin > origin and next_origin > timestamp:
+                boundary = min(boundary, next_origin)
+        return boundary
+
+    def set_interval(self, interval: float):
+        """Wijzig het interval; de volgende run valt op de eerstvolgende grens van het nieuwe schema"""
+        self.interval = float(interval)
+        self.next_run = self._boundary_after(time.time())
+        if self._changed:
+            self._changed.set()
+
+    async def wait(self) -> float:
+        """
+        Wacht tot de volgende geplande run
+
+        Returns:
+            Het geplande tijdstip (epoch seconden)
+        """
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        while True:
+            delay = self.next_run - time.time()
+            if delay <= 0:
+                return self.next_run
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=min(delay, 60))
+            except asyncio.TimeoutError:
+                pass
+
+    def advance(self):
+        """Bepaal de volgende run na een uitgevoerde run, volgens de misfire policy"""
+        now = time.time()
+        self.last_run = self.next_run
+        upcoming = self._boundary_after(self.next_run)
+        if upcoming > now:
+            self.next_run = upcoming
+            return
+
+        # Een of meer grenzen zijn al verstreken
+        latest = upcoming
+        while True:
+            following = self._boundary_after(latest)
+            if following > now:
+                break
+            latest = following
+        skipped = round((latest - upcoming) / self.interval)
+
+        if self.misfire_policy == 'catch_up':
+            self.next_run = latest  # Eén run voor alle gemiste runs samen
+            self.missed += skipped
+        elif now - latest <= self.misfire_grace:
+            self.next_run = latest
+            self.missed += skipped
+        else:
+            self.next_run = self._boundary_after(now)
+            self.missed += skipped + 1
+
+    async def __aiter__(self):
+        """Itereer over de geplande runs: async for scheduled_at in schedule"""
+        while True:
+            yield await self.wait()
+            self.advance()
+
+    def status(self) -> dict:
+        return {
+            'interval': self.interval,
+            'aligned': self.align,
+            'misfire_policy': self.misfire_policy,
+            'next_run': datetime.fromtimestamp(self.next_run).isoformat(timespec='seconds'),
+            'next_run_in_seconds': round(max(0.0, self.next_run - time.time()), 1),
+            'last_run': datetime.fromtimestamp(self.last_run).isoformat(timespec='seconds') if self.last_run else None,
+            'missed_runs': self.missed
+        }
@@ -0,0 +1,44 @@
+import json
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson is optioneel, val terug op de standaard json module
+    orjson = None
+
+def strip_private(value: Any) -> Any:
+    """Verwijder interne keys (beginnend met '_', zoals '_timestamp') uit geneste data"""
+    if isinstance(value, dict):
+        return {
+            key: strip_private(item)
+            for key, item in value.items()
+            if not (isinstance(key, str) and key.startswith('_'))
+        }
+    if isinstance(value, (list, tuple)):
+        return [strip_private(item) for item in value]
+    return value
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def encode_json(data: Any, strip: bool = True) -> bytes:
+    """
+    Encodeer data naar compacte JSON bytes
+
+    Gebruikt orjson als dat geïnstalleerd is (een stuk sneller, vooral op
+    een Raspberry Pi), anders de standaard json module. Datetimes worden
+    ISO strings.
+
+    Args:
+        data: Te encoderen data
+        strip: Interne keys weglaten; uit te zetten voor data die die
+            gegarandeerd niet bevat, zoals rows uit de historie
+    """
+    if strip:
+        data = strip_private(data)
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, separators=(',', ':'), default=_default).encode()
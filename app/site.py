@@ -0,0 +1,836 @@
+import asyncio
+import logging
+import pickle
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+from app import metrics, tracing
+from app.broadcast import EventBroadcaster
+from app.config import SiteConfig
+from app.data_manager import DataManager, P1_COLUMNS, KWH_COLUMNS
+from app.homewizard import DeviceCircuitBreaker, HomeWizardClient, HomeWizardDataProcessor
+from app.homewizard_stream import HomeWizardStream, streaming_available
+from app.outbox import PVOutputOutbox
+from app.pvoutput import PVOutputClient, PVOutputDataConverter, PVOutputRateLimiter, PVOutputUploader
+from app.scheduler import AlignedSchedule, SingleFlight
+from app.snapshot import read_snapshot, write_snapshot
+from app.storage import SQLiteHistoryStore
+from app.weather import OpenMeteoClient
+
+class Site:
+    """
+    Eén installatie: een P1 meter, een groep kWh meters en een PVOutput systeem
+
+    Alle state van een site (DataManager, clients, outbox, schema's en
+    achtergrond taken) zit in deze class, zodat één proces meerdere sites
+    kan bedienen. De HTTP pool, de tracer en de PVOutput rate limiters
+    (per API key) worden gedeeld tussen de sites.
+
+    De rol bepaalt wat de site doet: 'all' verzamelt en uploadt zelf,
+    'collector' publiceert daarnaast de actuele state in de opslag, en 'web'
+    verzamelt niets maar leest die state en de samples uit de opslag, zodat
+    meerdere web workers dezelfde data tonen zonder apparaten uit te lezen.
+    """
+
+    def __init__(
+        self,
+        config: SiteConfig,
+        tracer: tracing.Tracer,
+        rate_limiters: Optional[Dict[str, PVOutputRateLimiter]] = None,
+        role: str = 'all'
+    ):
+        if role != 'all' and not config.storage_enabled:
+            raise ValueError(f"Rol '{role}' vereist storage.enabled, de web workers lezen uit de opslag")
+
+        self.config = config
+        self.role = role
+        self.id = config.id
+        self.name = config.name or config.id
+        self.tracer = tracer
+        self.rate_limiters = rate_limiters if rate_limiters is not None else {}
+        self.logger = logging.getLogger(__name__).getChild(self.id)
+
+        self.data_manager = DataManager(sample_interval=config.sample_interval if config.sampling_enabled else 60)
+        self.data_manager.add_listener(self.on_data_ingested)
+        self.http_client: Optional[httpx.AsyncClient] = None  # Gedeelde HTTP pool, gezet door start()
+        self.p1_client: Optional[HomeWizardClient] = None
+        self.kwh_clients: Dict[str, HomeWizardClient] = {}  # key: host
+        self.streams: Dict[str, HomeWizardStream] = {}  # WebSocket push (API v2) per apparaat met token, key: host
+        self.last_ingest = 0.0  # time.monotonic() van de laatste uitleesronde
+        self._stream_ingest: Optional[asyncio.TimerHandle] = None
+        self.last_kwh_readings: Dict[str, Dict] = {}  # Laatst ontvangen data per kWh meter (key: host)
+        self.pvoutput_client: Optional[PVOutputClient] = None
+        self.pvoutput_outbox: Optional[PVOutputOutbox] = None  # Persistente wachtrij van nog niet verstuurde statussen
+        self.pvoutput_uploader: Optional[PVOutputUploader] = None
+        self.weather_client: Optional[OpenMeteoClient] = None
+        self.weather_disabled = False  # Na een ongeldige weather configuratie
+        self.last_upload_time: Optional[datetime] = None  # Begin van het lopende upload interval
+        self.broadcaster = EventBroadcaster()  # Push van nieuwe metingen naar verbonden dashboards
+        self.push_scheduled = False
+        self.sample_flight = SingleFlight('sample')  # Eén uitleesronde van de apparaten tegelijk
+        self.cycle_flight = SingleFlight('cycle')  # Eén upload cyclus tegelijk (schema en update-now)
+        self.upload_schedule: Optional[AlignedSchedule] = None
+        self.sample_schedule: Optional[AlignedSchedule] = None
+        self.stagger_offset = 0.0  # Seconden na de klokgrens waarop deze site aan de beurt is
+        self.state_generation = 0  # Telt wijzigingen die niet in data_manager.version zitten (configuratie, uploads)
+        self.tasks = []
+        self.published_status: Optional[Dict] = None  # Status van de collector (web worker)
+        self.replica_version: Optional[int] = None  # Versie van de laatst ingelezen state (web worker)
+        self.replica_updated: Optional[datetime] = None
+
+    @property
+    def collects(self) -> bool:
+        """True als dit proces de apparaten uitleest en uploadt (geen web worker)"""
+        return self.role != 'web'
+
+    @property
+    def rate_limiter(self) -> PVOutputRateLimiter:
+        """Rate limiter van het PVOutput account, gedeeld door alle sites met dezelfde API key"""
+        key = self.config.pvoutput_api_key or ''
+        if key not in self.rate_limiters:
+            self.rate_limiters[key] = PVOutputRateLimiter(self.config.pvoutput_requests_per_hour)
+        return self.rate_limiters[key]
+
+    @property
+    def device_count(self) -> int:
+        return len(self.config.homewizard_kwh_meters) + 1
+
+    def reset_clients(self, devices: bool = False, pvoutput: bool = False):
+        """Laat clients opnieuw aanmaken na een configuratie wijziging"""
+        if devices:
+            self.p1_client = None
+            self.kwh_clients = {}
+            if self.http_client is not None:
+                self.start_streams()
+        if pvoutput:
+            self.pvoutput_client = None
+        self.state_generation += 1
+
+    # Status en dashboard
+
+    def build_statistics(self) -> Dict:
+        """Statistieken inclusief de individuele kWh meters"""
+        stats = dict(self.data_manager.get_statistics())  # Gecacht resultaat is read-only
+
+        # Voeg individuele kWh meter data toe als beschikbaar
+        latest_kwh = self.data_manager.latest_kwh_data
+        if latest_kwh and 'meters' in latest_kwh:
+            stats['individual_kwh_meters'] = latest_kwh['meters']
+
+        return stats
+
+    def encoded(self, name: str) -> bytes:
+        """JSON bytes van een hot read endpoint ('latest', 'daily' of 'statistics')"""
+        data_manager = self.data_manager
+        builders = {
+            'latest': data_manager.get_latest_data,
+            'daily': data_manager.get_daily_totals,
+            'statistics': self.build_statistics
+        }
+        return data_manager.get_encoded(name, builders[name])
+
+    def encode_responses(self):
+        """Encodeer de hot read endpoints direct na een ingest, zodat requests alleen de bytes versturen"""
+        for name in ('latest', 'daily', 'statistics'):
+            self.encoded(name)
+
+    def build_device_status(self) -> list:
+        """Gezondheid per HomeWizard apparaat (circuit breaker), None als het nog niet uitgelezen is"""
+        if not self.collects:
+            return (self.published_status or {}).get('devices', [])
+
+        config = self.config
+        devices = []
+        if config.homewizard_p1_enabled and config.homewizard_p1_host:
+            devices.append({
+                "name": "P1 meter",
+                "host": config.homewizard_p1_host,
+                **(self.p1_client.breaker.status() if self.p1_client else {"state": None})
+            })
+        for meter in config.homewizard_kwh_meters_enabled:
+            client = self.kwh_clients.get(meter['host'])
+            devices.append({
+                "name": meter.get('name', meter['host']),
+                "host": meter['host'],
+                **(client.breaker.status() if client else {"state": None})
+            })
+        for device in devices:
+            stream = self.streams.get(device['host'])
+            device["stream"] = stream.status() if stream else None
+        return devices
+
+    def build_status(self) -> Dict:
+        """Actuele status van de site en configuratie"""
+        if not self.collects:
+            # Web worker: de status zoals de collector die gepubliceerd heeft
+            return {
+                **(self.published_status or {"status": "waiting", "site": {"id": self.id, "name": self.name}}),
+                "role": self.role,
+                "collector_synced_at": self.replica_updated.isoformat() if self.replica_updated else None
+            }
+
+        config = self.config
+        kwh_meters = config.homewizard_kwh_meters_enabled
+        return {
+            "status": "running",
+            "role": self.role,
+            "site": {"id": self.id, "name": self.name},
+            "devices": self.build_device_status(),
+            "cycle": self.cycle_flight.status(),
+            "schedule": {
+                "upload": self.upload_schedule.status() if self.upload_schedule else None,
+                "sampling": (
+                    self.sample_schedule.status() if self.sample_schedule and config.sampling_enabled else None
+                )
+            },
+            "config": {
+                "p1_enabled": config.homewizard_p1_enabled,
+                "kwh_enabled": len(kwh_meters) > 0,
+                "kwh_meter_count": len(kwh_meters),
+                "pvoutput_configured": bool(config.pvoutput_api_key and config.pvoutput_system_id),
+                "pvoutput_outbox_pending": len(self.pvoutput_outbox) if self.pvoutput_outbox else 0,
+                "pvoutput_rate_limit": self.rate_limiter.status(),
+                "update_interval": config.update_interval,
+                "sample_interval": config.sample_interval if config.sampling_enabled else None
+            }
+        }
+
+    def build_dashboard_update(self) -> Dict:
+        """Compacte update voor het dashboard: actuele waarden, dagtotalen en het nieuwste grafiekpunt"""
+        data_manager = self.data_manager
+        latest = data_manager.get_latest_data()
+        return {
+            'version': data_manager.version,
+            'last_update': latest['last_update'],
+            'statistics': self.build_statistics(),
+            'daily': data_manager.get_daily_totals(),
+            'point': {
+                'timestamp': latest['last_update'],
+                'p1_power_w': data_manager.latest_p1_data.get('active_power_w'),
+                'kwh_power_w': data_manager.latest_kwh_data.get('active_power_w')
+            }
+        }
+
+    def publish_update(self):
+        """Serialiseer de update één keer en stuur deze naar alle dashboards"""
+        self.push_scheduled = False
+        if self.broadcaster.client_count:
+            self.broadcaster.publish('update', self.build_dashboard_update())
+
+    def on_data_ingested(self, series: str):
+        """
+        Plan een push na een nieuwe meting
+
+        P1, kWh en weather uit dezelfde cyclus komen direct na elkaar binnen;
+        de push wordt pas na de cyclus verstuurd zodat dat één update is.
+        Zonder verbonden dashboards wordt er niets gedaan.
+        """
+        if self.push_scheduled or not self.broadcaster.client_count:
+            return
+        self.push_scheduled = True
+        asyncio.get_running_loop().call_soon(self.publish_update)
+
+    # Verzamelen
+
+    async def fetch_p1_data(self) -> Dict:
+        """Haal P1 data op en verwerk deze"""
+        if not self.p1_client:
+            self.p1_client = HomeWizardClient(
+                self.config.homewizard_p1_host,
+                self.http_client,
+                DeviceCircuitBreaker(**self.config.homewizard_breaker_settings)
+            )
+
+        with tracing.span('fetch', device='p1'):
+            raw_p1_data = self._streamed(self.config.homewizard_p1_host) or await self.p1_client.get_data()
+            return HomeWizardDataProcessor.process_p1_data(raw_p1_data)
+
+    async def fetch_kwh_meter_data(self, meter: Dict) -> Dict:
+        """Haal data op van een enkele kWh meter en verwerk deze"""
+        meter_host = meter.get('host')
+        meter_name = meter.get('name', meter_host)
+
+        # Maak client aan als deze nog niet bestaat
+        if meter_host not in self.kwh_clients:
+            self.kwh_clients[meter_host] = HomeWizardClient(
+                meter_host, self.http_client, DeviceCircuitBreaker(**self.config.homewizard_breaker_settings)
+            )
+
+        with tracing.span('fetch', device=meter_name):
+            raw_kwh_data = self._streamed(meter_host) or await self.kwh_clients[meter_host].get_data()
+            processed_data = HomeWizardDataProcessor.process_kwh_data(raw_kwh_data)
+        if not processed_data:
+            return {}
+
+        # Voeg meter naam toe aan data
+        processed_data['meter_name'] = meter_name
+        processed_data['meter_host'] = meter_host
+        return processed_data
+
+    def _streamed(self, host: str) -> Optional[Dict]:
+        """Laatste gepushte meting van een apparaat, None als er geen actuele stream is (dan API v1)"""
+        stream = self.streams.get(host)
+        if stream and stream.fresh:
+            return dict(stream.latest)
+        return None
+
+    # WebSocket streams (API v2)
+
+    def _stream_devices(self) -> Dict[str, Dict]:
+        """Ingeschakelde apparaten met een token, per host"""
+        config = self.config
+        devices = {}
+        if config.homewizard_p1_enabled and config.homewizard_p1_host:
+            devices[config.homewizard_p1_host] = config.data.get('homewizard_p1', {})
+        for meter in config.homewizard_kwh_meters_enabled:
+            devices[meter['host']] = meter
+        return {host: device for host, device in devices.items() if device.get('token')}
+
+    def start_streams(self):
+        """(Her)start een WebSocket stream voor elk apparaat met een token"""
+        for stream in self.streams.values():
+            stream.close()
+        self.streams = {}
+
+        devices = self._stream_devices()
+        if not devices or not self.config.homewizard_stream_enabled:
+            return
+        if not streaming_available():
+            self.logger.warning("Package 'websockets' niet geïnstalleerd, %s apparaat/apparaten via API v1", len(devices))
+            return
+
+        for host, device in devices.items():
+            stream = HomeWizardStream(
+                host,
+                device['token'],
+                on_message=self.on_stream_message,
+                url=device.get('stream_url'),
+                **self.config.homewizard_stream_settings
+            )
+            stream.start()
+            self.streams[host] = stream
+
+    @property
+    def stream_driven(self) -> bool:
+        """True als elk ingeschakeld apparaat actuele metingen pusht; dan sturen de streams de samples"""
+        config = self.config
+        hosts = [meter['host'] for meter in config.homewizard_kwh_meters_enabled]
+        if config.homewizard_p1_enabled and config.homewizard_p1_host:
+            hosts.append(config.homewizard_p1_host)
+        return bool(hosts) and all(host in self.streams and self.streams[host].fresh for host in hosts)
+
+    def on_stream_message(self, host: str):
+        """
+        Plan een uitleesronde na een gepushte meting
+
+        Alleen als alle apparaten pushen, en maximaal eens per sample interval:
+        de ronde gebruikt dan direct de gepushte metingen, zonder requests.
+        Anders blijft de sampling loop de samples verzamelen.
+        """
+        if self._stream_ingest is not None or not self.config.sampling_enabled or not self.stream_driven:
+            return
+        delay = max(0.0, self.last_ingest + self.config.sample_interval - time.monotonic())
+        self._stream_ingest = asyncio.get_running_loop().call_later(delay, self._ingest_streamed)
+
+    def _ingest_streamed(self):
+        self._stream_ingest = None
+        self.tasks = [task for task in self.tasks if not task.done()]
+        self.tasks.append(asyncio.create_task(self._collect_streamed()))
+
+    async def _collect_streamed(self):
+        try:
+            await self.collect_data()
+        except Exception as e:
+            self.logger.exception("Fout bij verwerken gepushte metingen: %s", e)
+
+    @property
+    def weather_enabled(self) -> bool:
+        config = self.config
+        return (
+            config.weather_enabled and not self.weather_disabled
+            and bool(config.weather_latitude and config.weather_longitude)
+        )
+
+    async def fetch_weather_data(self) -> Dict:
+        """Haal weather data op (uit cache als die nog geldig is)"""
+        if not self.weather_client:
+            try:
+                self.weather_client = OpenMeteoClient(
+                    self.config.weather_latitude,
+                    self.config.weather_longitude,
+                    cache_duration=self.config.weather_cache_duration_minutes
+                )
+            except ValueError as e:
+                self.logger.error("Fout bij initialiseren weather client: %s", e)
+                self.weather_disabled = True  # Geen weather bij een ongeldige configuratie
+                return {}
+
+        with tracing.span('fetch', device='weather'):
+            return await self.weather_client.get_weather()
+
+    async def collect_data(self) -> Tuple[Dict, Dict, Dict]:
+        """
+        Verzamel een sample van alle apparaten en sla deze op in de DataManager
+
+        Loopt er al een uitleesronde (bijvoorbeeld van de sampling loop), dan
+        wordt het resultaat daarvan gebruikt in plaats van alle apparaten
+        nogmaals uit te lezen.
+
+        Returns:
+            Tuple met (p1_data, kwh_data, weather_data)
+        """
+        return await self.sample_flight.run(self._collect_data)
+
+    async def _collect_data(self) -> Tuple[Dict, Dict, Dict]:
+        """Lees alle apparaten tegelijk uit, met een deadline voor de hele ronde"""
+        config = self.config
+        logger = self.logger
+        with self.tracer.cycle('collect', site=self.id):
+            cycle_started = time.perf_counter()
+            self.last_ingest = time.monotonic()
+
+            # Start alle apparaten tegelijk, met een totale deadline voor de hele cyclus
+            tasks = {}
+            if config.homewizard_p1_enabled and config.homewizard_p1_host:
+                tasks[asyncio.create_task(self.fetch_p1_data())] = ('p1', None)
+
+            for meter in config.homewizard_kwh_meters_enabled:
+                tasks[asyncio.create_task(self.fetch_kwh_meter_data(meter))] = ('kwh', meter)
+
+            if self.weather_enabled:
+                tasks[asyncio.create_task(self.fetch_weather_data())] = ('weather', None)
+
+            if tasks:
+                with tracing.span('wait', devices=len(tasks)):
+                    await asyncio.wait(tasks, timeout=config.cycle_deadline)
+
+            # Apparaten die te laat zijn worden afgebroken, de rest levert een gedeeltelijk resultaat
+            p1_data = {}
+            kwh_data_list = []
+            missed_meters = []
+            weather_data = {}
+
+            for task, (kind, meter) in tasks.items():
+                name = meter.get('name', meter.get('host')) if meter else kind
+                result = {}
+
+                if not task.done():
+                    task.cancel()
+                    if kind != 'weather':
+                        host = meter['host'] if meter else config.homewizard_p1_host
+                        metrics.DEVICE_POLLS.inc(device=host, result='timeout')
+                    logger.warning("Deadline van %ss verstreken voor '%s', overgeslagen deze cyclus",
+                                   config.cycle_deadline, name, extra={'device': name})
+                elif task.exception():
+                    if kind == 'weather':
+                        logger.warning("Fout bij ophalen weather data: %s (niet-fataal, doorgaan zonder weather)",
+                                       task.exception(), extra={'device': 'weather'})
+                    else:
+                        logger.warning("Fout bij ophalen data van '%s': %s", name, task.exception(),
+                                       extra={'device': name})
+                else:
+                    result = task.result()
+
+                if kind == 'p1':
+                    p1_data = result
+                elif kind == 'weather':
+                    weather_data = result
+                elif result:
+                    self.last_kwh_readings[meter['host']] = result
+                    kwh_data_list.append(result)
+                    logger.debug("kWh data verzameld van '%s': %sW", name, result.get('active_power_w', 0))
+                else:
+                    # Gebruik laatst bekende meterstand zodat het totaal niet terugvalt
+                    missed_meters.append(self.last_kwh_readings.get(meter['host']) or {
+                        'meter_name': name,
+                        'meter_host': meter['host']
+                    })
+
+            # Verwerk en bewaar de samples
+            data_manager = self.data_manager
+            with tracing.span('ingest'):
+                if p1_data:
+                    data_manager.add_p1_data(p1_data)
+                    logger.debug("P1 data verzameld: %sW", p1_data.get('active_power_w', 0))
+
+                # Combineer data van alle kWh meters
+                kwh_data = {}
+                if kwh_data_list:
+                    kwh_data = HomeWizardDataProcessor.combine_kwh_data(kwh_data_list, missed_meters)
+                    data_manager.add_kwh_data(kwh_data)
+                    logger.debug("Totaal kWh data (alle meters): %sW van %s meter(s)",
+                                 kwh_data.get('active_power_w', 0), kwh_data.get('meter_count', 0))
+                    if kwh_data.get('missed_meters'):
+                        logger.debug("kWh meters zonder data deze cyclus: %s", ', '.join(kwh_data['missed_meters']))
+
+                if weather_data:
+                    data_manager.add_weather_data(weather_data)
+                    logger.debug("Weather data verzameld: %s°C, %s",
+                                 weather_data.get('temperature_c'), weather_data.get('weather_condition'))
+
+            if p1_data or kwh_data or weather_data:
+                with tracing.span('encode'):
+                    self.encode_responses()
+
+            metrics.CYCLE_DURATION.observe(time.perf_counter() - cycle_started, site=self.id)
+            return p1_data, kwh_data, weather_data
+
+    # Upload
+
+    async def send_to_pvoutput(self, p1_data: Dict, kwh_data: Dict, weather_data: Dict, slot: Optional[datetime] = None):
+        """
+        Stuur de data van het afgelopen upload interval naar PVOutput
+
+        Args:
+            slot: Gepland tijdstip van de status, zodat een late upload in het
+                juiste PVOutput slot valt (default nu)
+        """
+        config = self.config
+        if not (config.pvoutput_api_key and config.pvoutput_system_id):
+            return
+
+        if not self.pvoutput_outbox:
+            self.pvoutput_outbox = PVOutputOutbox(config.pvoutput_outbox_path)
+
+        if not self.pvoutput_client:
+            self.pvoutput_client = PVOutputClient(
+                config.pvoutput_api_key, config.pvoutput_system_id, rate_limiter=self.rate_limiter
+            )
+            self.pvoutput_uploader = PVOutputUploader(self.pvoutput_client, self.pvoutput_outbox, config.pvoutput_batch_size)
+
+        with self.tracer.cycle('upload', site=self.id):
+            # Haal dagelijkse totalen en gemiddelden/pieken sinds de vorige upload op
+            with tracing.span('prepare'):
+                daily_totals = self.data_manager.get_daily_totals()
+                interval_summary = self.data_manager.get_interval_summary(self.interval_start())
+            self.last_upload_time = datetime.now()
+
+            # Converteer naar PVOutput formaat (met dagelijkse totalen, interval gemiddelden en weather data)
+            pvoutput_data = PVOutputDataConverter.convert_to_pvoutput(
+                p1_data, kwh_data, daily_totals, weather_data, interval_summary
+            )
+
+            if pvoutput_data:
+                self.pvoutput_uploader.enqueue(PVOutputClient.build_status(
+                    energy_generation=pvoutput_data.get('energy_generation'),
+                    power_generation=pvoutput_data.get('power_generation'),
+                    energy_consumption=pvoutput_data.get('energy_consumption'),
+                    power_consumption=pvoutput_data.get('power_consumption'),
+                    temperature=pvoutput_data.get('temperature'),
+                    voltage=pvoutput_data.get('voltage'),
+                    condition=pvoutput_data.get('condition'),
+                    timestamp=slot
+                ))
+                self.logger.info("Data naar PVOutput outbox: %s (%s samples)",
+                                 pvoutput_data, interval_summary.get('sample_count', 0))
+
+            # Verstuur deze status en eventuele achterstand van eerdere storingen
+            with tracing.span('flush', pending=len(self.pvoutput_outbox)):
+                self.pvoutput_outbox.prune()
+                await self.pvoutput_uploader.flush()
+            self.state_generation += 1
+
+    def interval_start(self) -> datetime:
+        """
+        Begin van het lopende upload interval
+
+        Nooit verder terug dan update_interval: na een (her)start is er nog
+        geen vorige upload, en de historie uit de snapshot mag niet in het
+        gemiddelde van de eerste upload terechtkomen.
+        """
+        earliest = datetime.now() - timedelta(seconds=self.config.update_interval)
+        if self.last_upload_time is None or self.last_upload_time < earliest:
+            return earliest
+        return self.last_upload_time
+
+    async def collect_and_send_data(self, slot: Optional[datetime] = None):
+        """Verzamel data van HomeWizard en stuur naar PVOutput"""
+        with self.tracer.cycle('collect_and_send', site=self.id):
+            p1_data, kwh_data, weather_data = await self.collect_data()
+            await self.send_to_pvoutput(p1_data, kwh_data, weather_data, slot=slot)
+
+    async def scheduled_cycle(self, slot: Optional[datetime] = None):
+        """Eén geplande upload cyclus"""
+        if self.config.sampling_enabled:
+            # Samples komen van de sampling loop, stuur alleen de laatste data door
+            await self.send_to_pvoutput(
+                self.data_manager.latest_p1_data,
+                self.data_manager.latest_kwh_data,
+                self.data_manager.latest_weather_data,
+                slot=slot
+            )
+        else:
+            await self.collect_and_send_data(slot)
+
+    # Achtergrond taken
+
+    async def sampling_loop(self):
+        """Achtergrond taak die met hoge frequentie samples verzamelt voor dashboard en historie"""
+        async for _ in self.sample_schedule:
+            if self.stream_driven:
+                continue  # De WebSocket streams leveren de samples
+            try:
+                await self.collect_data()
+            except Exception as e:
+                self.logger.exception("Fout in sampling: %s", e)
+
+    async def scheduled_update_loop(self):
+        """Achtergrond taak die op vaste momenten (bijvoorbeeld :00, :05, :10) data verstuurt"""
+        async for scheduled_at in self.upload_schedule:
+            # Het PVOutput slot is de klokgrens, zonder de spreiding tussen sites
+            slot = datetime.fromtimestamp(scheduled_at - self.stagger_offset)
+            try:
+                await self.cycle_flight.run(lambda: self.scheduled_cycle(slot))
+            except Exception as e:
+                self.logger.exception("Fout in scheduled update: %s", e)
+
+    async def storage_loop(self):
+        """Achtergrond taak die gebufferde samples in batches naar de persistente opslag schrijft"""
+        last_prune = 0
+        while True:
+            await asyncio.sleep(self.config.storage_flush_interval)
+            try:
+                await asyncio.to_thread(self.data_manager.flush)
+
+                # Ruim eens per uur samples buiten de bewaartermijn op
+                if time.time() - last_prune > 3600:
+                    cutoff = time.time() - self.config.storage_retention_days * 86400
+                    await asyncio.to_thread(self.data_manager.store.prune, cutoff)
+                    last_prune = time.time()
+            except Exception as e:
+                self.logger.exception("Fout bij wegschrijven historie: %s", e)
+
+    def snapshot_state(self) -> Dict:
+        """State voor een snapshot: de DataManager plus het begin van het lopende upload interval"""
+        state = self.data_manager.to_snapshot()
+        state['last_upload_time'] = self.last_upload_time
+        return state
+
+    def restore_snapshot(self, state: Dict):
+        """
+        Herstel de state uit een snapshot van snapshot_state()
+
+        Het begin van het upload interval wordt samen met de historie
+        hersteld, maximaal update_interval terug, zodat de eerste upload na
+        de herstart niet over de hele herstelde historie middelt.
+        """
+        self.data_manager.restore_snapshot(state)
+        last_upload_time = state.get('last_upload_time')
+        if last_upload_time is not None:
+            earliest = datetime.now() - timedelta(seconds=self.config.update_interval)
+            self.last_upload_time = max(last_upload_time, earliest)
+
+    async def snapshot_loop(self):
+        """Achtergrond taak die periodiek een snapshot van de DataManager state maakt"""
+        while True:
+            await asyncio.sleep(self.config.snapshot_interval)
+            try:
+                state = self.snapshot_state()
+                await asyncio.to_thread(write_snapshot, self.config.snapshot_path, state)
+            except Exception as e:
+                self.logger.exception("Fout bij maken snapshot: %s", e)
+
+    # Collector en web workers
+
+    def _publish_state(self, payload: bytes):
+        """Schrijf de gebufferde samples en daarna de state weg (in een worker thread)"""
+        self.data_manager.flush()
+        self.data_manager.store.write_state('live', time.time_ns(), payload)
+
+    async def publish_loop(self):
+        """
+        Achtergrond taak van de collector die de actuele state publiceert
+
+        Alleen na een wijziging (nieuwe meting, upload of configuratie) wordt
+        er geschreven, maximaal eens per storage.sync_interval_seconds. De
+        samples gaan tegelijk naar de opslag, zodat web workers de grafiek
+        niet pas na de volgende flush bijwerken.
+        """
+        published = None
+        while True:
+            await asyncio.sleep(self.config.storage_sync_interval)
+            current = (self.data_manager.version, self.state_generation)
+            if current == published:
+                continue
+            try:
+                payload = pickle.dumps({
+                    'data': self.data_manager.to_live_state(),
+                    'status': self.build_status(),
+                    'last_upload_time': self.last_upload_time,
+                    'state_generation': self.state_generation
+                }, protocol=pickle.HIGHEST_PROTOCOL)
+                await asyncio.to_thread(self._publish_state, payload)
+                published = current
+            except Exception as e:
+                self.logger.exception("Fout bij publiceren state: %s", e)
+
+    def _read_replica(self) -> Optional[Tuple[int, Dict, Dict]]:
+        """
+        Lees een nieuwe state en de nieuwe samples van de collector (in een worker thread)
+
+        Returns:
+            (version, state, samples per reeks), of None als er niets nieuws is
+        """
+        data_manager = self.data_manager
+        if data_manager.store is None:
+            try:
+                data_manager.store = SQLiteHistoryStore(
+                    self.config.storage_path, {'p1': P1_COLUMNS, 'kwh': KWH_COLUMNS}, readonly=True
+                )
+            except FileNotFoundError:
+                return None
+
+        version = data_manager.store.state_version('live')
+        if version is None or version == self.replica_version:
+            return None
+        version, payload = data_manager.store.read_state('live')
+
+        samples = {}
+        oldest = time.time() - data_manager.max_history_hours * 3600
+        for series, history in (('p1', data_manager.p1_history), ('kwh', data_manager.kwh_history)):
+            latest = history.latest_timestamp()
+            samples[series] = data_manager.store.query_since(series, latest if latest is not None else oldest)
+        return version, pickle.loads(payload), samples
+
+    async def replica_loop(self):
+        """Achtergrond taak van een web worker die de state van de collector inleest"""
+        waiting_logged = False
+        while True:
+            try:
+                result = await asyncio.to_thread(self._read_replica)
+                if result:
+                    version, state, samples = result
+                    for series, rows in samples.items():
+                        self.data_manager.append_samples(series, rows)
+                    self.last_upload_time = state['last_upload_time']
+                    self.state_generation = state['state_generation']
+                    self.published_status = state['status']
+                    self.replica_version = version
+                    self.replica_updated = datetime.now()
+                    self.data_manager.apply_live_state(state['data'])
+                    self.encode_responses()
+                elif self.data_manager.store is None and not waiting_logged:
+                    self.logger.warning("Nog geen data van de collector in %s, wachten...", self.config.storage_path)
+                    waiting_logged = True
+            except Exception as e:
+                self.logger.warning("Fout bij inlezen state van de collector: %s", e)
+            await asyncio.sleep(self.config.storage_sync_interval)
+
+    async def start(self, http_client: Optional[httpx.AsyncClient], index: int = 0, count: int = 1):
+        """
+        Herstel de state en start de achtergrond taken van deze site
+
+        Een web worker start alleen het inlezen van de state van de collector.
+
+        Args:
+            http_client: Gedeelde HTTP pool voor alle HomeWizard apparaten
+                (None voor een web worker)
+            index: Positie van deze site; met count bepaalt die de spreiding
+                van de uploads en samples over het interval, zodat niet alle
+                sites tegelijk apparaten uitlezen en naar PVOutput sturen
+            count: Totaal aantal sites
+        """
+        config = self.config
+        if not self.collects:
+            self.tasks.append(asyncio.create_task(self.replica_loop()))
+            self.logger.info("Web worker: data van de collector uit %s", config.storage_path)
+            return
+
+        self.http_client = http_client
+        self.p1_client = None
+        self.kwh_clients = {}
+
+        # Herstel state van voor de herstart
+        if config.snapshot_enabled:
+            started = time.perf_counter()
+            state = read_snapshot(config.snapshot_path)
+            if state:
+                self.restore_snapshot(state)
+                self.logger.info("Snapshot hersteld in %.0fms", (time.perf_counter() - started) * 1000)
+
+        # Open persistente opslag van de historie
+        if config.storage_enabled:
+            self.data_manager.store = SQLiteHistoryStore(
+                config.storage_path, {'p1': P1_COLUMNS, 'kwh': KWH_COLUMNS}
+            )
+            self.tasks.append(asyncio.create_task(self.storage_loop()))
+            self.logger.info("Historie opslag geopend: %s (bewaartermijn %s dagen)",
+                             config.storage_path, config.storage_retention_days)
+
+        # Start achtergrond taken op een vast schema, per site verschoven binnen het spreidingsvenster
+        stagger_window = config.schedule_stagger_seconds
+        if stagger_window is None:
+            stagger_window = min(config.update_interval, 60)
+        self.stagger_offset = stagger_window * index / count
+        self.upload_schedule = AlignedSchedule(
+            config.update_interval,
+            offset=config.schedule_upload_offset + self.stagger_offset,
+            align=config.schedule_align,
+            misfire_policy=config.schedule_misfire_policy,
+            misfire_grace=config.schedule_misfire_grace
+        )
+        sample_interval = config.sample_interval or config.update_interval
+        self.sample_schedule = AlignedSchedule(
+            sample_interval, offset=sample_interval * index / count, align=config.schedule_align
+        )
+
+        if config.sampling_enabled:
+            self.tasks.append(asyncio.create_task(self.sampling_loop()))
+            self.logger.info("Sampling gestart (interval: %ss)", config.sample_interval)
+
+        self.start_streams()
+
+        self.tasks.append(asyncio.create_task(self.scheduled_update_loop()))
+        self.logger.info(
+            "Scheduled updates gestart (interval: %ss, eerste upload om %s)",
+            config.update_interval, self.upload_schedule.status()['next_run']
+        )
+
+        if config.snapshot_enabled:
+            self.tasks.append(asyncio.create_task(self.snapshot_loop()))
+
+        if self.role == 'collector':
+            self.tasks.append(asyncio.create_task(self.publish_loop()))
+
+    async def stop(self):
+        """Stop de achtergrond taken en schrijf de state weg"""
+        if self._stream_ingest is not None:
+            self._stream_ingest.cancel()
+            self._stream_ingest = None
+        for stream in self.streams.values():
+            await stream.stop()
+        for task in self.tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self.tasks = []
+        for flight in (self.sample_flight, self.cycle_flight):
+            await flight.cancel()
+
+        # Bewaar de state voor de volgende start
+        if self.config.snapshot_enabled and self.collects:
+            write_snapshot(self.config.snapshot_path, self.snapshot_state())
+
+        # Schrijf de laatste samples weg en sluit de opslag
+        if self.data_manager.store:
+            self.data_manager.flush()
+            self.data_manager.store.close()
+
+        if self.pvoutput_outbox:
+            self.pvoutput_outbox.close()
+
+    def update_metrics(self):
+        """Zet de gauges van deze site voor /metrics"""
+        data_manager = self.data_manager
+        for series, history in (('p1', data_manager.p1_history), ('kwh', data_manager.kwh_history)):
+            metrics.BUFFER_SAMPLES.set(len(history), site=self.id, series=series)
+            metrics.BUFFER_CAPACITY.set(history.capacity, site=self.id, series=series)
+            metrics.BUFFER_MEMORY.set(history.memory_bytes(), site=self.id, series=series)
+        metrics.PVOUTPUT_OUTBOX_PENDING.set(len(self.pvoutput_outbox) if self.pvoutput_outbox else 0, site=self.id)
+        for client in ([self.p1_client] if self.p1_client else []) + list(self.kwh_clients.values()):
+            metrics.DEVICE_CIRCUIT_OPEN.set(int(client.breaker.state != DeviceCircuitBreaker.CLOSED), device=client.host)
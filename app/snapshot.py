@@ -0,0 +1,54 @@
+import logging
+import os
+import pickle
+import struct
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Header: magic + formaat versie, zodat een oud of vreemd bestand herkend wordt
+SNAPSHOT_MAGIC = b'HWPV'
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct('<4sH')
+
+def write_snapshot(path: str, state: Dict):
+    """
+    Schrijf een snapshot atomisch naar disk
+
+    Eerst wordt naar een tijdelijk bestand geschreven en gesynct, daarna
+    vervangt os.replace het oude bestand. Een crash tijdens het schrijven
+    laat dus altijd een volledige (oude of nieuwe) snapshot achter.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    payload = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION) + pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_snapshot(path: str) -> Optional[Dict]:
+    """
+    Lees een snapshot van disk
+
+    Returns:
+        De opgeslagen state, of None als er geen (bruikbare) snapshot is
+    """
+    try:
+        with open(path, 'rb') as f:
+            payload = f.read()
+    except FileNotFoundError:
+        return None
+
+    try:
+        magic, version = _HEADER.unpack_from(payload)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            logger.warning("Snapshot %s heeft een onbekend formaat (versie %s), wordt genegeerd", path, version)
+            return None
+        return pickle.loads(payload[_HEADER.size:])
+    except Exception as e:
+        logger.error("Fout bij lezen snapshot %s: %s", path, e)
+        return None
@@ -1,6 +1,15 @@
 // Globale variabelen
+const API_BASE = document.body.dataset.apiBase || '/api';  // /api/sites/<id> voor een specifieke site
 let powerChart = null;
 let updateInterval = null;
+let statusInterval = null;
+let eventSource = null;
+let lastVersion = null;
+let lastChartUpdate = null;
+let chartTimestamps = [];
+
+// Maximaal aantal punten in de grafiek, de server downsampled de rest
+const CHART_MAX_POINTS = 500;
 
 // Initialize Chart.js
 function initChart() {
@@ -119,143 +128,270 @@ function updateIndividualMeters(meters) {
     });
 }
 
+// Toon dagelijkse totalen
+function renderDailyTotals(daily) {
+    document.getElementById('daily-generation').textContent =
+        (daily.energy_generation_wh / 1000).toFixed(2);
+    document.getElementById('daily-consumption').textContent =
+        (daily.energy_consumption_wh / 1000).toFixed(2);
+    document.getElementById('daily-import').textContent =
+        (daily.energy_import_wh / 1000).toFixed(2);
+    document.getElementById('daily-export').textContent =
+        (daily.energy_export_wh / 1000).toFixed(2);
+}
+
 // Update dagelijkse totalen
 async function updateDailyTotals() {
     try {
-        const response = await fetch('/api/data/daily');
+        const response = await fetch(API_BASE + '/data/daily');
         const daily = await response.json();
-
-        document.getElementById('daily-generation').textContent =
-            (daily.energy_generation_wh / 1000).toFixed(2);
-        document.getElementById('daily-consumption').textContent =
-            (daily.energy_consumption_wh / 1000).toFixed(2);
-        document.getElementById('daily-import').textContent =
-            (daily.energy_import_wh / 1000).toFixed(2);
-        document.getElementById('daily-export').textContent =
-            (daily.energy_export_wh / 1000).toFixed(2);
+        renderDailyTotals(daily);
     } catch (error) {
         console.error('Fout bij updaten dagelijkse totalen:', error);
     }
 }
 
-// Update dashboard met nieuwste data
+// Toon actuele statistieken
+function renderStatistics(stats) {
+    // Update zonnepanelen
+    const solarPower = stats.totals?.generation_w || 0;
+    document.getElementById('solar-power').textContent = formatNumber(solarPower);
+    document.getElementById('solar-total').textContent =
+        (stats.kwh?.total_generated_kwh || 0).toFixed(2);
+
+    // Update verbruik
+    const consumption = stats.totals?.consumption_w || 0;
+    document.getElementById('consumption-power').textContent = formatNumber(consumption);
+    document.getElementById('self-consumption').textContent =
+        formatNumber(stats.totals?.self_consumption_w || 0);
+
+    // Update grid
+    const gridPower = stats.totals?.grid_power_w || 0;
+    const gridElement = document.getElementById('grid-power');
+    gridElement.textContent = formatNumber(Math.abs(gridPower));
+
+    if (gridPower > 0) {
+        gridElement.classList.add('negative');
+        gridElement.classList.remove('positive');
+        document.getElementById('grid-label').textContent = 'Import:';
+        document.getElementById('grid-status').textContent = 'Van net';
+    } else if (gridPower < 0) {
+        gridElement.classList.add('positive');
+        gridElement.classList.remove('negative');
+        document.getElementById('grid-label').textContent = 'Export:';
+        document.getElementById('grid-status').textContent = 'Naar net';
+    } else {
+        gridElement.classList.remove('positive', 'negative');
+        document.getElementById('grid-label').textContent = 'Status:';
+        document.getElementById('grid-status').textContent = 'Geen flow';
+    }
+
+    // Update individuele meters
+    if (stats.individual_kwh_meters) {
+        updateIndividualMeters(stats.individual_kwh_meters);
+    }
+}
+
+// Toon status indicator en PVOutput status
+function renderStatus(status) {
+    const statusIndicator = document.getElementById('status-indicator');
+    // Apparaten met een open circuit worden overgeslagen tot ze weer antwoorden
+    const offline = (status.devices || []).filter(device => device.state && device.state !== 'closed');
+    if (status.status === 'running' && offline.length > 0) {
+        statusIndicator.textContent = `🟠 Actief (offline: ${offline.map(device => device.name).join(', ')})`;
+        statusIndicator.style.color = 'var(--warning-color)';
+    } else if (status.status === 'running') {
+        statusIndicator.textContent = '🟢 Actief';
+        statusIndicator.style.color = 'var(--success-color)';
+    } else if (status.status === 'waiting') {
+        // Web worker die nog geen data van de collector heeft
+        statusIndicator.textContent = '🟡 Wachten op collector';
+        statusIndicator.style.color = 'var(--warning-color)';
+    } else {
+        statusIndicator.textContent = '🔴 Gestopt';
+        statusIndicator.style.color = 'var(--danger-color)';
+    }
+
+    const pvoutputStatus = (status.config || {}).pvoutput_configured ? '✓ Actief' : '✗ Niet geconfigureerd';
+    document.getElementById('pvoutput-status').textContent = pvoutputStatus;
+}
+
+// Update status indicator en PVOutput status
+async function updateStatus() {
+    try {
+        const statusResponse = await fetch(API_BASE + '/status');
+        renderStatus(await statusResponse.json());
+    } catch (error) {
+        console.error('Fout bij updaten status:', error);
+    }
+}
+
+// Update dashboard met nieuwste data (volledig ophalen, zonder stream)
 async function updateDashboard() {
     try {
-        // Haal status op
-        const statusResponse = await fetch('/api/status');
-        const status = await statusResponse.json();
-
-        // Update status indicator
-        const statusIndicator = document.getElementById('status-indicator');
-        if (status.status === 'running') {
-            statusIndicator.textContent = '🟢 Actief';
-            statusIndicator.style.color = 'var(--success-color)';
-        } else {
-            statusIndicator.textContent = '🔴 Gestopt';
-            statusIndicator.style.color = 'var(--danger-color)';
+        // Eén conditioneel request: ongewijzigde data komt als 304 uit de browser cache
+        const response = await fetch(API_BASE + '/dashboard');
+        const dashboard = await response.json();
+
+        renderStatus(dashboard.status);
+        renderStatistics(dashboard.statistics);
+        renderDailyTotals(dashboard.daily);
+        document.getElementById('last-update').textContent = formatTime(dashboard.latest.last_update);
+
+        // Grafiek alleen opnieuw ophalen als er nieuwe data is
+        if (dashboard.latest.last_update !== lastChartUpdate) {
+            lastChartUpdate = dashboard.latest.last_update;
+            await updateChart();
         }
 
-        // Haal statistieken op
-        const statsResponse = await fetch('/api/data/statistics');
-        const stats = await statsResponse.json();
-
-        // Update zonnepanelen
-        const solarPower = stats.totals?.generation_w || 0;
-        document.getElementById('solar-power').textContent = formatNumber(solarPower);
-        document.getElementById('solar-total').textContent =
-            (stats.kwh?.total_generated_kwh || 0).toFixed(2);
-
-        // Update verbruik
-        const consumption = stats.totals?.consumption_w || 0;
-        document.getElementById('consumption-power').textContent = formatNumber(consumption);
-        document.getElementById('self-consumption').textContent =
-            formatNumber(stats.totals?.self_consumption_w || 0);
-
-        // Update grid
-        const gridPower = stats.totals?.grid_power_w || 0;
-        const gridElement = document.getElementById('grid-power');
-        gridElement.textContent = formatNumber(Math.abs(gridPower));
-
-        if (gridPower > 0) {
-            gridElement.classList.add('negative');
-            gridElement.classList.remove('positive');
-            document.getElementById('grid-label').textContent = 'Import:';
-            document.getElementById('grid-status').textContent = 'Van net';
-        } else if (gridPower < 0) {
-            gridElement.classList.add('positive');
-            gridElement.classList.remove('negative');
-            document.getElementById('grid-label').textContent = 'Export:';
-            document.getElementById('grid-status').textContent = 'Naar net';
-        } else {
-            gridElement.classList.remove('positive', 'negative');
-            document.getElementById('grid-label').textContent = 'Status:';
-            document.getElementById('grid-status').textContent = 'Geen flow';
-        }
+    } catch (error) {
+        console.error('Fout bij updaten dashboard:', error);
+    }
+}
 
-        // Update PVOutput status
-        const pvoutputStatus = status.config.pvoutput_configured ? '✓ Actief' : '✗ Niet geconfigureerd';
-        document.getElementById('pvoutput-status').textContent = pvoutputStatus;
+// Verwerk een update uit de stream
+function applyUpdate(update) {
+    if (update.version === lastVersion) {
+        return;
+    }
+    lastVersion = update.version;
 
-        // Haal laatste data op voor timestamp
-        const latestResponse = await fetch('/api/data/latest');
-        const latest = await latestResponse.json();
-        document.getElementById('last-update').textContent = formatTime(latest.last_update);
+    renderStatistics(update.statistics);
+    renderDailyTotals(update.daily);
+    document.getElementById('last-update').textContent = formatTime(update.last_update);
+    appendChartPoint(update.point);
+}
 
-        // Update individuele meters
-        if (stats.individual_kwh_meters) {
-            updateIndividualMeters(stats.individual_kwh_meters);
-        }
+// Voeg het nieuwste punt toe aan de grafiek en verwijder punten ouder dan een uur
+function appendChartPoint(point) {
+    if (!point?.timestamp || chartTimestamps.length === 0) {
+        return;
+    }
 
-        // Update dagelijkse totalen
-        await updateDailyTotals();
+    const time = new Date(point.timestamp);
+    if (time <= chartTimestamps[chartTimestamps.length - 1]) {
+        return;
+    }
 
-        // Update grafiek
-        await updateChart();
+    const generation = point.kwh_power_w || 0;
+    const gridPower = point.p1_power_w || 0;
+    chartTimestamps.push(time);
+    powerChart.data.labels.push(time.toLocaleTimeString('nl-NL', { hour: '2-digit', minute: '2-digit' }));
+    powerChart.data.datasets[0].data.push(generation);
+    powerChart.data.datasets[1].data.push(generation + gridPower);
+    powerChart.data.datasets[2].data.push(gridPower);
+
+    const cutoff = new Date(time.getTime() - 3600 * 1000);
+    while (chartTimestamps.length > 1 && (chartTimestamps[0] < cutoff || chartTimestamps.length > CHART_MAX_POINTS)) {
+        chartTimestamps.shift();
+        powerChart.data.labels.shift();
+        powerChart.data.datasets.forEach(dataset => dataset.data.shift());
+    }
+    powerChart.update('none');
+}
 
-    } catch (error) {
-        console.error('Fout bij updaten dashboard:', error);
+// Start polling als terugval wanneer de stream niet beschikbaar is
+function startPolling() {
+    if (!updateInterval) {
+        updateInterval = setInterval(updateDashboard, 5000);
+    }
+}
+
+function stopPolling() {
+    if (updateInterval) {
+        clearInterval(updateInterval);
+        updateInterval = null;
     }
 }
 
+// Verbind met de server-sent events stream
+function connectStream() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    eventSource = new EventSource(API_BASE + '/stream');
+
+    eventSource.addEventListener('update', (event) => {
+        applyUpdate(JSON.parse(event.data));
+    });
+
+    // Te ver achter geraakt: haal alles opnieuw op
+    eventSource.addEventListener('resync', () => {
+        lastVersion = null;
+        lastChartUpdate = null;
+        updateDashboard();
+    });
+
+    eventSource.onopen = () => {
+        stopPolling();
+    };
+
+    eventSource.onerror = () => {
+        // De browser probeert zelf opnieuw te verbinden, poll zolang dat niet lukt
+        startPolling();
+        if (eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            setTimeout(connectStream, 30000);
+        }
+    };
+}
+
 // Update grafiek met historische data
+// Samples binnen deze afstand (ms) horen bij dezelfde uitleesronde
+const JOIN_TOLERANCE_MS = 1000;
+
+// Voeg de P1 en kWh historie samen op tijd; per tijdstip de laatst bekende waarde van beide reeksen
+function joinHistory(p1, kwh) {
+    const series = [p1, kwh].map(rows => rows
+        .filter(row => row.timestamp)
+        .map(row => ({ time: new Date(row.timestamp).getTime(), power: row.active_power_w || 0 })));
+    const times = series[0].concat(series[1]).map(item => item.time).sort((a, b) => a - b);
+
+    const rows = [];
+    const index = [0, 0];
+    const last = [0, 0];
+    for (const time of times) {
+        if (rows.length && time - rows[rows.length - 1].time.getTime() <= JOIN_TOLERANCE_MS) {
+            continue;
+        }
+        series.forEach((items, s) => {
+            while (index[s] < items.length && items[index[s]].time <= time + JOIN_TOLERANCE_MS) {
+                last[s] = items[index[s]].power;
+                index[s]++;
+            }
+        });
+        rows.push({ time: new Date(time), gridPower: last[0], generation: last[1] });
+    }
+    return rows;
+}
+
 async function updateChart() {
     try {
-        const response = await fetch('/api/data/history?hours=1');
+        const response = await fetch(API_BASE + '/data/history?hours=1&max_points=' + CHART_MAX_POINTS);
         const history = await response.json();
 
         const labels = [];
+        const timestamps = [];
         const generationData = [];
         const consumptionData = [];
         const gridData = [];
 
-        // Verwerk P1 en kWh data
-        const maxLength = Math.max(history.p1?.length || 0, history.kwh?.length || 0);
-
-        for (let i = 0; i < maxLength; i++) {
-            const p1Item = history.p1?.[i];
-            const kwhItem = history.kwh?.[i];
-
-            // Gebruik timestamp van eerste beschikbare item
-            const timestamp = p1Item?._timestamp || kwhItem?._timestamp;
-            if (timestamp) {
-                const time = new Date(timestamp);
-                labels.push(time.toLocaleTimeString('nl-NL', { hour: '2-digit', minute: '2-digit' }));
-            }
-
-            // Opwekking
-            const generation = kwhItem?.active_power_w || 0;
-            generationData.push(generation);
+        // P1 en kWh worden apart gedownsampled en hebben andere tijdstippen: koppel op tijd, niet op index
+        for (const row of joinHistory(history.p1 || [], history.kwh || [])) {
+            timestamps.push(row.time);
+            labels.push(row.time.toLocaleTimeString('nl-NL', { hour: '2-digit', minute: '2-digit' }));
 
-            // Grid power
-            const gridPower = p1Item?.active_power_w || 0;
-            gridData.push(gridPower);
+            generationData.push(row.generation);
+            gridData.push(row.gridPower);
 
             // Verbruik = opwekking + grid (grid is negatief bij teruglevering)
-            const consumption = generation + gridPower;
-            consumptionData.push(consumption);
+            consumptionData.push(row.generation + row.gridPower);
         }
 
         // Update chart data
+        chartTimestamps = timestamps;
         powerChart.data.labels = labels;
         powerChart.data.datasets[0].data = generationData;
         powerChart.data.datasets[1].data = consumptionData;
@@ -370,7 +506,7 @@ function getKwhMetersFromForm() {
 // Laad configuratie
 async function loadConfig() {
     try {
-        const response = await fetch('/api/config');
+        const response = await fetch(API_BASE + '/config');
         const config = await response.json();
 
         document.getElementById('p1-enabled').checked = config.homewizard_p1.enabled;
@@ -409,7 +545,7 @@ async function saveConfig(event) {
     }
 
     try {
-        const response = await fetch('/api/config', {
+        const response = await fetch(API_BASE + '/config', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -436,7 +572,7 @@ async function forceUpdate() {
         button.disabled = true;
         button.textContent = 'Bezig...';
 
-        const response = await fetch('/api/update-now', { method: 'POST' });
+        const response = await fetch(API_BASE + '/update-now', { method: 'POST' });
 
         if (response.ok) {
             await updateDashboard();
@@ -477,8 +613,9 @@ document.addEventListener('DOMContentLoaded', () => {
     initChart();
     updateDashboard();
 
-    // Start auto-update elke 5 seconden
-    updateInterval = setInterval(updateDashboard, 5000);
+    // Nieuwe metingen komen via de stream binnen, de status verandert zelden
+    connectStream();
+    statusInterval = setInterval(updateStatus, 60000);
 
     // Event listeners
     document.getElementById('update-now-btn').addEventListener('click', forceUpdate);
@@ -0,0 +1,199 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.request import pathname2url
+
+class SQLiteHistoryStore:
+    """
+    Persistente opslag van samples in SQLite (WAL mode)
+
+    Per reeks (bijvoorbeeld 'p1' en 'kwh') is er een tabel met de timestamp
+    (epoch seconden) als primary key, zodat range queries via de index gaan.
+    Schrijven gebeurt in batches in één transactie: weinig, sequentiële
+    writes, wat SD kaarten spaart. De connectie mag vanuit meerdere threads
+    gebruikt worden, toegang is geserialiseerd met een lock.
+
+    Naast de samples is er een kleine tabel 'state' waarin de collector de
+    actuele state publiceert voor web workers (APP_ROLE=web). Door WAL mode
+    kunnen die workers lezen terwijl de collector schrijft.
+    """
+
+    def __init__(self, path: str, series: Dict[str, Iterable[str]], readonly: bool = False):
+        """
+        Args:
+            path: Pad naar het database bestand (de map wordt aangemaakt)
+            series: Dict van reeksnaam naar de kolommen van die reeks
+            readonly: Open een bestaande database alleen om te lezen (web
+                worker); FileNotFoundError als de collector die nog niet
+                aangemaakt heeft
+        """
+        self.path = path
+        self.series = {name: list(columns) for name, columns in series.items()}
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        if readonly:
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+            return
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+    def _create_tables(self):
+        """Maak tabellen aan en voeg kolommen toe die in een oudere versie ontbraken"""
+        with self._lock:
+            for name, columns in self.series.items():
+                table = self._table(name)
+                self._conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} (ts REAL PRIMARY KEY) WITHOUT ROWID"
+                )
+                existing = {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                for column in columns:
+                    if column not in existing:
+                        self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} REAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, version INTEGER, payload BLOB)"
+            )
+
+    @staticmethod
+    def _table(name: str) -> str:
+        return f"{name}_samples"
+
+    def write_batch(self, name: str, samples: List[Tuple[float, Dict]]):
+        """
+        Schrijf een batch samples weg in één transactie
+
+        Args:
+            name: Naam van de reeks
+            samples: Lijst van (timestamp, values) tuples
+        """
+        if not samples:
+            return
+
+        columns = self.series[name]
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        sql = f"INSERT OR REPLACE INTO {self._table(name)} (ts, {', '.join(columns)}) VALUES ({placeholders})"
+        rows = [(timestamp, *(values.get(column) for column in columns)) for timestamp, values in samples]
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _rows(self, cursor: sqlite3.Cursor) -> List[Dict]:
+        """Zet database rows om naar dicts in hetzelfde formaat als de ring buffer"""
+        names = [description[0] for description in cursor.description]
+        rows = []
+        for record in cursor:
+            row = {'timestamp': datetime.fromtimestamp(record[0]).isoformat()}
+            for column, value in zip(names[1:], record[1:]):
+                if value is not None:
+                    row[column] = value
+            rows.append(row)
+        return rows
+
+    def query_range(self, name: str, start: float, end: float) -> List[Dict]:
+        """Haal alle samples op met start <= timestamp < end"""
+        columns = ', '.join(self.series[name])
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT ts, {columns} FROM {self._table(name)} WHERE ts >= ? AND ts < ? ORDER BY ts",
+                (start, end)
+            )
+            return self._rows(cursor)
+
+    def query_downsampled(
+        self,
+        name: str,
+        start: float,
+        end: float,
+        resolution: int,
+        value_column: str = 'active_power_w'
+    ) -> List[Dict]:
+        """
+        Haal per bucket het sample met minimale en maximale waarde op (min/max bucketing)
+
+        SQLite geeft bij MIN()/MAX() met GROUP BY de overige kolommen van de
+        betreffende rij terug, zodat de aggregatie volledig in de database
+        gebeurt en het geheugengebruik begrensd blijft.
+        """
+        columns = ', '.join(self.series[name])
+        table = self._table(name)
+        sql = (
+            f"SELECT ts, {columns} FROM ("
+            f" SELECT ts, {columns}, MIN({value_column}) FROM {table}"
+            f" WHERE ts >= :start AND ts < :end GROUP BY CAST(ts / :resolution AS INTEGER)"
+            f" UNION"
+            f" SELECT ts, {columns}, MAX({value_column}) FROM {table}"
+            f" WHERE ts >= :start AND ts < :end GROUP BY CAST(ts / :resolution AS INTEGER)"
+            f") ORDER BY ts"
+        )
+        with self._lock:
+            cursor = self._conn.execute(sql, {'start': start, 'end': end, 'resolution': resolution})
+            return self._rows(cursor)
+
+    def query_since(self, name: str, after: float) -> List[Tuple[float, Dict]]:
+        """Samples met een timestamp na `after`, als (timestamp, values) zoals write_batch ze krijgt"""
+        columns = self.series[name]
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT ts, {', '.join(columns)} FROM {self._table(name)} WHERE ts > ? ORDER BY ts",
+                (after,)
+            )
+            return [
+                (record[0], {column: value for column, value in zip(columns, record[1:]) if value is not None})
+                for record in cursor
+            ]
+
+    def count(self, name: str, start: float, end: float) -> int:
+        """Aantal samples met start <= timestamp < end"""
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM {self._table(name)} WHERE ts >= ? AND ts < ?",
+                (start, end)
+            ).fetchone()[0]
+
+    def prune(self, before: float) -> int:
+        """Verwijder samples ouder dan een timestamp, geeft het aantal verwijderde rijen terug"""
+        removed = 0
+        with self._lock:
+            for name in self.series:
+                cursor = self._conn.execute(f"DELETE FROM {self._table(name)} WHERE ts < ?", (before,))
+                removed += cursor.rowcount
+        return removed
+
+    def write_state(self, key: str, version: int, payload: bytes):
+        """Publiceer een state (vervangt de vorige versie onder dezelfde key)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (key, version, payload) VALUES (?, ?, ?)",
+                (key, version, payload)
+            )
+
+    def state_version(self, key: str) -> Optional[int]:
+        """Versie van een gepubliceerde state, zonder de payload te lezen"""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def read_state(self, key: str) -> Optional[Tuple[int, bytes]]:
+        """Gepubliceerde state als (version, payload), None als er nog niets gepubliceerd is"""
+        with self._lock:
+            return self._conn.execute("SELECT version, payload FROM state WHERE key = ?", (key,)).fetchone()
+
+    def close(self):
+        """Sluit de database connectie"""
+        with self._lock:
+            self._conn.close()
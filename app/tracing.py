@@ -0,0 +1,222 @@
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Deque, Dict, Iterator, List, Optional
+
+class CycleTrace:
+    """Timing van één cyclus: een lijst spans met begin en duur ten opzichte van de start"""
+
+    def __init__(self, trace_id: int, name: str, attributes: Optional[Dict] = None):
+        self.id = trace_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status = 'ok'
+        self.spans: List[Dict] = []
+
+    def offset_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'name': self.name,
+            'attributes': self.attributes,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'spans': self.spans
+        }
+
+_current_trace: contextvars.ContextVar[Optional[CycleTrace]] = contextvars.ContextVar('current_trace', default=None)
+
+def _status(error: BaseException) -> str:
+    return 'cancelled' if isinstance(error, asyncio.CancelledError) else 'error'
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Dict]]:
+    """
+    Meet een fase binnen de lopende cyclus
+
+    Zonder lopende cyclus doet dit niets, zodat code overal spans kan
+    zetten. Taken die binnen de cyclus gestart worden (asyncio.create_task)
+    erven de cyclus via de context.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    record = {'name': name, 'start_ms': round(trace.offset_ms(), 2), 'duration_ms': None, 'status': 'ok'}
+    if attributes:
+        record['attributes'] = attributes
+    trace.spans.append(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record['status'] = _status(e)
+        record['error'] = str(e) or type(e).__name__
+        raise
+    finally:
+        record['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+
+class Tracer:
+    """
+    Bewaar de timing van de laatste cycli in een ring buffer
+
+    cycle() start een nieuwe trace, of een span als er al een cyclus loopt;
+    zo levert collect_and_send_data() één trace op met de verzamel- en
+    upload fases als spans, terwijl losse samples een eigen trace krijgen.
+    """
+
+    def __init__(self, max_traces: int = 50):
+        self.traces: Deque[CycleTrace] = deque(maxlen=max_traces)
+        self._next_id = 1
+
+    @contextmanager
+    def cycle(self, name: str, **attributes) -> Iterator[None]:
+        if _current_trace.get() is not None:
+            with span(name, **attributes):
+                yield
+            return
+
+        trace = CycleTrace(self._next_id, name, attributes)
+        self._next_id += 1
+        token = _current_trace.set(trace)
+        try:
+            yield
+        except BaseException as e:
+            trace.status = _status(e)
+            raise
+        finally:
+            _current_trace.reset(token)
+            trace.duration_ms = round(trace.offset_ms(), 2)
+            self.traces.append(trace)
+
+    def recent(self, limit: Optional[int] = None, name: Optional[str] = None, site: Optional[str] = None) -> List[Dict]:
+        """Laatste traces, nieuwste eerst, optioneel alleen van één cyclus type of site"""
+        traces = [
+            trace for trace in reversed(self.traces)
+            if (name is None or trace.name == name) and (site is None or trace.attributes.get('site') == site)
+        ]
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def summary(self) -> Dict:
+        """
+        Duur per span naam over alle bewaarde traces
+
+        Spans met een device attribuut worden per apparaat samengevat, zodat
+        een trage omvormer direct opvalt.
+        """
+        durations: Dict[str, List[float]] = {}
+        for trace in self.traces:
+            durations.setdefault(f"cycle:{trace.name}", []).append(trace.duration_ms or 0)
+            for record in trace.spans:
+                key = record['name']
+                device = record.get('attributes', {}).get('device')
+                if device:
+                    key = f"{key}[{device}]"
+                durations.setdefault(key, []).append(record['duration_ms'] or 0)
+
+        summary = {}
+        for key, values in sorted(durations.items()):
+            values.sort()
+            summary[key] = {
+                'count': len(values),
+                'mean_ms': round(sum(values) / len(values), 2),
+                'p95_ms': values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))],
+                'max_ms': values[-1]
+            }
+        return summary
+
+class SamplingProfiler:
+    """
+    Eenvoudige sampling profiler voor de event loop thread
+
+    Een achtergrond thread leest met een vast interval de stack van de
+    doel thread uit (sys._current_frames) en telt de stacks. Omdat alleen
+    gesampled wordt is de overhead klein en onafhankelijk van het aantal
+    functie aanroepen; de code hoeft er niet voor aangepast te worden.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        """
+        Args:
+            interval: Seconden tussen samples
+            thread_id: Thread om te samplen, standaard de aanroepende thread
+        """
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started = 0.0
+        self.duration = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Stacks in het 'collapsed' formaat (invoer voor flamegraph tools zoals speedscope)"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def top(self, limit: int = 25) -> List[Dict]:
+        """Functies met de meeste samples, als eigen tijd (bovenaan de stack) en inclusief"""
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for function in set(frames):
+                inclusive[function] += count
+
+        total = max(1, self.samples)
+        return [
+            {
+                'function': function,
+                'own_samples': own[function],
+                'own_percent': round(own[function] / total * 100, 1),
+                'inclusive_percent': round(inclusive[function] / total * 100, 1)
+            }
+            for function, _ in own.most_common(limit)
+        ]
+
+    def to_dict(self, limit: int = 25) -> Dict:
+        return {
+            'duration_ms': round(self.duration * 1000, 2),
+            'interval_ms': self.interval * 1000,
+            'samples': self.samples,
+            'top': self.top(limit),
+            'collapsed': self.collapsed()
+        }
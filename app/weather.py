@@ -1,7 +1,12 @@
 import httpx
+import logging
 from typing import Optional, Dict
 from datetime import datetime, timedelta
 
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
 class WeatherCache:
     """In-memory cache met TTL voor weather data"""
 
@@ -65,8 +70,10 @@ class OpenMeteoClient:
         # Check cache eerst
         cached_data = self.cache.get(self.latitude, self.longitude)
         if cached_data:
-            print(f"Weather data uit cache gebruikt (lat={self.latitude}, lon={self.longitude})")
+            metrics.WEATHER_CACHE.inc(result='hit')
+            logger.debug("Weather data uit cache gebruikt (lat=%s, lon=%s)", self.latitude, self.longitude)
             return cached_data
+        metrics.WEATHER_CACHE.inc(result='miss')
 
         # Haal data op van API
         try:
@@ -88,24 +95,26 @@ class OpenMeteoClient:
                 # Cache de data
                 self.cache.set(self.latitude, self.longitude, weather_data)
 
-                print(f"Weather data opgehaald van Open-Meteo: {weather_data.get('temperature_c')}°C")
+                logger.info("Weather data opgehaald van Open-Meteo: %s°C", weather_data.get('temperature_c'))
                 return weather_data
 
         except httpx.RequestError as e:
-            print(f"Network error bij ophalen weather data: {e}")
+            logger.warning("Network error bij ophalen weather data: %s", e, extra={'device': 'weather'})
             # Probeer expired cache als fallback
             expired_data = self.cache.get_even_if_expired(self.latitude, self.longitude)
             if expired_data:
-                print("Gebruik expired cache als fallback")
+                metrics.WEATHER_CACHE.inc(result='stale')
+                logger.info("Gebruik expired cache als fallback")
                 return expired_data
             raise
 
         except Exception as e:
-            print(f"Fout bij ophalen weather data van Open-Meteo: {e}")
+            logger.warning("Fout bij ophalen weather data van Open-Meteo: %s", e, extra={'device': 'weather'})
             # Probeer expired cache als fallback
             expired_data = self.cache.get_even_if_expired(self.latitude, self.longitude)
             if expired_data:
-                print("Gebruik expired cache als fallback")
+                metrics.WEATHER_CACHE.inc(result='stale')
+                logger.info("Gebruik expired cache als fallback")
                 return expired_data
             raise
 
@@ -0,0 +1,268 @@
+"""
+Micro-benchmarks van de data pipeline
+
+Meet doorvoer (aanroepen per seconde) en allocaties (bytes per aanroep,
+via tracemalloc) van de verwerking, opslag en conversie van samples, met
+synthetische data op verschillende schalen. Het resultaat wordt als JSON
+weggeschreven zodat versies met elkaar vergeleken kunnen worden.
+
+Gebruik (vanuit de root van de repository):
+
+    python -m benchmarks.pipeline --output results.json
+    python -m benchmarks.pipeline --compare results.json
+"""
+import argparse
+import gc
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from app.data_manager import DataManager
+from app.homewizard import HomeWizardDataProcessor
+from app.pvoutput import PVOutputDataConverter
+
+# Schalen van de historie in uren, en aantallen kWh meters
+SCALES = {'1h': 1, '24h': 24, '7d': 168}
+METER_COUNTS = (1, 5, 20, 50)
+SAMPLE_INTERVAL = 10  # Seconden tussen samples in de synthetische historie
+
+def solar_power(timestamp: float, peak: float = 4000) -> float:
+    """Synthetische opwekking: een sinus over de dag tussen 6:00 en 20:00"""
+    hour = datetime.fromtimestamp(timestamp).hour + datetime.fromtimestamp(timestamp).minute / 60
+    if not 6 <= hour <= 20:
+        return 0.0
+    return round(peak * math.sin(math.pi * (hour - 6) / 14), 1)
+
+def raw_p1(timestamp: float) -> Dict:
+    """Synthetisch antwoord van /api/v1/data van een P1 meter"""
+    power = 450 - solar_power(timestamp)
+    return {
+        'total_power_import_kwh': 12000 + timestamp / 3600 * 0.4,
+        'total_power_export_kwh': 8000 + timestamp / 3600 * 0.3,
+        'active_power_w': power,
+        'active_power_l1_w': power,
+        'active_power_l2_w': 0,
+        'active_power_l3_w': 0,
+        'voltage_sag_l1_v': 231.2,
+        'voltage_sag_l2_v': 229.8,
+        'voltage_sag_l3_v': 230.4
+    }
+
+def raw_kwh(timestamp: float, index: int) -> Dict:
+    """Synthetisch antwoord van /api/v1/data van een kWh meter"""
+    return {
+        'total_power_export_kwh': 5000 + index * 100 + timestamp / 3600 * 0.5,
+        'active_power_w': solar_power(timestamp, peak=4000 / (index + 1))
+    }
+
+def processed_meters(timestamp: float, count: int) -> List[Dict]:
+    meters = []
+    for index in range(count):
+        data = HomeWizardDataProcessor.process_kwh_data(raw_kwh(timestamp, index))
+        data['meter_name'] = f"Omvormer {index + 1}"
+        data['meter_host'] = f"192.168.1.{100 + index}"
+        meters.append(data)
+    return meters
+
+def filled_data_manager(hours: int, meters: int = 1) -> DataManager:
+    """DataManager met een volle historie van het gegeven aantal uren"""
+    manager = DataManager(max_history_hours=hours, sample_interval=SAMPLE_INTERVAL)
+    now = time.time()
+    start = now - hours * 3600
+    timestamp = start
+    while timestamp < now:
+        p1 = HomeWizardDataProcessor.process_p1_data(raw_p1(timestamp))
+        kwh = HomeWizardDataProcessor.combine_kwh_data(processed_meters(timestamp, meters))
+        manager.p1_history.append(timestamp, p1)
+        manager.kwh_history.append(timestamp, kwh)
+        timestamp += SAMPLE_INTERVAL
+
+    # Laatste meting als actuele data, zoals na een gewone cyclus
+    manager.add_p1_data(HomeWizardDataProcessor.process_p1_data(raw_p1(now)))
+    manager.add_kwh_data(HomeWizardDataProcessor.combine_kwh_data(processed_meters(now, meters)))
+    return manager
+
+def measure(func: Callable[[], object], min_time: float = 0.2, max_calls: int = 100000) -> Dict:
+    """
+    Meet een functie: doorvoer over min_time seconden, en allocaties van één aanroep
+
+    Returns:
+        Dict met calls_per_second, mean_us, alloc_bytes (netto toename) en
+        peak_bytes (piek geheugen tijdens de aanroep)
+    """
+    func()  # Warm up (caches, lazy imports)
+
+    gc.collect()
+    gc.disable()
+    try:
+        calls = 0
+        started = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time and calls < max_calls:
+            func()
+            calls += 1
+            elapsed = time.perf_counter() - started
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = func()
+        after, peak = tracemalloc.get_traced_memory()
+        del result
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'calls': calls,
+        'calls_per_second': round(calls / elapsed, 1),
+        'mean_us': round(elapsed / calls * 1e6, 2),
+        'alloc_bytes': after - before,
+        'peak_bytes': peak - before
+    }
+
+def run_benchmarks(scales: Dict[str, int], meter_counts: List[int], min_time: float) -> List[Dict]:
+    results = []
+
+    def record(name: str, params: Dict, func: Callable[[], object]):
+        result = {'name': name, 'params': params, **measure(func, min_time)}
+        results.append(result)
+        label = ', '.join(f"{key}={value}" for key, value in params.items())
+        print(f"{name:<40} {label:<34} {result['mean_us']:>12.2f} us {result['peak_bytes']:>12} B")
+
+    now = time.time()
+
+    # Verwerking van ruwe data
+    raw = raw_p1(now)
+    record('process_p1_data', {}, lambda: HomeWizardDataProcessor.process_p1_data(raw))
+    raw_meter = raw_kwh(now, 0)
+    record('process_kwh_data', {}, lambda: HomeWizardDataProcessor.process_kwh_data(raw_meter))
+    for count in meter_counts:
+        meters = processed_meters(now, count)
+        record('combine_kwh_data', {'meters': count}, lambda: HomeWizardDataProcessor.combine_kwh_data(meters))
+
+    for scale, hours in scales.items():
+        manager = filled_data_manager(hours)
+
+        # Lezen (eerst, het toevoegen hieronder overschrijft de historie met samples van nu)
+        record('DataManager.get_history', {'scale': scale, 'hours': hours},
+               lambda: manager.get_history(hours))
+        record('DataManager.get_history', {'scale': scale, 'hours': hours, 'max_points': 500},
+               lambda: manager.get_history(hours, max_points=500))
+        if hours != 1:
+            record('DataManager.get_history', {'scale': scale, 'hours': 1},
+                   lambda: manager.get_history(1))
+
+        def statistics_uncached():
+            manager.version += 1
+            return manager.get_statistics()
+
+        def daily_totals_uncached():
+            manager.version += 1
+            return manager.get_daily_totals()
+
+        record('DataManager.get_statistics', {'scale': scale}, statistics_uncached)
+        record('DataManager.get_statistics', {'scale': scale, 'cached': True}, manager.get_statistics)
+        record('DataManager.get_daily_totals', {'scale': scale}, daily_totals_uncached)
+        record('DataManager.get_daily_totals', {'scale': scale, 'cached': True}, manager.get_daily_totals)
+
+        # Toevoegen aan een volle ring buffer (zonder persistente opslag)
+        p1 = HomeWizardDataProcessor.process_p1_data(raw_p1(now))
+        record('DataManager.add_p1_data', {'scale': scale}, lambda: manager.add_p1_data(dict(p1)))
+        for count in meter_counts:
+            kwh = HomeWizardDataProcessor.combine_kwh_data(processed_meters(now, count))
+            record('DataManager.add_kwh_data', {'scale': scale, 'meters': count},
+                   lambda: manager.add_kwh_data(dict(kwh)))
+
+        del manager
+        gc.collect()
+
+    # Conversie naar PVOutput
+    for count in meter_counts:
+        manager = filled_data_manager(1, count)
+        daily = manager.get_daily_totals()
+        summary = manager.get_interval_summary()
+        weather = {'temperature_c': 14.2, 'weather_condition': 'Bewolkt'}
+        record('convert_to_pvoutput', {'meters': count}, lambda: PVOutputDataConverter.convert_to_pvoutput(
+            manager.latest_p1_data, manager.latest_kwh_data, daily, weather, summary
+        ))
+
+    return results
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def result_key(result: Dict) -> str:
+    return result['name'] + json.dumps(result['params'], sort_keys=True)
+
+def compare(previous: Dict, results: List[Dict], threshold: float):
+    """Vergelijk met een eerder resultaat en markeer regressies"""
+    old = {result_key(result): result for result in previous['results']}
+    print(f"\nVergelijking met {previous.get('revision') or 'vorig resultaat'} ({previous.get('created')}):")
+    regressions = 0
+    for result in results:
+        before = old.get(result_key(result))
+        if not before:
+            continue
+        ratio = result['mean_us'] / before['mean_us'] if before['mean_us'] else 1.0
+        marker = ''
+        if ratio > 1 + threshold:
+            marker = '  REGRESSIE'
+            regressions += 1
+        label = ', '.join(f"{key}={value}" for key, value in result['params'].items())
+        print(f"{result['name']:<40} {label:<34} {before['mean_us']:>10.2f} -> {result['mean_us']:>10.2f} us ({ratio:.2f}x){marker}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks van de data pipeline")
+    parser.add_argument('--output', help="Schrijf resultaten als JSON naar dit bestand")
+    parser.add_argument('--compare', help="Vergelijk met een eerder JSON resultaat")
+    parser.add_argument('--scales', default=','.join(SCALES), help="Schalen, bijvoorbeeld 1h,24h")
+    parser.add_argument('--meters', default=','.join(str(count) for count in METER_COUNTS),
+                        help="Aantallen kWh meters, bijvoorbeeld 1,50")
+    parser.add_argument('--min-time', type=float, default=0.2, help="Meetduur per benchmark in seconden")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Relatieve vertraging die als regressie telt (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    scales = {name: SCALES[name] for name in args.scales.split(',')}
+    meter_counts = [int(count) for count in args.meters.split(',')]
+
+    results = run_benchmarks(scales, meter_counts, args.min_time)
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'sample_interval': SAMPLE_INTERVAL,
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResultaten opgeslagen in {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        if compare(previous, results, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+import pytest
+import yaml
+
+from app import tracing
+from app.config import Config, SiteConfig
+from app.site import Site
+
+@pytest.fixture
+def make_site(tmp_path):
+    """Maak een Site met een minimale configuratie in tmp_path, instellingen per test te overschrijven"""
+    def make(**overrides) -> Site:
+        data = {
+            'homewizard_p1': {'host': '', 'enabled': False},
+            'homewizard_kwh_meters': [],
+            'pvoutput': {'api_key': '', 'system_id': '', 'outbox_path': str(tmp_path / 'outbox.db')},
+            'update_interval': 300,
+            'sample_interval': 10,
+            'storage': {'enabled': False, 'path': str(tmp_path / 'history.db')},
+            'snapshot': {'enabled': False, 'path': str(tmp_path / 'snapshot.bin')},
+            'weather': {'enabled': False},
+        }
+        data.update(overrides)
+        path = tmp_path / 'config.yaml'
+        path.write_text(yaml.safe_dump(data))
+        return Site(SiteConfig(Config(str(path))), tracing.Tracer())
+    return make
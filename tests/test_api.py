@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app import main
+from app.main import parse_time
+
+@pytest.fixture
+def client():
+    # Zonder lifespan: geen achtergrond taken en geen apparaten, alleen de routes
+    return TestClient(main.app)
+
+def test_parse_time_converts_aware_to_local_naive():
+    parsed = parse_time('2026-10-17T08:00:00Z', 'start')
+    assert parsed.tzinfo is None
+    assert parsed == datetime(2026, 10, 17, 8, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+
+def test_parse_time_accepts_epoch_seconds():
+    assert parse_time('1760688000', 'start') == datetime.fromtimestamp(1760688000)
+
+def test_parse_time_rejects_garbage():
+    with pytest.raises(HTTPException) as error:
+        parse_time('gisteren', 'start')
+    assert error.value.status_code == 400
+
+def test_history_with_mixed_timezones(client):
+    now = datetime.now()
+    start = now.astimezone(timezone.utc).replace(microsecond=0).isoformat()
+    end = now.replace(microsecond=0).isoformat()
+    response = client.get('/api/data/history', params={'start': start, 'end': end})
+    assert response.status_code == 200
+    assert set(response.json()) == {'p1', 'kwh'}
+
+def test_history_mixed_timezones_in_wrong_order(client):
+    response = client.get('/api/data/history', params={
+        'start': '2026-10-17T12:00:00+00:00', 'end': '2026-10-17T00:00:00'
+    })
+    assert response.status_code == 400
+
+def test_history_invalid_time_is_bad_request(client):
+    response = client.get('/api/data/history', params={'start': 'niet-een-datum'})
+    assert response.status_code == 400
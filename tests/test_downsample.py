@@ -0,0 +1,50 @@
+import time
+
+from app.data_manager import DataManager
+from app.downsample import MinMaxDownsampler, snap_resolution
+from app.ring_buffer import ColumnarRingBuffer
+
+def filled_buffer(count: int, step: float = 1.0) -> ColumnarRingBuffer:
+    history = ColumnarRingBuffer(count, {'active_power_w': 'f'})
+    now = time.time()
+    for i in range(count):
+        history.append(now - (count - i) * step, {'active_power_w': float(i % 17)})
+    return history
+
+def test_snap_resolution_rounds_up_to_ladder():
+    assert snap_resolution(1) == 1
+    assert snap_resolution(3) == 5
+    assert snap_resolution(7) == 10
+    assert snap_resolution(100000) == 2 * 86400
+
+def test_arbitrary_resolutions_share_cache_family():
+    manager = DataManager(1, 1)
+    now = time.time()
+    for i in range(3600):
+        manager.kwh_history.append(now - 3600 + i, {'active_power_w': float(i % 17)})
+
+    for resolution in (3, 4, 5):
+        manager.get_history(1, resolution=resolution)
+    assert {key[0] for key in manager._downsamplers['kwh']._cache} == {5}
+
+def test_resolution_below_sample_interval_returns_samples():
+    manager = DataManager(1, 10)
+    now = time.time()
+    for i in range(360):
+        manager.kwh_history.append(now - 3600 + i * 10, {'active_power_w': float(i)})
+
+    rows = manager.get_history(1, resolution=1)['kwh']
+    assert len(rows) == 359
+    assert not manager._downsamplers['kwh']._cache
+
+def test_single_sample_buckets_are_not_cached():
+    downsampler = MinMaxDownsampler(filled_buffer(100, step=10))
+    downsampler.downsample(0, float('inf'), 5)
+    assert not downsampler._cache
+
+def test_cache_is_capped():
+    history = filled_buffer(5000)
+    downsampler = MinMaxDownsampler(history, max_entries=100)
+    rows = downsampler.downsample(0, float('inf'), 5)
+    assert rows
+    assert len(downsampler._cache) == 100
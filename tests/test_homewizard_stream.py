@@ -0,0 +1,202 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+websockets = pytest.importorskip('websockets')
+
+from app import homewizard_stream
+from app.homewizard_stream import HomeWizardStream, convert_v2_measurement
+
+MEASUREMENT = {'power_w': -250, 'energy_import_kwh': 7.5, 'energy_export_kwh': 9.0, 'voltage_l1_v': 231.0}
+
+class StandIn:
+    """Lokale stand-in voor de WebSocket API (v2) van een HomeWizard apparaat"""
+
+    def __init__(self, token: str = 'secret', interval: float = 0.05):
+        self.token = token
+        self.interval = interval
+        self.measurement = dict(MEASUREMENT)
+        self.sending = True
+        self.connections = 0
+        self.subscriptions = []
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/api/ws"
+
+    async def __aenter__(self):
+        self.server = await websockets.serve(self.handler, '127.0.0.1', 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handler(self, connection, path=None):
+        self.connections += 1
+        await connection.send(json.dumps({'type': 'authorization_requested', 'data': {'api_version': '2.0.0'}}))
+        message = json.loads(await connection.recv())
+        if message != {'type': 'authorization', 'data': self.token}:
+            await connection.send(json.dumps({'type': 'error', 'data': {'message': 'user:unauthorized'}}))
+            return
+        await connection.send(json.dumps({'type': 'authorized'}))
+        self.subscriptions.append(json.loads(await connection.recv()))
+        try:
+            while connection.open:
+                if self.sending:
+                    await connection.send(json.dumps({'type': 'measurement', 'data': self.measurement}))
+                await asyncio.sleep(self.interval)
+        except websockets.ConnectionClosed:
+            pass
+
+async def wait_for(condition, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Conditie niet gehaald binnen de timeout")
+        await asyncio.sleep(0.02)
+
+def test_convert_v2_measurement_uses_v1_names():
+    converted = convert_v2_measurement({'power_w': 100, 'energy_export_kwh': 1.5, 'voltage_v': 230, 'voltage_l1_v': 231})
+    assert converted == {'active_power_w': 100, 'total_power_export_kwh': 1.5, 'voltage_sag_l1_v': 231}
+
+def test_stream_authorizes_and_receives_measurements():
+    async def scenario():
+        received = []
+        async with StandIn() as stand_in:
+            stream = HomeWizardStream('meter', 'secret', on_message=received.append, url=stand_in.url)
+            stream.start()
+            try:
+                await wait_for(lambda: stream.messages >= 3)
+                assert stream.connected and stream.fresh
+                assert stream.latest['active_power_w'] == -250
+                assert stream.latest['total_power_export_kwh'] == 9.0
+                assert stand_in.subscriptions == [{'type': 'subscribe', 'data': 'measurement'}]
+                assert set(received) == {'meter'}
+            finally:
+                await stream.stop()
+    asyncio.run(scenario())
+
+def test_wrong_token_is_reported():
+    async def scenario():
+        async with StandIn(token='other') as stand_in:
+            stream = HomeWizardStream('meter', 'secret', url=stand_in.url, backoff=0.05)
+            stream.start()
+            try:
+                await wait_for(lambda: stream.last_error == 'user:unauthorized')
+                assert not stream.connected and not stream.fresh
+            finally:
+                await stream.stop()
+    asyncio.run(scenario())
+
+def test_stream_goes_stale_without_measurements():
+    async def scenario():
+        async with StandIn() as stand_in:
+            stream = HomeWizardStream('meter', 'secret', url=stand_in.url, stale_after=0.2)
+            stream.start()
+            try:
+                await wait_for(lambda: stream.fresh)
+                stand_in.sending = False
+                await wait_for(lambda: not stream.fresh)
+                assert stream.connected  # Verbonden, maar zonder actuele meting telt die niet
+            finally:
+                await stream.stop()
+    asyncio.run(scenario())
+
+def test_reconnects_after_disconnect():
+    async def scenario():
+        async with StandIn() as stand_in:
+            stream = HomeWizardStream('meter', 'secret', url=stand_in.url, backoff=0.05)
+            stream.start()
+            try:
+                await wait_for(lambda: stream.fresh)
+                for connection in list(stand_in.server.websockets):
+                    await connection.close()
+                await wait_for(lambda: stand_in.connections == 2 and stream.fresh)
+                assert stream.reconnects == 1
+            finally:
+                await stream.stop()
+    asyncio.run(scenario())
+
+def test_reconnect_backoff_doubles_up_to_maximum(monkeypatch):
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def record_sleep(delay):
+        delays.append(delay)
+        if len(delays) == 6:
+            raise asyncio.CancelledError
+        await real_sleep(0)
+
+    monkeypatch.setattr(homewizard_stream.asyncio, 'sleep', record_sleep)
+
+    async def scenario():
+        # Geen server op deze poort: elke poging mislukt direct
+        stream = HomeWizardStream('meter', 'secret', url='ws://127.0.0.1:9/api/ws', backoff=1, max_backoff=8)
+        with pytest.raises(asyncio.CancelledError):
+            await stream.run()
+        assert stream.last_error
+
+    asyncio.run(scenario())
+    assert delays == [1, 2, 4, 8, 8, 8]
+
+class FakeV1Client:
+    """Vervangt de HomeWizardClient (API v1) van een site en telt de uitlezingen"""
+
+    def __init__(self, data):
+        self.data = data
+        self.calls = 0
+
+    async def get_data(self):
+        self.calls += 1
+        return dict(self.data)
+
+def streaming_site(make_site, url: str, stale_seconds: float = 30):
+    site = make_site(
+        sample_interval=1,
+        homewizard_p1={'host': 'p1.local', 'enabled': True, 'token': 'secret', 'stream_url': url},
+        homewizard_stream={'backoff_seconds': 0.05, 'stale_seconds': stale_seconds}
+    )
+    site.p1_client = FakeV1Client({'active_power_w': 999})
+    return site
+
+async def stop_site_streams(site):
+    for stream in site.streams.values():
+        await stream.stop()
+    for task in site.tasks:
+        task.cancel()
+
+def test_push_updates_meter_data_without_polling(make_site):
+    async def scenario():
+        async with StandIn() as stand_in:
+            site = streaming_site(make_site, stand_in.url)
+            site.start_streams()
+            try:
+                await wait_for(lambda: site.data_manager.latest_p1_data.get('active_power_w') == -250)
+                assert site.stream_driven
+                assert site.data_manager.latest_p1_data['total_power_export_kwh'] == 9.0
+                assert site.p1_client.calls == 0
+            finally:
+                await stop_site_streams(site)
+    asyncio.run(scenario())
+
+def test_stale_stream_falls_back_to_v1(make_site):
+    async def scenario():
+        async with StandIn() as stand_in:
+            site = streaming_site(make_site, stand_in.url, stale_seconds=0.2)
+            site.start_streams()
+            try:
+                await wait_for(lambda: site.stream_driven)
+                assert (await site.fetch_p1_data())['active_power_w'] == -250
+                assert site.p1_client.calls == 0
+
+                stand_in.sending = False
+                await wait_for(lambda: not site.stream_driven)
+                assert (await site.fetch_p1_data())['active_power_w'] == 999
+                assert site.p1_client.calls == 1
+            finally:
+                await stop_site_streams(site)
+    asyncio.run(scenario())
@@ -0,0 +1,32 @@
+import time
+
+from app.outbox import PVOutputOutbox
+
+def test_status_for_same_slot_replaces_previous(tmp_path):
+    outbox = PVOutputOutbox(str(tmp_path / 'outbox.db'))
+    outbox.put({'d': '20261017', 't': '10:00', 'v2': 100})
+    outbox.put({'d': '20261017', 't': '10:05', 'v2': 200})
+    outbox.put({'d': '20261017', 't': '10:00', 'v2': 150})
+
+    assert len(outbox) == 2
+    assert outbox.due() == [
+        {'d': '20261017', 't': '10:00', 'v2': 150},
+        {'d': '20261017', 't': '10:05', 'v2': 200},
+    ]
+
+def test_failed_status_waits_for_backoff(tmp_path):
+    outbox = PVOutputOutbox(str(tmp_path / 'outbox.db'), base_delay=60)
+    outbox.put({'d': '20261017', 't': '10:00'})
+    outbox.mark_failed([('20261017', '10:00')])
+
+    assert len(outbox) == 1
+    assert outbox.due() == []
+    next_attempt = outbox._conn.execute("SELECT next_attempt FROM outbox").fetchone()[0]
+    assert 50 < next_attempt - time.time() <= 60
+
+def test_replacing_status_resets_backoff(tmp_path):
+    outbox = PVOutputOutbox(str(tmp_path / 'outbox.db'))
+    outbox.put({'d': '20261017', 't': '10:00', 'v2': 1})
+    outbox.mark_failed([('20261017', '10:00')])
+    outbox.put({'d': '20261017', 't': '10:00', 'v2': 2})
+    assert outbox.due() == [{'d': '20261017', 't': '10:00', 'v2': 2}]
@@ -0,0 +1,110 @@
+import asyncio
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from app import pvoutput
+from app.outbox import PVOutputOutbox
+from app.pvoutput import PVOutputClient, PVOutputDataConverter, PVOutputUploader
+
+def test_convert_uses_interval_averages_for_power():
+    summary = {'sample_count': 30, 'avg_generation_w': 1234.4, 'avg_consumption_w': 456.6}
+    result = PVOutputDataConverter.convert_to_pvoutput(
+        {'active_power_w': -2000}, {'active_power_w': 3000}, interval_summary=summary
+    )
+    assert result['power_generation'] == 1234
+    assert result['power_consumption'] == 457
+
+def test_convert_without_kwh_samples_omits_generation():
+    # Omvormer offline: de laatste kWh meting is van uren geleden en mag niet opnieuw geüpload worden
+    summary = {'sample_count': 3, 'avg_grid_power_w': 300.0, 'avg_consumption_w': 300.0}
+    result = PVOutputDataConverter.convert_to_pvoutput(
+        {'active_power_w': 300}, {'active_power_w': 2500}, interval_summary=summary
+    )
+    assert 'power_generation' not in result
+    assert result['power_consumption'] == 300
+
+def test_convert_without_summary_uses_latest_reading():
+    result = PVOutputDataConverter.convert_to_pvoutput({'active_power_w': -500}, {'active_power_w': 1500})
+    assert result['power_generation'] == 1500
+    assert result['power_consumption'] == 1000
+
+class FakePVOutput:
+    """Stand-in voor de PVOutput API via een httpx MockTransport"""
+
+    def __init__(self, invalid=(), offline=False):
+        self.invalid = set(invalid)  # (d, t) slots die PVOutput weigert (bijv. te oud)
+        self.offline = offline
+        self.requests = []  # (endpoint, aantal statussen)
+        self.added = []
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        if self.offline:
+            raise httpx.ConnectError("offline", request=request)
+        endpoint = request.url.path.rsplit('/', 1)[-1]
+        form = parse_qs(request.content.decode())
+        if endpoint == 'addbatchstatus.jsp':
+            slots = [tuple(entry.split(',')[:2]) for entry in form['data'][0].split(';')]
+        else:
+            slots = [(form['d'][0], form['t'][0])]
+        self.requests.append((endpoint, len(slots)))
+
+        if self.invalid & set(slots):
+            return httpx.Response(400, text="Bad request 400: Date is older than 14 days")
+        self.added.extend(slots)
+        if endpoint == 'addbatchstatus.jsp':
+            return httpx.Response(200, text=';'.join(f"{d},{t},1" for d, t in slots))
+        return httpx.Response(200, text="OK 200: Added Status")
+
+@pytest.fixture
+def fake_pvoutput(monkeypatch):
+    """Laat de PVOutput client tegen een FakePVOutput praten in plaats van pvoutput.org"""
+    fake = FakePVOutput()
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        pvoutput.httpx, 'AsyncClient',
+        lambda **kwargs: real_client(transport=httpx.MockTransport(fake.handler), **kwargs)
+    )
+    return fake
+
+def make_uploader(tmp_path, statuses: int, batch_size: int = 30) -> PVOutputUploader:
+    outbox = PVOutputOutbox(str(tmp_path / 'outbox.db'))
+    for i in range(statuses):
+        outbox.put({'d': '20261017', 't': f'{8 + i // 12:02d}:{i % 12 * 5:02d}', 'v2': i})
+    return PVOutputUploader(PVOutputClient('key', '1'), outbox, batch_size)
+
+def test_flush_sends_backlog_in_batches(tmp_path, fake_pvoutput):
+    uploader = make_uploader(tmp_path, 40)
+
+    assert asyncio.run(uploader.flush()) == 40
+    assert fake_pvoutput.requests == [('addbatchstatus.jsp', 30), ('addbatchstatus.jsp', 10)]
+    assert len(uploader.outbox) == 0
+
+def test_single_status_uses_addstatus(tmp_path, fake_pvoutput):
+    uploader = make_uploader(tmp_path, 1)
+
+    assert asyncio.run(uploader.flush()) == 1
+    assert fake_pvoutput.requests == [('addstatus.jsp', 1)]
+
+def test_rejected_batch_drops_only_invalid_status(tmp_path, fake_pvoutput):
+    fake_pvoutput.invalid = {('20261017', '09:35')}
+    uploader = make_uploader(tmp_path, 40)
+
+    assert asyncio.run(uploader.flush()) == 39
+    assert ('20261017', '09:35') not in fake_pvoutput.added
+    assert len(set(fake_pvoutput.added)) == 39
+    assert len(uploader.outbox) == 0
+    # Alleen de ongeldige status is los verstuurd en geweigerd
+    assert ('addstatus.jsp', 1) in fake_pvoutput.requests
+
+def test_network_failure_keeps_statuses(tmp_path, fake_pvoutput):
+    fake_pvoutput.offline = True
+    uploader = make_uploader(tmp_path, 5)
+
+    assert asyncio.run(uploader.flush()) == 0
+    assert len(uploader.outbox) == 5
+    # Gemarkeerd als mislukt: pas na de backoff weer aan de beurt
+    assert uploader.outbox.due() == []
+    attempts = uploader.outbox._conn.execute("SELECT DISTINCT attempts FROM outbox").fetchall()
+    assert attempts == [(1,)]
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+def fill_history(site, hours: float, step: float = 10):
+    """Vul de historie zoals na het herstellen van een snapshot: hours uur aan samples tot nu"""
+    now = time.time()
+    count = int(hours * 3600 / step)
+    for i in range(count):
+        timestamp = now - (count - i) * step
+        # De oude historie heeft een veel hoger vermogen dan het laatste interval
+        power = 100.0 if timestamp > now - 300 else 4000.0
+        site.data_manager.p1_history.append(timestamp, {'active_power_w': -power})
+        site.data_manager.kwh_history.append(timestamp, {'active_power_w': power})
+
+def test_interval_start_without_previous_upload_is_one_interval(make_site):
+    site = make_site()
+    start = site.interval_start()
+    assert abs((datetime.now() - start).total_seconds() - 300) < 1
+
+def test_interval_start_is_clamped_to_update_interval(make_site):
+    site = make_site()
+    site.last_upload_time = datetime.now() - timedelta(hours=5)
+    assert (datetime.now() - site.interval_start()).total_seconds() <= 301
+
+    recent = datetime.now() - timedelta(seconds=60)
+    site.last_upload_time = recent
+    assert site.interval_start() == recent
+
+def test_first_upload_after_restart_averages_only_last_interval(make_site):
+    # Na een herstart met de historie uit de snapshot is er nog geen vorige upload
+    site = make_site()
+    fill_history(site, hours=22)
+    assert len(site.data_manager.kwh_history) > 7000
+
+    summary = site.data_manager.get_interval_summary(site.interval_start())
+    assert summary['sample_count'] <= 31
+    assert summary['avg_generation_w'] == 100.0
+
+def test_snapshot_restores_upload_interval_start(make_site):
+    site = make_site()
+    fill_history(site, hours=1)
+    site.last_upload_time = datetime.now() - timedelta(seconds=120)
+    state = site.snapshot_state()
+
+    restored = make_site()
+    restored.restore_snapshot(state)
+    assert restored.last_upload_time == site.last_upload_time
+    assert len(restored.data_manager.kwh_history) == len(site.data_manager.kwh_history)
+
+def test_snapshot_upload_interval_start_is_clamped(make_site):
+    # Snapshot van lang geleden: het interval begint niet voor now - update_interval
+    site = make_site()
+    fill_history(site, hours=22)
+    site.last_upload_time = datetime.now() - timedelta(hours=6)
+
+    restored = make_site()
+    restored.restore_snapshot(site.snapshot_state())
+    assert (datetime.now() - restored.last_upload_time).total_seconds() <= 301
+    summary = restored.data_manager.get_interval_summary(restored.interval_start())
+    assert summary['avg_generation_w'] == 100.0
+
+class FakeClient:
+    def __init__(self, data):
+        self.data = data
+
+    async def get_data(self):
+        return dict(self.data)
+
+def test_hot_responses_are_encoded_at_ingest(make_site):
+    site = make_site(
+        homewizard_p1={'host': 'p1.local', 'enabled': True},
+        homewizard_kwh_meters=[{'name': 'Omvormer', 'host': 'kwh.local', 'enabled': True}]
+    )
+    site.p1_client = FakeClient({'active_power_w': -400, 'total_power_import_kwh': 10.0, 'total_power_export_kwh': 5.0})
+    site.kwh_clients['kwh.local'] = FakeClient({'active_power_w': 1200, 'total_power_export_kwh': 20.0})
+
+    asyncio.run(site.collect_data())
+
+    data_manager = site.data_manager
+    for name in ('latest', 'daily', 'statistics'):
+        version, encoded = data_manager._memo[f'{name}:json']
+        assert version == data_manager.version
+        assert site.encoded(name) is encoded
+    latest = json.loads(site.encoded('latest'))
+    assert latest['p1']['active_power_w'] == -400
+    assert b'_timestamp' not in site.encoded('latest')
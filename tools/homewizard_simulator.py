@@ -0,0 +1,400 @@
+"""
+Simulator van HomeWizard apparaten (P1 meter en kWh meters)
+
+Start per apparaat een kleine HTTP server (HTTP/1.1 met keep-alive) die
+/api, /api/v1 en /api/v1/data beantwoordt zoals een echt apparaat. Alle
+apparaten delen één gesimuleerde installatie: de kWh meters volgen een
+zonnecurve met wolken, de P1 meter toont verbruik min de totale opwekking.
+Meterstanden lopen monotoon op. Latency, jitter en storingen zijn
+instelbaar, zodat de applicatie zonder echte hardware op schaal getest
+kan worden.
+
+Gebruik (vanuit de root van de repository):
+
+    python -m tools.homewizard_simulator --kwh-meters 200 --base-port 9000
+    python -m tools.homewizard_simulator --kwh-meters 5 --write-config config/config.yaml
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import yaml
+
+class SimulatedSite:
+    """
+    Gedeelde toestand van de gesimuleerde installatie
+
+    De gesimuleerde tijd kan versneld lopen (speed), zodat een hele dag
+    zonnecurve in een paar minuten doorlopen kan worden.
+    """
+
+    def __init__(self, speed: float = 1.0, seed: Optional[int] = None):
+        self.speed = speed
+        self.random = random.Random(seed)
+        self._started = time.time()
+        self._cloud = 1.0
+        self._cloud_at = self.now()
+        self.kwh_meters: List['SimulatedDevice'] = []
+
+    def now(self) -> float:
+        """Gesimuleerde tijd (epoch seconden)"""
+        return self._started + (time.time() - self._started) * self.speed
+
+    def solar_factor(self, timestamp: float) -> float:
+        """Fractie van het piekvermogen: sinus tussen zonsopkomst en -ondergang, met wolken"""
+        moment = datetime.fromtimestamp(timestamp)
+        hour = moment.hour + moment.minute / 60 + moment.second / 3600
+        sunrise, sunset = 6.5, 20.5
+        if not sunrise <= hour <= sunset:
+            return 0.0
+
+        # Wolken als random walk tussen 0.2 en 1.0, begrensd in tempo
+        elapsed = max(0.0, timestamp - self._cloud_at)
+        if elapsed > 0:
+            step = self.random.gauss(0, 0.05 * math.sqrt(elapsed / 60))
+            self._cloud = min(1.0, max(0.2, self._cloud + step))
+            self._cloud_at = timestamp
+
+        return math.sin(math.pi * (hour - sunrise) / (sunset - sunrise)) ** 1.5 * self._cloud
+
+    def consumption(self, timestamp: float) -> float:
+        """Huishoudelijk verbruik in W: basislast, ochtend- en avondpiek en losse apparaten"""
+        moment = datetime.fromtimestamp(timestamp)
+        hour = moment.hour + moment.minute / 60
+        load = 180.0
+        load += 600 * math.exp(-((hour - 7.5) ** 2) / 0.8)
+        load += 1200 * math.exp(-((hour - 18.5) ** 2) / 2.0)
+        if self.random.random() < 0.05:
+            load += self.random.choice((800, 1500, 2200))  # Waterkoker, wasmachine, oven
+        return load + self.random.gauss(0, 25)
+
+    def total_generation(self, timestamp: float) -> float:
+        return sum(meter.power(timestamp) for meter in self.kwh_meters)
+
+class SimulatedDevice:
+    """Eén gesimuleerd HomeWizard apparaat met oplopende meterstanden"""
+
+    def __init__(
+        self,
+        site: SimulatedSite,
+        kind: str,
+        index: int = 0,
+        peak_w: float = 3000,
+        latency: float = 0.02,
+        jitter: float = 0.03,
+        failure_rate: float = 0.0,
+        failure_mode: str = 'mixed'
+    ):
+        self.site = site
+        self.kind = kind
+        self.index = index
+        self.peak_w = peak_w
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.serial = f"5c2fa{index:07x}" if kind == 'kwh' else "5c2faf000001"
+        self.requests = 0
+        self.failures = 0
+
+        # Meterstanden in kWh, bijgewerkt bij elke uitlezing
+        self.import_kwh = 1000.0 + index * 10 if kind == 'kwh' else 12000.0
+        self.export_kwh = 4000.0 + index * 150 if kind == 'kwh' else 7000.0
+        self._counted_at = site.now()
+
+        if kind == 'kwh':
+            site.kwh_meters.append(self)
+
+    def power(self, timestamp: float) -> float:
+        """Actueel vermogen in W (kWh meter: opwekking, P1: import positief / export negatief)"""
+        if self.kind == 'kwh':
+            return self.peak_w * self.site.solar_factor(timestamp)
+        return self.site.consumption(timestamp) - self.site.total_generation(timestamp)
+
+    def data(self) -> Dict:
+        """Antwoord van /api/v1/data"""
+        now = self.site.now()
+        power = round(self.power(now))
+
+        # Integreer het vermogen sinds de vorige uitlezing in de meterstanden
+        hours = max(0.0, now - self._counted_at) / 3600
+        self._counted_at = now
+        if self.kind == 'kwh' or power < 0:
+            self.export_kwh += abs(power) * hours / 1000
+        else:
+            self.import_kwh += power * hours / 1000
+
+        if self.kind == 'kwh':
+            voltage = round(230 + self.site.random.gauss(0, 1.5), 1)
+            return {
+                'wifi_ssid': 'simulator',
+                'wifi_strength': 80,
+                'total_power_import_kwh': round(self.import_kwh, 3),
+                'total_power_import_t1_kwh': round(self.import_kwh, 3),
+                'total_power_export_kwh': round(self.export_kwh, 3),
+                'total_power_export_t1_kwh': round(self.export_kwh, 3),
+                'active_power_w': power,
+                'active_power_l1_w': power,
+                'active_voltage_v': voltage,
+                'active_current_a': round(power / voltage, 3),
+                'active_frequency_hz': 50.0
+            }
+
+        phases = [round(power * share) for share in (0.5, 0.3, 0.2)]
+        voltages = [round(230 + self.site.random.gauss(0, 1.5), 1) for _ in range(3)]
+        return {
+            'wifi_ssid': 'simulator',
+            'wifi_strength': 80,
+            'smr_version': 50,
+            'meter_model': 'Simulator',
+            'unique_id': self.serial,
+            'active_tariff': 2 if 7 <= datetime.fromtimestamp(now).hour < 23 else 1,
+            'total_power_import_kwh': round(self.import_kwh, 3),
+            'total_power_import_t1_kwh': round(self.import_kwh * 0.45, 3),
+            'total_power_import_t2_kwh': round(self.import_kwh * 0.55, 3),
+            'total_power_export_kwh': round(self.export_kwh, 3),
+            'total_power_export_t1_kwh': round(self.export_kwh * 0.3, 3),
+            'total_power_export_t2_kwh': round(self.export_kwh * 0.7, 3),
+            'active_power_w': power,
+            'active_power_l1_w': phases[0],
+            'active_power_l2_w': phases[1],
+            'active_power_l3_w': phases[2],
+            'active_voltage_l1_v': voltages[0],
+            'active_voltage_l2_v': voltages[1],
+            'active_voltage_l3_v': voltages[2],
+            'any_power_fail_count': 2,
+            'long_power_fail_count': 1
+        }
+
+    def info(self) -> Dict:
+        """Antwoord van /api"""
+        product_type, product_name = ('HWE-SKT', 'kWh meter') if self.kind == 'kwh' else ('HWE-P1', 'P1 meter')
+        return {
+            'product_type': product_type,
+            'product_name': product_name,
+            'serial': self.serial,
+            'firmware_version': '5.18',
+            'api_version': 'v1'
+        }
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Verwerk requests op één verbinding (keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                method, path = (parts[0], parts[1]) if len(parts) >= 2 else ('', '')
+                keep_alive = headers.get('connection', '').lower() != 'close'
+
+                self.requests += 1
+                await asyncio.sleep(self.latency + self.site.random.uniform(0, self.jitter))
+
+                if self.site.random.random() < self.failure_rate:
+                    self.failures += 1
+                    mode = self.failure_mode
+                    if mode == 'mixed':
+                        mode = self.site.random.choice(('error', 'drop', 'hang'))
+                    if mode == 'drop':
+                        break
+                    if mode == 'hang':
+                        await asyncio.sleep(3600)
+                        break
+                    status, body = 503, {'error': {'id': 'service:unavailable', 'description': 'Simulated failure'}}
+                elif method != 'GET':
+                    status, body = 405, {'error': {'id': 'request:method-not-allowed'}}
+                elif path.rstrip('/') in ('/api', '/api/v1'):
+                    status, body = 200, self.info()
+                elif path == '/api/v1/data':
+                    status, body = 200, self.data()
+                else:
+                    status, body = 404, {'error': {'id': 'request:not-found'}}
+
+                payload = json.dumps(body).encode()
+                reason = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed', 503: 'Service Unavailable'}[status]
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+class Simulator:
+    """Een set gesimuleerde apparaten, elk op een eigen poort"""
+
+    def __init__(
+        self,
+        kwh_meters: int = 1,
+        p1: bool = True,
+        host: str = '127.0.0.1',
+        base_port: int = 0,
+        speed: float = 1.0,
+        seed: Optional[int] = None,
+        **device_options
+    ):
+        """
+        Args:
+            kwh_meters: Aantal kWh meters
+            p1: Of er een P1 meter gesimuleerd wordt
+            host: Adres waarop de servers luisteren
+            base_port: Eerste poort (P1 meter), kWh meters volgen oplopend;
+                0 = willekeurige vrije poorten
+            speed: Versnelling van de gesimuleerde tijd
+            seed: Seed voor reproduceerbare curves
+            **device_options: latency, jitter, failure_rate, failure_mode
+        """
+        self.host = host
+        self.base_port = base_port
+        self.site = SimulatedSite(speed=speed, seed=seed)
+        self.p1 = SimulatedDevice(self.site, 'p1', **device_options) if p1 else None
+        self.kwh = [
+            SimulatedDevice(
+                self.site, 'kwh', index=index,
+                peak_w=self.site.random.uniform(1500, 4500),
+                **device_options
+            )
+            for index in range(kwh_meters)
+        ]
+        self.addresses: Dict[SimulatedDevice, str] = {}
+        self._servers: List[asyncio.AbstractServer] = []
+
+    @property
+    def devices(self) -> List[SimulatedDevice]:
+        return ([self.p1] if self.p1 else []) + self.kwh
+
+    async def start(self):
+        """Start een server per apparaat"""
+        for offset, device in enumerate(self.devices):
+            port = self.base_port + offset if self.base_port else 0
+            server = await asyncio.start_server(device.handle, self.host, port)
+            self._servers.append(server)
+            self.addresses[device] = f"{self.host}:{server.sockets[0].getsockname()[1]}"
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers = []
+
+    def config_section(self) -> Dict:
+        """Config entries die de applicatie naar de gesimuleerde apparaten laten wijzen"""
+        section = {
+            'homewizard_kwh_meters': [
+                {'name': f"Sim omvormer {device.index + 1}", 'host': self.addresses[device], 'enabled': True}
+                for device in self.kwh
+            ]
+        }
+        if self.p1:
+            section['homewizard_p1'] = {'host': self.addresses[self.p1], 'enabled': True}
+        else:
+            section['homewizard_p1'] = {'host': '', 'enabled': False}
+        return section
+
+    def stats(self) -> Dict:
+        return {
+            'requests': sum(device.requests for device in self.devices),
+            'failures': sum(device.failures for device in self.devices)
+        }
+
+def write_config(path: str, section: Dict):
+    """Werk de apparaten in een config bestand bij (overige instellingen blijven staan)"""
+    try:
+        with open(path) as f:
+            data = yaml.safe_load(f) or {}
+    except FileNotFoundError:
+        data = {}
+    data.update(section)
+    with open(path, 'w') as f:
+        yaml.dump(data, f, default_flow_style=False)
+
+def add_device_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', type=float, default=0.02, help="Basis responstijd in seconden")
+    parser.add_argument('--jitter', type=float, default=0.03, help="Willekeurige extra responstijd in seconden")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Kans op een storing per request (0-1)")
+    parser.add_argument('--failure-mode', choices=('error', 'drop', 'hang', 'mixed'), default='mixed',
+                        help="Soort storing: 503, verbinding verbreken, niet antwoorden, of willekeurig")
+    parser.add_argument('--speed', type=float, default=1.0, help="Versnelling van de gesimuleerde tijd")
+    parser.add_argument('--seed', type=int, help="Seed voor reproduceerbare data")
+
+def device_options(args: argparse.Namespace) -> Dict:
+    return {
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'failure_rate': args.failure_rate,
+        'failure_mode': args.failure_mode
+    }
+
+async def run(args: argparse.Namespace):
+    simulator = Simulator(
+        kwh_meters=args.kwh_meters,
+        p1=not args.no_p1,
+        host=args.host,
+        base_port=args.base_port,
+        speed=args.speed,
+        seed=args.seed,
+        **device_options(args)
+    )
+    await simulator.start()
+
+    section = simulator.config_section()
+    if args.write_config:
+        write_config(args.write_config, section)
+        print(f"Config bijgewerkt: {args.write_config}")
+    if args.manifest:
+        with open(args.manifest, 'w') as f:
+            json.dump(section, f)
+
+    print(f"{len(simulator.devices)} gesimuleerde apparaten actief "
+          f"(P1: {section['homewizard_p1']['host'] or '-'}, "
+          f"kWh: {len(simulator.kwh)} meters)", flush=True)
+
+    try:
+        while True:
+            await asyncio.sleep(60)
+            stats = simulator.stats()
+            print(f"{stats['requests']} requests, {stats['failures']} gesimuleerde storingen", flush=True)
+    finally:
+        await simulator.stop()
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Simulator van HomeWizard P1 en kWh meters")
+    parser.add_argument('--kwh-meters', type=int, default=1, help="Aantal kWh meters")
+    parser.add_argument('--no-p1', action='store_true', help="Geen P1 meter simuleren")
+    parser.add_argument('--host', default='127.0.0.1', help="Adres om op te luisteren")
+    parser.add_argument('--base-port', type=int, default=0,
+                        help="Eerste poort (P1), kWh meters oplopend daarna; 0 = vrije poorten")
+    parser.add_argument('--write-config', help="Zet de gesimuleerde apparaten in dit config bestand")
+    parser.add_argument('--manifest', help="Schrijf de adressen als JSON naar dit bestand zodra alles luistert")
+    add_device_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Load driver: meet een collectie cyclus tegen gesimuleerde apparaten
+
+Start de simulator in een apart proces (zodat die niet meetelt), laat de
+configuratie van de applicatie naar de gesimuleerde apparaten wijzen en
+voert per aantal kWh meters een reeks cycli van collect_and_send_data()
+uit. Per aantal meters worden latency (p50/p95/max), CPU tijd per cyclus
+en geheugengebruik gerapporteerd, optioneel als JSON.
+
+Gebruik (vanuit de root van de repository):
+
+    python -m tools.load_driver --meters 1,10,50,100,250 --cycles 20
+    python -m tools.load_driver --meters 100 --failure-rate 0.05 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+from tools.homewizard_simulator import add_device_arguments
+
+def start_simulator(meters: int, args: argparse.Namespace) -> (subprocess.Popen, Dict):
+    """Start de simulator als subprocess en wacht tot alle apparaten luisteren"""
+    manifest = os.path.join(tempfile.mkdtemp(prefix='hw-sim-'), 'manifest.json')
+    command = [
+        sys.executable, '-m', 'tools.homewizard_simulator',
+        '--kwh-meters', str(meters),
+        '--manifest', manifest,
+        '--latency', str(args.latency),
+        '--jitter', str(args.jitter),
+        '--failure-rate', str(args.failure_rate),
+        '--failure-mode', args.failure_mode,
+        '--speed', str(args.speed)
+    ]
+    if args.seed is not None:
+        command += ['--seed', str(args.seed)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while not os.path.exists(manifest):
+        if process.poll() is not None or time.time() > deadline:
+            process.kill()
+            raise RuntimeError("Simulator kon niet gestart worden")
+        time.sleep(0.05)
+    time.sleep(0.05)  # Laat het schrijven van het manifest afronden
+    with open(manifest) as f:
+        return process, json.load(f)
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+async def measure_cycles(main, meters: int, cycles: int, interval: float) -> Dict:
+    """Voer cycli uit en meet latency, CPU en geheugen"""
+    site = main.default_site
+    site.http_client = main.create_http_client(
+        device_count=meters + 1,
+        keepalive_per_host=main.config.homewizard_keepalive_per_host,
+        keepalive_expiry=main.config.homewizard_keepalive_expiry
+    )
+    site.p1_client = None
+    site.kwh_clients = {}
+    site.last_kwh_readings.clear()
+
+    latencies = []
+    cpu_times = []
+    try:
+        # Eerste cyclus bouwt verbindingen op, die telt niet mee
+        await site.collect_and_send_data()
+
+        for _ in range(cycles):
+            started = time.perf_counter()
+            cpu_started = time.process_time()
+            await site.collect_and_send_data()
+            latencies.append(time.perf_counter() - started)
+            cpu_times.append(time.process_time() - cpu_started)
+            if interval:
+                await asyncio.sleep(interval)
+
+        # Allocaties in een aparte cyclus: tracemalloc vertraagt alles sterk
+        tracemalloc.start()
+        try:
+            base_memory, _ = tracemalloc.get_traced_memory()
+            await site.collect_and_send_data()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        await site.http_client.aclose()
+
+    return {
+        'meters': meters,
+        'cycles': cycles,
+        'latency_p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'latency_max_ms': round(max(latencies) * 1000, 2),
+        'cpu_per_cycle_ms': round(statistics.mean(cpu_times) * 1000, 2),
+        'cycle_peak_alloc_kb': round((peak_memory - base_memory) / 1024, 1),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'kwh_meters_reported': site.data_manager.latest_kwh_data.get('meter_count', 0)
+    }
+
+async def run(args: argparse.Namespace) -> List[Dict]:
+    # Importeer de applicatie pas hier, zodat --help werkt zonder config
+    from app import main
+
+    # Alleen verzamelen: geen PVOutput, weather of persistente opslag
+    main.config.data['pvoutput'] = {'api_key': '', 'system_id': ''}
+    main.config.data.setdefault('weather', {})['enabled'] = False
+    main.config.data['cycle_deadline'] = args.deadline
+
+    results = []
+    for meters in args.meters:
+        process, section = start_simulator(meters, args)
+        try:
+            main.config.data.update(section)
+            result = await measure_cycles(main, meters, args.cycles, args.interval)
+        finally:
+            process.terminate()
+            process.wait()
+
+        results.append(result)
+        print(
+            f"{meters:>5} meters: p50 {result['latency_p50_ms']:>8.1f} ms, "
+            f"p95 {result['latency_p95_ms']:>8.1f} ms, max {result['latency_max_ms']:>8.1f} ms, "
+            f"CPU {result['cpu_per_cycle_ms']:>7.1f} ms/cyclus, "
+            f"alloc {result['cycle_peak_alloc_kb']:>8.1f} KB, RSS {result['max_rss_mb']:>6.1f} MB, "
+            f"{result['kwh_meters_reported']} meters met data",
+            flush=True
+        )
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Meet collectie cycli tegen gesimuleerde HomeWizard apparaten")
+    parser.add_argument('--meters', default='1,10,50,100',
+                        help="Aantallen kWh meters om te meten, bijvoorbeeld 1,10,100,250")
+    parser.add_argument('--cycles', type=int, default=10, help="Aantal gemeten cycli per aantal meters")
+    parser.add_argument('--interval', type=float, default=0.0, help="Pauze tussen cycli in seconden")
+    parser.add_argument('--deadline', type=float, default=15, help="Deadline per cyclus (cycle_deadline)")
+    parser.add_argument('--output', help="Schrijf resultaten als JSON naar dit bestand")
+    add_device_arguments(parser)
+    args = parser.parse_args(argv)
+    args.meters = [int(count) for count in args.meters.split(',')]
+
+    results = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}, f, indent=2)
+        print(f"Resultaten opgeslagen in {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())